@@ -50,6 +50,16 @@ void setupMotors() {
   }
 }
 
+void setClampedGoal(int target_id, int32_t target_pos) {
+  if (target_id == 1) {
+    target_pos = constrain(target_pos, 3000, 4300);
+  } else if (target_id == 2) {
+    target_pos = constrain(target_pos, 3000, 6900);
+  }
+
+  dxl.setGoalPosition(target_id, target_pos);
+}
+
 void mqttCallback(char* topic, byte* payload, unsigned int length) {
   char message[length + 1];
   memcpy(message, payload, length);
@@ -63,6 +73,15 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
     return;
   }
 
+  // {"goals": {"1": 3500, "2": 4000}}: both motors at once (myo_controller, comm_bridge)
+  JsonObject goals = doc["goals"];
+  if (!goals.isNull()) {
+    for (JsonPair goal : goals) {
+      setClampedGoal(atoi(goal.key().c_str()), goal.value().as<int32_t>());
+    }
+    return;
+  }
+
   int target_id = doc["id"];
   const char* mode = doc["mode"] | "move";
   
@@ -75,14 +94,7 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
   }
 
   int32_t target_pos = doc["position"];
-
-  if (target_id == 1) {
-    target_pos = constrain(target_pos, 3000, 4300);
-  } else if (target_id == 2) {
-    target_pos = constrain(target_pos, 3000, 6900);
-  }
-
-  dxl.setGoalPosition(target_id, target_pos);
+  setClampedGoal(target_id, target_pos);
 }
 
 void setup() {
@@ -297,6 +297,39 @@ export default function DataSidebar({ data }) {
         </div>
       </section>
 
+      {data.latency?.stages && (
+        <section className="card">
+          <h3 style={{ color: "#60a5fa", fontSize: "12px" }}>
+            INFERENCE LATENCY (ms)
+          </h3>
+          <table
+            style={{ width: "100%", fontSize: "10px", textAlign: "right" }}
+          >
+            <thead>
+              <tr style={{ color: "#64748b" }}>
+                <th style={{ textAlign: "left" }}>Stage</th>
+                <th>p50</th>
+                <th>p95</th>
+                <th>p99</th>
+              </tr>
+            </thead>
+            <tbody>
+              {Object.entries(data.latency.stages).map(([stage, s]) => (
+                <tr key={stage}>
+                  <td style={{ textAlign: "left" }}>{stage}</td>
+                  <td>{s.n ? s.p50.toFixed(2) : "-"}</td>
+                  <td>{s.n ? s.p95.toFixed(2) : "-"}</td>
+                  <td>{s.n ? s.p99.toFixed(2) : "-"}</td>
+                </tr>
+              ))}
+            </tbody>
+          </table>
+          <div style={{ fontSize: "10px", color: "#64748b", marginTop: "4px" }}>
+            Dropped samples: {data.latency.dropped ?? 0}
+          </div>
+        </section>
+      )}
+
       <section
         className="card"
         style={{ flex: 1, display: "flex", flexDirection: "column" }}
@@ -24,11 +24,10 @@ from matplotlib.lines import Line2D
 from sklearn.decomposition import PCA
 from scipy.spatial.distance import cdist
 
+from emg_features import extract_windows
+
 DATA_DIR     = "data_collection"
 STEADY_SAMPLES = 800          # 4s × 200Hz
-WINDOW_SIZE  = 40            # 0.2s window
-STRIDE       = 20             # 50% overlap
-WAMP_THRESH  = 10.0           # Willison amplitude threshold
 
 CLASSES = [
     "cylindrical forward",
@@ -56,34 +55,12 @@ GROUPS = ["cylindrical", "lateral", "palm", "rest"]
 
 # ── Feature extraction ────────────────────────────────────────────────────────
 
-def extract_features(window):
-    '''
-    window: (W, 8) array of rectified EMG samples
-    returns: (48,) feature vector
-    '''
-    diff = np.diff(window, axis=0)          # (W-1, 8)
-    diff2 = np.diff(diff, axis=0)           # (W-2, 8)  slope differences
-
-    mav  = window.mean(axis=0)
-    rms  = np.sqrt((window ** 2).mean(axis=0))
-    var  = window.var(axis=0)
-    wl   = np.abs(diff).sum(axis=0)
-    ssc  = (np.diff(np.sign(diff), axis=0) != 0).sum(axis=0).astype(np.float32)
-    wamp = (np.abs(diff) > WAMP_THRESH).sum(axis=0).astype(np.float32)
-
-    return np.concatenate([mav, rms, var, wl, ssc, wamp])
-
-
 def extract_all_windows(data):
     '''
     data: (N_samples, 8) flat array for one class
     Returns: (N_windows, 48) feature matrix
     '''
-    windows = []
-    for start in range(0, len(data) - WINDOW_SIZE + 1, STRIDE):
-        w = data[start:start + WINDOW_SIZE]
-        windows.append(extract_features(w))
-    return np.array(windows, dtype=np.float32)
+    return extract_windows(data.astype(np.float32, copy=False))
 
 
 # ── Load ──────────────────────────────────────────────────────────────────────
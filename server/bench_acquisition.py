@@ -0,0 +1,102 @@
+'''
+Acquisition Jitter Benchmark — reader thread vs reader process
+
+Runs the synthetic 200 Hz source (emg_source.py) the way run_inference does
+and a consumer that, every STRIDE samples, runs an artificially heavy
+"model" — pure Python that holds the GIL for HEAVY_MS. Measures when each
+sample actually reached the ring (arrival stamp) compared to the 5 ms
+cadence of the source:
+
+  thread  — source in a daemon thread, SampleRing (the default)
+  process — source in its own process, SharedSampleRing (run_inference --process)
+
+A reader starved of the GIL wakes late and hands over its backlog in one
+burst, so the arrival intervals collapse to ~0 and then jump. Reported:
+interval p50/p99/max, share of intervals over 2× nominal (late) and under
+0.5 ms (burst), and samples lost (ring overflow / sequence gaps).
+
+Run: python bench_acquisition.py
+'''
+
+import threading
+import time
+
+import numpy as np
+
+from decision_filter import STRIDE
+from emg_ring import SampleRing, SharedSampleRing
+from emg_source import run_source, start_acquisition_process
+
+SOURCE   = 'synthetic:grip=palm'
+RATE     = 200
+HEAVY_MS = 60.0    # GIL-holding model time per call
+DURATION = 10.0    # seconds per mode
+
+
+def _heavy(ms):
+    '''Burn ms of CPU in pure Python without releasing the GIL.'''
+    end = time.perf_counter() + ms / 1000
+    x = 0
+    while time.perf_counter() < end:
+        for i in range(200):
+            x += i * i
+    return x
+
+
+def _consume(ring, heavy_ms):
+    sample = np.empty(8, dtype=np.float32)
+    stamps = []
+    end = time.perf_counter() + DURATION
+    while time.perf_counter() < end:
+        if not ring.get_into(sample, timeout=0.5):
+            continue
+        stamps.append(ring.last_stamp)
+        if heavy_ms and len(stamps) % STRIDE == 0:
+            _heavy(heavy_ms)
+    return np.array(stamps)
+
+
+def run_thread(heavy_ms):
+    ring = SampleRing(capacity=256)
+    stop = threading.Event()
+    t = threading.Thread(target=run_source, args=(SOURCE, ring.put, stop), daemon=True)
+    t.start()
+    time.sleep(0.5)
+    ring.clear()
+    stamps = _consume(ring, heavy_ms)
+    stop.set()
+    t.join(timeout=2)
+    return stamps, ring.dropped
+
+
+def run_process(heavy_ms):
+    ring = SharedSampleRing(capacity=256)
+    proc, stop = start_acquisition_process(SOURCE, ring)
+    time.sleep(0.5)
+    ring.clear()
+    try:
+        stamps = _consume(ring, heavy_ms)
+    finally:
+        stop.set()
+        proc.join(timeout=2)
+        dropped = ring.dropped
+        ring.unlink()
+    return stamps, dropped
+
+
+def _report(name, stamps, dropped):
+    dt = np.diff(stamps) * 1000
+    nominal = 1000 / RATE
+    p50, p99 = np.percentile(dt, [50, 99])
+    print(f'  {name:<16} {len(stamps):>6} {p50:>7.2f} {p99:>7.2f} {dt.max():>8.2f} '
+          f'{np.mean(dt > 2 * nominal):>7.1%} {np.mean(dt < 0.5):>7.1%} {dropped:>6}')
+
+
+if __name__ == '__main__':
+    print(f'── Arrival jitter ({SOURCE}, {DURATION:.0f}s each, model {HEAVY_MS:.0f}ms '
+          f'every {STRIDE} samples) ──')
+    print(f'  {"mode":<16} {"n":>6} {"p50 ms":>7} {"p99 ms":>7} {"max ms":>8} '
+          f'{"late":>7} {"burst":>7} {"lost":>6}')
+    _report('thread, idle', *run_thread(0))
+    _report('thread, heavy', *run_thread(HEAVY_MS))
+    _report('process, heavy', *run_process(HEAVY_MS))
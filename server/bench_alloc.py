@@ -0,0 +1,133 @@
+'''
+Hot-loop Allocation Benchmark
+
+Counts per-iteration allocations (tracemalloc) on the live inference path
+from Myo callback to feature vector, replaying a recorded trial:
+
+  new — SampleRing.put → get_into → StreamingCalibration.push → StreamingFeatures.push_raw
+        → features(out=) → RestGate.is_rest → StreamingCalibration.decide
+  old — queue.put(np.array) → get → np.abs / scale → deque → extract_features(np.array(buf))
+
+Each loop is compared against an empty loop measured the same way, so the
+reported bytes are what the pipeline itself allocates. Gen-0 GC collections
+triggered during the run are counted too — those are the latency spikes.
+numpy recycles small array buffers internally, so tracemalloc understates
+the old path; the new path must show zero on every counter and the script
+exits non-zero if it does not.
+
+Run: python bench_alloc.py
+'''
+
+import gc
+import itertools
+import queue
+import sys
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+from emg_calibration import StreamingCalibration
+from emg_features import FEATURE_DIM, STRIDE, WINDOW_SIZE, StreamingFeatures, extract_features
+from emg_ring import SampleRing
+from rest_gate import RestGate
+
+TRIAL_PATH = 'data_collection/palm_steady.npy'
+LOOP_LEN   = 1000     # samples replayed in a loop (itertools.cycle stops growing after one pass)
+WARMUP     = 5000     # iterations before measuring (fills windows, ring, first resync)
+ITERATIONS = 20000
+
+# ── Pipelines ─────────────────────────────────────────────────────────────────
+
+def _new_path(samples, scale):
+    ring    = SampleRing()
+    calib   = StreamingCalibration(calib_samples=1)
+    gate    = RestGate(np.full(8, 1.5), np.full(8, 2.0))
+    stream  = StreamingFeatures()
+    stream.set_scale(scale)
+    sample  = np.empty(8, dtype=np.float32)
+    features = np.empty((1, FEATURE_DIM), dtype=np.float32)
+    row     = features[0]
+    src     = itertools.cycle(samples)
+    state   = [0]
+
+    def step():
+        ring.put(next(src))                  # Myo callback
+        ring.get_into(sample, 0.5)           # consumer
+        calib.push(sample)
+        stream.push_raw(sample)
+        state[0] += 1
+        if state[0] == STRIDE:
+            state[0] = 0
+            stream.features(out=row)
+            gate.is_rest(row)
+            calib.decide(True, 0.0)          # rest: merge, no update due
+    return step
+
+
+def _old_path(samples, scale):
+    q     = queue.Queue()
+    buf   = deque(maxlen=WINDOW_SIZE)
+    src   = itertools.cycle(samples)
+    state = [0]
+
+    def step():
+        q.put(np.array(next(src), dtype=np.float32))
+        sample = q.get(timeout=0.5)
+        buf.append(np.abs(sample) / scale)
+        state[0] += 1
+        if state[0] == STRIDE and len(buf) == WINDOW_SIZE:
+            state[0] = 0
+            extract_features(np.array(buf)).reshape(1, -1)
+    return step
+
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+def _measure(step, n):
+    '''Bytes retained, peak bytes and gen-0 collections over n iterations.'''
+    gc.collect()                   # collect first: it drops caches the warm-up refills
+    for _ in itertools.repeat(None, WARMUP):
+        step()
+    collections = gc.get_stats()[0]['collections']
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    for _ in itertools.repeat(None, n):
+        step()
+    current, peak = tracemalloc.get_traced_memory()
+    return current - base, peak - base, gc.get_stats()[0]['collections'] - collections
+
+
+def count_allocations(step, n=ITERATIONS):
+    '''
+    Per-iteration allocation counter for a hot-loop body.
+    Returns (retained bytes / iteration, transient high-water bytes,
+    gen-0 GC collections), net of an empty loop measured the same way.
+    '''
+    src = itertools.cycle([None])
+    empty_retained, empty_peak, empty_gc = _measure(lambda: next(src), n)
+    retained, peak, n_gc = _measure(step, n)
+    return (max(retained - empty_retained, 0) / n,
+            max(peak - empty_peak, 0),
+            max(n_gc - empty_gc, 0))
+
+
+if __name__ == '__main__':
+    raw     = np.load(TRIAL_PATH)[:LOOP_LEN]
+    samples = [tuple(int(v) for v in row) for row in raw]   # what pyomyo hands the handler
+    scale   = np.maximum(raw.std(axis=0), 1.0).astype(np.float32)
+
+    tracemalloc.start()
+    print(f'── Allocations per sample ({ITERATIONS} samples, stride {STRIDE}) ──')
+    results = {}
+    for name, build in (('old', _old_path), ('new', _new_path)):
+        results[name] = count_allocations(build(samples, scale))
+        retained, peak, n_gc = results[name]
+        print(f'  {name}  retained {retained:6.1f} B/iter   high-water {peak:6d} B   '
+              f'gen-0 GCs {n_gc:4d}')
+    tracemalloc.stop()
+
+    if any(results['new']):
+        print('\n  [!] steady-state hot loop allocates')
+        sys.exit(1)
+    print('\n  [ok] steady-state hot loop allocates nothing')
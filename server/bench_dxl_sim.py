@@ -0,0 +1,200 @@
+'''
+Simulated Bus Benchmark
+
+motor_driver_json end to end without a U2D2: the driver talks to
+dxl_mock.MockPort with motion=True (Protocol 2.0 packets through the real
+dynamixel_sdk, 1 Mbps transfer times, XL430 motion under the configured
+profiles, injected comm errors). The driver's own setup_motors() puts the
+simulated motors in Extended Position mode with profile 300/50 and torque
+on, exactly as on hardware.
+
+  commands/s  — virtual time: myo_controller commands (one {"goals"}
+                motor/command) per second of bus/host time through the
+                driver's goal path (one sync write each) and the old per-motor
+                write4ByteTxRx path, and how many goals actually landed in
+                the control table, at each error rate
+  latency     — real time: grip changes published as myo_controller does
+                (GRIPS), through on_message and the bus owner, per command:
+                  publish → goal   both goals written to the bus
+                  motion           goal written → motor at rest on it
+                  publish → there  both motors at rest on their goals
+                  publish → seen   first motor/telemetry sample showing it
+                for profile 300/50 (setup_motors), 0/0 (fastest the motor
+                allows) and 300/50 with comm errors
+
+Exits non-zero if setup does not read back, the simulated motion is off
+the trapezoid model, or a command is lost on an error-free bus.
+
+Run: python bench_dxl_sim.py
+'''
+
+import itertools
+import json
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import motor_driver_json as driver
+from dxl_mock import MODE_EXTENDED_POSITION, MockPort, profile_time
+
+GRIPS = {'rest': (4300, 4000), 'palm': (3500, 4000),        # (m1, m2) as mapped in myo_controller.py
+         'cylindrical': (3000, 6400), 'lateral': (3500, 5000)}
+SEQUENCE     = ('cylindrical', 'lateral', 'palm', 'rest')   # cycled from rest: every step moves a motor
+ERROR_RATES  = (0.0, 0.01, 0.05)
+COMMANDS     = 2000      # per path and error rate (virtual time)
+N_GRIPS      = 8         # grip changes per latency scenario (real time)
+GRIP_HOLD    = 1.2       # seconds between grip changes (the longest move takes ~0.95 s)
+SCENARIOS    = (('profile 300/50', None, 0.0), ('profile 0/0', (0, 0), 0.0),
+                ('profile 300/50, 2% err', None, 0.02))      # (name, (velocity, acceleration) override, error rate)
+
+
+def _message(payload):
+    return SimpleNamespace(topic=driver.MQTT_TOPIC, payload=json.dumps(payload).encode())
+
+
+def sim_port(realtime=False, error_rate=0.0):
+    '''A simulated bus at the rest grip, set up by the driver's own setup_motors().'''
+    port = MockPort(driver.MOTOR_IDS, baudrate=driver.BAUDRATE, realtime=realtime, motion=True,
+                    initial_position=dict(zip(driver.MOTOR_IDS, GRIPS['rest'])))
+    driver.portHandler = port
+    driver.goal_writer, driver.position_reader, driver.error_reader = driver.sync_groups(port)
+    driver.last_goals.clear()
+    driver.setup_motors()
+    driver.move_motors(dict(zip(driver.MOTOR_IDS, GRIPS['rest'])))
+    port.error_rate = error_rate
+    return port
+
+
+# ── Setup and motion model ────────────────────────────────────────────────────
+
+def check_setup():
+    problems = []
+    port = sim_port()
+    for motor_id in driver.MOTOR_IDS:
+        regs = port.registers[motor_id]
+        if regs[driver.ADDR_OPERATING_MODE] != MODE_EXTENDED_POSITION or regs[driver.ADDR_TORQUE_ENABLE] != 1:
+            problems.append(f'motor {motor_id} not in Extended Position with torque on after setup_motors()')
+    start = port.now()
+    driver.move_motors({driver.DXL_ID_1: 3000, driver.DXL_ID_2: 6400})
+    port.advance(2.0)
+    if driver.read_positions() != {driver.DXL_ID_1: 3000, driver.DXL_ID_2: 6400}:
+        problems.append(f'motors did not reach 3000/6400: {driver.read_positions()}')
+    for motor_id, distance in ((driver.DXL_ID_1, 1300), (driver.DXL_ID_2, 2400)):
+        took = next(t for t, m, _ in port.arrivals if t >= start and m == motor_id) - start
+        expected = profile_time(distance, 300, 50)
+        print(f'  motor {motor_id}: {distance} ticks in {took * 1000:.0f} ms (trapezoid {expected * 1000:.0f} ms)')
+        if abs(took - expected) > 0.01:
+            problems.append(f'motor {motor_id} motion {took * 1000:.0f} ms, trapezoid {expected * 1000:.0f} ms')
+    return problems
+
+
+# ── Commands per second (virtual time) ────────────────────────────────────────
+
+def goal_path(port, m1, m2):
+    driver.move_motors({driver.DXL_ID_1: m1, driver.DXL_ID_2: m2})
+
+
+def txrx_path(port, m1, m2):
+    for motor_id, position in ((driver.DXL_ID_1, m1), (driver.DXL_ID_2, m2)):
+        driver.packetHandler.write4ByteTxRx(port, motor_id, driver.ADDR_GOAL_POSITION, position)
+
+
+def throughput(fn, error_rate):
+    port = sim_port(error_rate=error_rate)
+    port.reset_stats()
+    landed = 0
+    for k in range(COMMANDS):
+        m1, m2 = GRIPS[SEQUENCE[k % len(SEQUENCE)]]
+        m1, m2 = m1 + k % 7, m2 + k % 7                  # never the goal already in the register
+        fn(port, m1, m2)
+        regs = port.registers
+        landed += all(int.from_bytes(regs[m][driver.ADDR_GOAL_POSITION:driver.ADDR_GOAL_POSITION + 4], 'little') == g
+                      for m, g in ((driver.DXL_ID_1, m1), (driver.DXL_ID_2, m2)))
+    return COMMANDS / (port.host_us / 1e6), landed / COMMANDS, port.errors['timeout']
+
+
+# ── Command → position (real time) ────────────────────────────────────────────
+
+def latency_run(profile, error_rate):
+    port = sim_port(realtime=True)
+    if profile is not None:
+        for motor_id in driver.MOTOR_IDS:
+            driver.packetHandler.write4ByteTxRx(port, motor_id, driver.ADDR_PROFILE_VELOCITY, profile[0])
+            driver.packetHandler.write4ByteTxRx(port, motor_id, driver.ADDR_PROFILE_ACCELERATION, profile[1])
+    time.sleep(0.1)
+    port.error_rate = error_rate
+    driver.goal_slots = driver.GoalSlots()
+    owner = driver.bus_owner = driver.BusOwner(driver.goal_slots)
+    samples = []
+    owner.on_telemetry = lambda positions, moving, trace: samples.append((time.perf_counter(), positions))
+    owner.start()
+
+    commands, previous = [], GRIPS['rest']
+    for grip in itertools.islice(itertools.cycle(SEQUENCE), N_GRIPS):
+        goals = GRIPS[grip]
+        published = time.perf_counter()
+        driver.on_message(None, None, _message({'goals': dict(zip(driver.MOTOR_IDS, goals))}))    # as myo_controller
+        moved = {m: g for m, g, p in zip(driver.MOTOR_IDS, goals, previous) if g != p}
+        commands.append((published, moved, goals))
+        previous = goals
+        time.sleep(GRIP_HOLD)
+    alive = owner._worker.is_alive()
+    owner.stop()
+
+    rows, lost = [], 0
+    for published, moved, goals in commands:
+        written, there = [], []
+        for motor_id, goal in moved.items():
+            w = next((t for t, m, g in port.goal_log if t >= published and m == motor_id and g == goal), None)
+            a = next((t for t, m, g in port.arrivals if w is not None and t >= w and m == motor_id and g == goal), None)
+            written.append(w)
+            there.append(a)
+        if None in written or None in there:
+            lost += 1
+            continue
+        seen = next((t for t, positions in samples if t >= max(there) and
+                     all(abs(positions[m] - g) <= driver.GOAL_TOLERANCE for m, g in zip(driver.MOTOR_IDS, goals))),
+                    np.nan)
+        rows.append([max(written) - published, max(a - w for a, w in zip(there, written)),
+                     max(there) - published, seen - published])
+    return np.array(rows) * 1000, lost, alive, dict(port.errors)
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    print('── Setup and motion (setup_motors() on the simulated bus) ──────────')
+    problems = check_setup()
+    print()
+
+    print(f'── Commands/s, virtual time ({COMMANDS} commands, both goals each) ──────────')
+    print(f'  {"error rate":>10} {"path":<24} {"cmds/s":>8} {"landed":>8} {"timeouts":>9}')
+    for error_rate in ERROR_RATES:
+        for name, fn in (('sync write (driver)', goal_path), ('write4ByteTxRx per motor', txrx_path)):
+            rate, landed, timeouts = throughput(fn, error_rate)
+            print(f'  {error_rate:>10.0%} {name:<24} {rate:>8.0f} {landed:>8.1%} {timeouts:>9}')
+            if not error_rate and landed < 1:
+                problems.append(f'{name}: {1 - landed:.1%} of goals lost on an error-free bus')
+    print()
+
+    print(f'── Command → position, real time ({N_GRIPS} grip changes, bus owner, ms) ──────────')
+    print(f'  {"scenario":<24} {"publish→goal":>13} {"motion":>15} {"publish→there":>15} '
+          f'{"publish→seen":>15} {"lost":>5}')
+    print(f'  {"":<24} {"p50   max":>13} {"p50   max":>15} {"p50   max":>15} {"p50   max":>15}')
+    for name, profile, error_rate in SCENARIOS:
+        ms, lost, alive, errors = latency_run(profile, error_rate)
+        cells = ''.join(f' {np.nanmedian(ms[:, i]):>7.1f} {np.nanmax(ms[:, i]):>6.1f}' if len(ms) else ' —'
+                        for i in range(4))
+        print(f'  {name:<24}{cells} {lost:>5}' + (f'   {errors}' if error_rate else ''))
+        if not alive:
+            problems.append(f'{name}: bus owner thread died')
+        if not error_rate and lost:
+            problems.append(f'{name}: {lost} commands never reached their position')
+
+    if problems:
+        for p in problems:
+            print(f'  [!] {p}')
+        sys.exit(1)
+    print('\n  [ok] driver set up, moved and reported the simulated motors')
@@ -0,0 +1,76 @@
+'''
+Single-sample Forest Latency Benchmark
+
+Compares the per-decision model cost in run_inference:
+  sklearn — model.predict(x) then model.predict_proba(x)   (as trained, n_jobs=-1)
+  flat    — FlatForest.predict_one(x)                     (label + probabilities, one pass)
+
+Feeds held-out test windows one at a time, checks that both paths agree,
+and reports p50/p99/max latency.
+
+Usage:
+  python bench_forest.py                      # defaults to results_all_phases/
+  python bench_forest.py results_steady
+'''
+
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import joblib
+
+warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+from flat_forest import FlatForest, flat_path
+
+N_SAMPLES = 300
+WARMUP    = 20
+
+
+def _latencies(fn, X):
+    for x in X[:WARMUP]:
+        fn(x)
+    out = np.empty(len(X))
+    for i, x in enumerate(X):
+        t0 = time.perf_counter()
+        fn(x)
+        out[i] = time.perf_counter() - t0
+    return out * 1000
+
+
+def _report(name, ms):
+    p50, p99 = np.percentile(ms, [50, 99])
+    print(f'  {name:<8}  p50 {p50:8.3f}ms   p99 {p99:8.3f}ms   max {ms.max():8.3f}ms')
+    return p50, p99
+
+
+if __name__ == '__main__':
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results_all_phases'
+    model  = joblib.load(os.path.join(results_dir, 'model.joblib'))
+    X_test = np.load(os.path.join(results_dir, 'X_test.npy'))
+    X = X_test[np.random.default_rng(0).choice(len(X_test), N_SAMPLES, replace=False)]
+    X = X.reshape(len(X), 1, -1)
+
+    fpath = flat_path(results_dir)
+    flat  = FlatForest.load(fpath) if os.path.exists(fpath) else FlatForest.from_sklearn(model)
+
+    def sklearn_path(x):
+        return int(model.predict(x)[0]), model.predict_proba(x)[0]
+
+    def flat_path_(x):
+        return flat.predict_one(x)
+
+    mismatches = sum(
+        a[0] != b[0] or not np.allclose(a[1], b[1], rtol=0, atol=1e-12)
+        for a, b in ((sklearn_path(x), flat_path_(x)) for x in X)
+    )
+
+    print(f'── Single-sample latency ({N_SAMPLES} windows, {flat.n_trees} trees, '
+          f'max depth {flat.max_depth}) ──')
+    p50_sk, p99_sk = _report('sklearn', _latencies(sklearn_path, X))
+    p50_fl, p99_fl = _report('flat', _latencies(flat_path_, X))
+    print(f'  speed-up  p50 {p50_sk / p50_fl:6.1f}×     p99 {p99_sk / p99_fl:6.1f}×')
+    print(f'  disagreements: {mismatches}')
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,424 @@
+'''
+Motor Bus Transaction Benchmark
+
+Drives motor_driver_json against dxl_mock.MockPort (Protocol 2.0 packets
+through the real dynamixel_sdk, a 1 Mbps bus model) and compares it with
+the previous per-motor scheme:
+
+  old — every motor/command: write4ByteTxRx (goal) + read4ByteTxRx (read-after-write);
+        telemetry: read4ByteTxRx per motor
+  new — goals: one GroupSyncWrite packet (no status packets);
+        telemetry: one GroupSyncRead for both motors, plus a Hardware Error
+        Status sync read every HW_ERROR_INTERVAL
+
+A command here is what myo_controller / comm_bridge publish per grip or
+FSR update: one {"goals": {...}} message (the two single-motor messages
+they sent before are kept as a row for comparison).
+Bus time counts bytes on the wire and Return Delay Times; host time adds
+one USB-serial turnaround per transaction that waits for status packets
+(see dxl_mock.py). The per-operation table runs in virtual time. The
+script first checks, through the bus owner, that goals land clamped in the
+motors' control tables, that stop halts and that telemetry and the
+hardware error poll read them back, and exits non-zero if not.
+
+Bursts and stops run the mock in real time (each transaction holds the
+port for its host time), with telemetry and the error poll running, while
+a UI slider (motor 2) and the FSR stream (both motors, one {"goals"}
+message per update) publish into a paho-like message queue. Goals are ramps, so the
+first Goal Position write at or past a command's value is when that
+command — or a newer one — reached the bus. Position limits are lifted
+for these runs so the ramps never clamp. Compared:
+  direct — the paho thread writes every goal and runs stops itself, and a
+           telemetry loop competes for port_lock (the driver before BusOwner)
+  owner  — on_message fills the latest-goal slots / stop queue; BusOwner
+           runs stop > goal > telemetry > diagnostics on one thread
+Stops are timed from publish to the halt goal being written.
+
+Telemetry compares the fixed poll (50 ms, every read published) with the
+bus owner's adaptive telemetry over an idle spell, a slider ramp and the
+settled finger: position sync reads and samples published per phase, and
+that the last published sample is where the motors ended up.
+
+Run: python bench_motor_bus.py
+'''
+
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from dynamixel_sdk import COMM_SUCCESS
+
+import motor_driver_json as driver
+from dxl_mock import MockPort
+
+COMMAND_RATE   = 50     # command pairs per second in the load estimate (FSR stream)
+FIXED_TELEMETRY_INTERVAL = 0.05      # the driver's poll before adaptive telemetry: every 50 ms, always published
+TELEMETRY_RATE = 1 / FIXED_TELEMETRY_INTERVAL
+REPEATS        = 200
+BURST_RATES    = (200, 1000, 4000)   # motor/command messages per second (slider + FSR)
+BURST_SEC      = 2.0
+FSR_SHARE      = 0.2                 # share of publish events that are FSR updates (both motors)
+STOP_RATE      = 1000                # messages per second while stops are issued
+STOPS          = 40                  # stop commands per mode, at random times
+TELEMETRY_PHASES = (('idle', 5.0, 0), ('moving', 1.0, 200), ('settled', 3.0, 0))   # (name, s, msg/s on motor 2)
+
+# ── Per operation ─────────────────────────────────────────────────────────────
+
+def _message(payload):
+    return SimpleNamespace(topic=driver.MQTT_TOPIC, payload=json.dumps(payload).encode())
+
+
+def old_command(port, m1, m2):
+    ph = driver.packetHandler
+    for motor_id, position in ((driver.DXL_ID_1, m1), (driver.DXL_ID_2, m2)):
+        ph.write4ByteTxRx(port, motor_id, driver.ADDR_GOAL_POSITION, position)
+        ph.read4ByteTxRx(port, motor_id, driver.ADDR_PRESENT_POSITION)
+
+
+def old_telemetry(port, m1, m2):
+    for motor_id in driver.MOTOR_IDS:
+        driver.packetHandler.read4ByteTxRx(port, motor_id, driver.ADDR_PRESENT_POSITION)
+
+
+def new_command(port, m1, m2):
+    driver.move_motors({driver.DXL_ID_1: m1})
+    driver.move_motors({driver.DXL_ID_2: m2})
+
+
+def new_command_goals(port, m1, m2):
+    driver.move_motors({driver.DXL_ID_1: m1, driver.DXL_ID_2: m2})
+
+
+def new_telemetry(port, m1, m2):
+    driver.read_positions()
+
+
+def new_error_check(port, m1, m2):
+    driver.check_hardware_errors()
+
+
+def measure(port, fn, repeats=REPEATS):
+    '''Per-call transactions, bus ms and host ms, averaged over repeats.'''
+    port.reset_stats()
+    for k in range(repeats):
+        fn(port, 3000 + k % 1000, 4000 + k % 2000)
+    s = port.stats()
+    return s['transactions'] / repeats, s['bus_ms'] / repeats, s['host_ms'] / repeats
+
+
+# ── Real-time runs ────────────────────────────────────────────────────────────
+
+def fixed_telemetry(done, on_telemetry=None):
+    '''The driver's telemetry loop before BusOwner: read every 50 ms, publish every read.'''
+    last_error_check = 0.0
+    while not done.is_set():
+        positions = driver.read_positions()
+        if on_telemetry is not None and positions is not None:
+            on_telemetry(positions, None, None)
+        if time.monotonic() - last_error_check >= driver.HW_ERROR_INTERVAL:
+            driver.check_hardware_errors()
+            last_error_check = time.monotonic()
+        time.sleep(FIXED_TELEMETRY_INTERVAL)
+
+
+def use_port(port):
+    driver.portHandler = port
+    driver.goal_writer, driver.position_reader, driver.error_reader = driver.sync_groups(port)
+
+
+def fresh_owner():
+    driver.goal_slots = driver.GoalSlots()
+    driver.bus_owner  = driver.BusOwner(driver.goal_slots)
+    return driver.bus_owner
+
+
+def run(rate, mode, duration=BURST_SEC, stops=0):
+    '''
+    Publish ramps at `rate` messages/s for `duration` s (plus `stops` stop
+    commands at random times) through mode 'direct' or 'owner'.
+    Returns (goal latencies ms, stop latencies ms, goal writes, owner or None).
+    '''
+    port = MockPort(driver.MOTOR_IDS, baudrate=driver.BAUDRATE, realtime=True)
+    port.openPort()
+    use_port(port)
+    driver.POSITION_LIMITS = {motor_id: (0, 2 ** 31 - 1) for motor_id in driver.MOTOR_IDS}
+    owner = fresh_owner() if mode == 'owner' else None
+
+    halted = []
+    stop_motor = driver.stop_motor
+
+    def timed_stop(motor_id):
+        stop_motor(motor_id)
+        halted.append(time.perf_counter())
+
+    driver.stop_motor = timed_stop
+    inbox, done, sent, stop_sent = queue.Queue(), threading.Event(), [], []
+    ramps = {motor_id: itertools.count(3000) for motor_id in driver.MOTOR_IDS}
+
+    def paho_loop():
+        while True:
+            msg = inbox.get()
+            if msg is None:
+                return
+            if owner is not None:
+                driver.on_message(None, None, msg)
+                continue
+            payload = json.loads(msg.payload.decode())
+            if payload.get('mode') == 'stop':
+                driver.stop_motor(int(payload['id']))
+            else:
+                driver.move_motors(driver.parse_goals(payload))
+
+    def publish(*motor_ids):
+        now   = time.perf_counter()
+        goals = {motor_id: next(ramps[motor_id]) for motor_id in motor_ids}
+        sent.extend((now, motor_id, position) for motor_id, position in goals.items())
+        if len(goals) == 1:
+            inbox.put(_message({'id': motor_ids[0], 'position': goals[motor_ids[0]]}))
+        else:
+            inbox.put(_message({'goals': goals}))
+
+    paho = threading.Thread(target=paho_loop)
+    poll = threading.Thread(target=fixed_telemetry, args=(done,))
+    paho.start()
+    if owner is None:
+        poll.start()
+    else:
+        owner.start()
+
+    rng = np.random.default_rng(0)
+    t0 = time.perf_counter()
+    stop_at = sorted(t0 + rng.uniform(0.1, duration - 0.1, stops))
+    tick, owed = 0.005, 0.0
+    while time.perf_counter() < t0 + duration:
+        owed += rate * tick
+        while owed >= 1:
+            if rng.random() < FSR_SHARE:             # comm_bridge: both goals in one publish
+                publish(driver.DXL_ID_1, driver.DXL_ID_2)
+            else:                                    # UI slider on motor 2
+                publish(driver.DXL_ID_2)
+            owed -= 1
+        while stop_at and stop_at[0] <= time.perf_counter():
+            stop_at.pop(0)
+            stop_sent.append(time.perf_counter())
+            inbox.put(_message({'id': driver.DXL_ID_2, 'mode': 'stop'}))
+        time.sleep(tick)
+    inbox.put(None)
+    paho.join()
+    time.sleep(0.2)                                  # let the bus drain
+    done.set()
+    if owner is None:
+        poll.join()
+    else:
+        owner.stop()
+    driver.stop_motor = stop_motor
+
+    log = np.array(port.goal_log)
+    lat = []
+    for motor_id in driver.MOTOR_IDS:
+        mine = log[log[:, 1] == motor_id]
+        reached = np.maximum.accumulate(mine[:, 2])
+        for t, m, v in sent:
+            if m == motor_id:
+                i = np.searchsorted(reached, v)
+                lat.append((mine[i, 0] - t) * 1000 if i < len(mine) else np.nan)
+    stop_lat = (np.array(halted) - np.array(stop_sent[:len(halted)])) * 1000
+    return np.array(lat), stop_lat, port.by_instruction['sync_write'], owner
+
+
+def telemetry_run(adaptive):
+    '''
+    Idle, a 1 s slider ramp on motor 2, then idle again (TELEMETRY_PHASES), with
+    fixed or adaptive telemetry. Returns ({phase: (position sync reads, samples
+    published)}, last published positions, final goals).
+    '''
+    port = MockPort(driver.MOTOR_IDS, baudrate=driver.BAUDRATE, realtime=True)
+    port.openPort()
+    use_port(port)
+    driver.last_goals.clear()
+    driver.move_motors({driver.DXL_ID_1: 3500, driver.DXL_ID_2: 3500})
+    published, done = [], threading.Event()
+
+    def on_telemetry(positions, moving, trace):
+        published.append(positions)
+
+    if adaptive:
+        owner = fresh_owner()
+        owner.on_telemetry = on_telemetry
+        owner.start()
+        reads = lambda: owner.telemetry.reads
+    else:
+        poll = threading.Thread(target=fixed_telemetry, args=(done, on_telemetry))
+        poll.start()
+        reads = lambda: len(published)          # every read is published
+
+    counts, goal = {}, 3500
+    for name, seconds, rate in TELEMETRY_PHASES:
+        reads0, published0 = reads(), len(published)
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            if rate:
+                goal += 1
+                message = _message({'id': driver.DXL_ID_2, 'position': goal})
+                if adaptive:
+                    driver.on_message(None, None, message)
+                else:
+                    driver.move_motors(driver.parse_goals(json.loads(message.payload)))
+            time.sleep(1 / rate if rate else 0.01)
+        counts[name] = (reads() - reads0, len(published) - published0)
+    if adaptive:
+        owner.stop()
+    else:
+        done.set()
+        poll.join()
+    return counts, published[-1], {driver.DXL_ID_1: 3500, driver.DXL_ID_2: goal}
+
+
+def _pct(a):
+    return f'{np.nanpercentile(a, 50):>8.2f} {np.nanpercentile(a, 99):>8.2f} {np.nanmax(a):>8.2f}'
+
+
+# ── Checks ────────────────────────────────────────────────────────────────────
+
+def check(port):
+    problems = []
+    owner = fresh_owner()
+    owner.start()
+
+    def settle():
+        time.sleep(0.05)
+
+    driver.on_message(None, None, _message({'goals': {'1': 9999, '2': 3500}}))
+    settle()
+    positions = driver.read_positions()
+    if positions != {1: 4300, 2: 3500}:
+        problems.append(f'goals after clamp: {positions}')
+    driver.on_message(None, None, _message({'id': 2, 'position': 100}))
+    settle()
+    if driver.read_positions() != {1: 4300, 2: 3000}:
+        problems.append(f'single goal after clamp: {driver.read_positions()}')
+    driver.on_message(None, None, _message({'id': 1, 'mode': 'stop'}))
+    settle()
+    if driver.read_positions()[1] != 4300 or owner.stop_to_halt.summary()['n'] != 1:
+        problems.append('stop did not halt motor 1')
+    port.registers[2][driver.ADDR_HARDWARE_ERROR] = 0x20          # overload
+    driver.check_hardware_errors()
+    if driver.error_reader.getData(2, driver.ADDR_HARDWARE_ERROR, 1) != 0x20:
+        problems.append('hardware error status not read back')
+    port.registers[2][driver.ADDR_HARDWARE_ERROR] = 0
+    pos, result, _ = driver.packetHandler.read4ByteTxRx(port, 1, driver.ADDR_GOAL_POSITION)
+    if result != COMM_SUCCESS or pos != 4300:
+        problems.append(f'goal register {pos}')
+    if owner.jobs['telemetry'] == 0 or owner.jobs['diagnostics'] == 0:
+        problems.append(f'bus owner ran no periodic reads: {owner.jobs}')
+    time.sleep(driver.TELEMETRY_IDLE_AFTER + 0.1)
+    if owner.telemetry.moving or owner.telemetry.interval(time.perf_counter()) != driver.TELEMETRY_IDLE_INTERVAL:
+        problems.append('telemetry did not drop to the idle rate')
+    port.registers[1][driver.ADDR_MOVING] = 1                     # pushed by hand: moving, no new goal
+    time.sleep(driver.TELEMETRY_IDLE_INTERVAL + 0.05)
+    if not owner.telemetry.moving or owner.telemetry.interval(time.perf_counter()) != driver.TELEMETRY_ACTIVE_INTERVAL:
+        problems.append('Moving flag did not switch telemetry to the active rate')
+    port.registers[1][driver.ADDR_MOVING] = 0
+    owner.stop()
+    return problems
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    limits = dict(driver.POSITION_LIMITS)
+    port = MockPort(driver.MOTOR_IDS, baudrate=driver.BAUDRATE)
+    port.openPort()
+    use_port(port)
+
+    print('── Driver checks (mock bus) ──────────────────────────')
+    problems = check(port)
+    for p in problems:
+        print(f'  [!] {p}')
+    print()
+
+    rows = [
+        ('old', 'command (2 messages)', measure(port, old_command)),
+        ('new', 'command (2 messages)', measure(port, new_command)),
+        ('new', 'command ({"goals"})',  measure(port, new_command_goals)),
+        ('old', 'telemetry cycle',      measure(port, old_telemetry)),
+        ('new', 'telemetry cycle',      measure(port, new_telemetry)),
+        ('new', 'hw error check',       measure(port, new_error_check)),
+    ]
+    print(f'── Per operation ({driver.BAUDRATE // 1000} kbps, return delay {port.return_delay_us:.0f} µs, '
+          f'USB turnaround {port.usb_latency_us:.0f} µs) ──')
+    print(f'  {"":<4} {"operation":<22} {"transactions":>12} {"bus ms":>8} {"host ms":>8}')
+    for tag, name, (n, bus, host) in rows:
+        print(f'  {tag:<4} {name:<22} {n:>12.1f} {bus:>8.3f} {host:>8.3f}')
+    print()
+
+    per = {(tag, name): r for tag, name, r in rows}
+    old_load = [COMMAND_RATE * a + TELEMETRY_RATE * b for a, b in
+                zip(per[('old', 'command (2 messages)')], per[('old', 'telemetry cycle')])]
+    new_load = [COMMAND_RATE * a + TELEMETRY_RATE * b + c / driver.HW_ERROR_INTERVAL for a, b, c in
+                zip(per[('new', 'command ({"goals"})')], per[('new', 'telemetry cycle')],
+                    per[('new', 'hw error check')])]
+    print(f'── Load at {COMMAND_RATE} commands/s + {TELEMETRY_RATE:.0f} Hz telemetry ──────────────')
+    for tag, (n, bus, host) in (('old', old_load), ('new', new_load)):
+        print(f'  {tag:<4} {n:>6.0f} transactions/s   bus busy {bus / 10:5.1f}%   '
+              f'port lock held {host / 10:5.1f}%')
+    goals_host = per[('new', 'command ({"goals"})')][2]
+    print(f'  max command rate (port lock only, no telemetry): '
+          f'old {1000 / per[("old", "command (2 messages)")][2]:.0f}/s, '
+          f'new {1000 / goals_host:.0f}/s')
+    print()
+
+    print(f'── Bursts (real time, {BURST_SEC:.0f} s each, goals at most {driver.GOAL_RATE} Hz) ─────────')
+    print(f'  {"msg/s":>6} {"mode":<7} {"sent":>6} {"writes":>7} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}'
+          f' {"coalesced":>10}')
+    for rate in BURST_RATES:
+        for mode in ('direct', 'owner'):
+            lat, _, writes, owner = run(rate, mode)
+            extra = f' {owner.slots.coalesced:>10}' if owner else ''
+            print(f'  {rate:>6} {mode:<7} {len(lat):>6} {writes:>7} {_pct(lat)}{extra}')
+            if np.isnan(lat).any():
+                problems.append(f'{int(np.isnan(lat).sum())} commands never reached the bus ({rate} msg/s, {mode})')
+    print()
+
+    print(f'── Stop → halt written ({STOPS} stops during {STOP_RATE} msg/s, real time) ──────────')
+    print(f'  {"mode":<7} {"stops":>6} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for mode in ('direct', 'owner'):
+        _, stop_lat, _, owner = run(STOP_RATE, mode, stops=STOPS)
+        print(f'  {mode:<7} {len(stop_lat):>6} {_pct(stop_lat)}')
+        if len(stop_lat) != STOPS:
+            problems.append(f'{STOPS - len(stop_lat)} stops not executed ({mode})')
+    m = owner.metrics()['bus']
+    print()
+    print('  bus owner, last run (ms)')
+    print(f'  {"class":<12} {"jobs":>6} {"deadline":>9} {"misses":>7} {"wait p50":>9} {"wait p99":>9} '
+          f'{"hold p50":>9} {"hold p99":>9}')
+    for cls in driver.BUS_PRIORITY:
+        c = m[cls]
+        w, h = c['queue_wait_ms'], c['hold_ms']
+        print(f'  {cls:<12} {c["jobs"]:>6} {c["deadline_ms"]:>9.1f} {c["deadline_misses"]:>7} '
+              f'{w.get("p50", 0):>9.2f} {w.get("p99", 0):>9.2f} {h.get("p50", 0):>9.2f} {h.get("p99", 0):>9.2f}')
+    print()
+
+    print('── Telemetry: idle, slider ramp, settled (real time) ──────────')
+    print(f'  {"":<9}' + ''.join(f' {name:>8} {seconds:.0f}s reads/pub' for name, seconds, _ in TELEMETRY_PHASES))
+    for adaptive in (False, True):
+        counts, last, goals = telemetry_run(adaptive)
+        print(f'  {"adaptive" if adaptive else "fixed":<9}' +
+              ''.join(f' {"":>8} {counts[name][0]:>7} /{counts[name][1]:>4}' for name, _, _ in TELEMETRY_PHASES))
+        if last != goals:
+            problems.append(f'last telemetry sample {last} is not the final position {goals}')
+    print(f'  adaptive: {driver.TELEMETRY_ACTIVE_INTERVAL * 1000:.0f} ms polls while moving, '
+          f'{driver.TELEMETRY_IDLE_INTERVAL * 1000:.0f} ms idle, deadband {driver.TELEMETRY_DEADBAND} ticks, '
+          f'heartbeat {driver.TELEMETRY_HEARTBEAT:.0f} s')
+    driver.POSITION_LIMITS = limits
+
+    if problems:
+        for p in problems:
+            print(f'  [!] {p}')
+        sys.exit(1)
+    print('\n  [ok] goals, clamping, stop and telemetry verified on the mock bus')
@@ -0,0 +1,67 @@
+'''
+Multi-stream Inference Benchmark — one batched model call vs one per stream
+
+Runs inference_server.InferenceServer with N paced synthetic armbands
+(200 Hz each, own reader thread, own calibration / window / vote-dwell
+state) for N = 1 … 32, twice per N:
+
+  batched   — every stream's window on the shared stride clock goes through
+              one FlatForest.predict()
+  per-call  — each due window gets its own predict_one() (what N copies of
+              run_inference would do, minus the N processes)
+
+After the streams have calibrated, DURATION seconds are measured:
+decisions/s (ideal: N × 200 / STRIDE), mean windows per model call,
+decision latency p50/p99 (newest sample's arrival in the ring → decision
+published), process CPU share and samples dropped by the rings.
+
+Run: python bench_multistream.py
+'''
+
+import threading
+import time
+
+from flat_forest import load_for_inference
+from inference_server import MODEL_DIR, STRIDE, InferenceServer
+
+STREAM_COUNTS = (1, 2, 4, 8, 16, 32)
+WARMUP        = 3.0    # seconds: calibration (CALIB_SEC) + first window
+DURATION      = 5.0    # seconds measured per run
+RATE          = 200
+
+
+def run(model, n_streams, batched):
+    server = InferenceServer(model, batched=batched)
+    for k in range(n_streams):
+        server.add_stream(f'rig{k + 1}', f'synthetic:grip=cycle,hold=2,seed={k}')
+    stop = threading.Event()
+    worker = threading.Thread(target=server.serve, args=(stop,), daemon=True)
+    worker.start()
+    time.sleep(WARMUP)
+
+    server.reset_stats()
+    dropped0 = sum(st.ring.dropped for st in server.streams)
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    time.sleep(DURATION)
+    cpu, elapsed = time.process_time() - cpu0, time.perf_counter() - t0
+    m = server.metrics(elapsed)
+    dropped = sum(st.ring.dropped for st in server.streams) - dropped0
+
+    stop.set()
+    worker.join(timeout=2)
+    server.stop()
+    return m, cpu / elapsed, dropped
+
+
+if __name__ == '__main__':
+    model = load_for_inference(MODEL_DIR)
+    print(f'── Throughput ({DURATION:.0f}s per run, stride {STRIDE}, {RATE} Hz per stream) ──')
+    print(f'  {"streams":>7} {"mode":<9} {"dec/s":>7} {"ideal":>6} {"batch":>6} '
+          f'{"p50 ms":>7} {"p99 ms":>7} {"CPU":>6} {"lost":>6}')
+    for n in STREAM_COUNTS:
+        for batched in (True, False):
+            m, cpu, dropped = run(model, n, batched)
+            lat = m['latency_ms']
+            print(f'  {n:>7} {"batched" if batched else "per-call":<9} {m["decisions_per_sec"]:>7.1f} '
+                  f'{n * RATE / STRIDE:>6.0f} {m["mean_batch"]:>6.2f} {lat.get("p50", 0):>7.2f} '
+                  f'{lat.get("p99", 0):>7.2f} {cpu:>6.1%} {dropped:>6}')
@@ -0,0 +1,89 @@
+'''
+EMG Transport Benchmark — queue.Queue vs SampleRing bulk read
+
+A producer thread delivers 8-channel samples at a fixed rate in BLE-sized
+packets (2 samples per packet, as the Myo does); the consumer collects them
+the way collect_data._collect does:
+
+  queue — queue.put(np.array) per sample, get(timeout) per sample, list → np.array
+  ring  — SampleRing.put per sample; read(min_count=remaining) sleeps until the
+          block is in (or 0.5s) and copies it into a preallocated array
+
+Reported per rate: consumer CPU time per sample (thread_time) and share of
+one core. 200 Hz is today's FILTERED mode; 1 kHz is raw mode; 4 kHz stands
+in for several armbands feeding one consumer.
+
+Run: python bench_ring.py
+'''
+
+import queue
+import threading
+import time
+
+import numpy as np
+
+from emg_ring import SampleRing
+
+RATES    = (200, 1000, 4000)   # samples/s
+DURATION = 3.0                 # seconds per run
+PACKET   = 2                   # samples per BLE notification
+
+
+def _producer(put, rate, n_samples, done):
+    rng  = np.random.default_rng(0)
+    rows = [tuple(int(v) for v in r) for r in rng.integers(-128, 128, (1000, 8))]
+    t0 = time.perf_counter()
+    for k in range(0, n_samples, PACKET):
+        delay = t0 + k / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for j in range(PACKET):
+            put(rows[(k + j) % len(rows)])
+    done.set()
+
+
+def _run_queue(rate, n_samples):
+    q, done = queue.Queue(), threading.Event()
+    prod = threading.Thread(target=_producer, daemon=True,
+                            args=(lambda emg: q.put(np.abs(np.array(emg, dtype=np.float32))),
+                                  rate, n_samples, done))
+    cpu0 = time.thread_time()
+    prod.start()
+    samples = []
+    while len(samples) < n_samples:
+        try:
+            samples.append(q.get(timeout=0.5))
+        except queue.Empty:
+            pass
+    out = np.array(samples, dtype=np.float32)
+    cpu = time.thread_time() - cpu0
+    prod.join()
+    return cpu, out
+
+
+def _run_ring(rate, n_samples):
+    ring, done = SampleRing(capacity=4096), threading.Event()
+    prod = threading.Thread(target=_producer, daemon=True,
+                            args=(ring.put, rate, n_samples, done))
+    cpu0 = time.thread_time()
+    prod.start()
+    out = np.empty((n_samples, 8), dtype=np.float32)
+    n = 0
+    while n < n_samples:
+        n += ring.read(out[n:], timeout=0.5, min_count=n_samples - n)
+    np.abs(out, out=out)
+    cpu = time.thread_time() - cpu0
+    prod.join()
+    return cpu, out
+
+
+if __name__ == '__main__':
+    print(f'── Consumer cost ({DURATION:.0f}s per run, {PACKET} samples per packet) ──')
+    print(f'  {"rate":>6}   {"queue µs/sample":>15} {"core":>6}   {"ring µs/sample":>14} {"core":>6}')
+    for rate in RATES:
+        n = int(rate * DURATION)
+        q_cpu, q_out = _run_queue(rate, n)
+        r_cpu, r_out = _run_ring(rate, n)
+        assert np.array_equal(q_out, r_out)
+        print(f'  {rate:>5}Hz   {q_cpu / n * 1e6:>15.2f} {q_cpu / DURATION:>6.1%}   '
+              f'{r_cpu / n * 1e6:>14.2f} {r_cpu / DURATION:>6.1%}')
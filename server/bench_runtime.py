@@ -0,0 +1,253 @@
+'''
+Control Runtime Benchmark — one process vs one per node
+
+Compares control_runtime.py (bridge, myo controller, dashboard server and
+inference on one event loop) with the multi-process layout start_system.py
+launches (comm_bridge.py, myo_controller.py, finger_data.py,
+run_inference.py, each with its own MQTT client):
+
+  memory      — resident set (VmRSS) of fresh interpreters that import and
+                build what each node holds before its loop starts (every
+                measurement a new `python -c` process, as in
+                bench_startup.py), summed per layout. Inference holds the
+                same modules, model and rest gate in both layouts, so the
+                difference is what one process saves. No broker needed.
+  in-process  — the runtime's LocalBus: sensor/myo/state and fsr/finger
+                handed in from another thread (as paho's network thread
+                does) → the motor/command message handed to the external
+                client. No broker needed.
+  end to end  — with a broker at MQTT_BROKER:MQTT_PORT: the real node
+                processes (inference excluded: --source none) against the real
+                runtime process; this script publishes sensor/myo/state and
+                fsr/finger and times the motor/command it receives, as the
+                motor driver would; live VmRSS of the processes.
+                Skipped (and said so) when no broker answers.
+
+Run: python bench_runtime.py
+'''
+
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import comm_bridge
+import control_runtime
+import myo_controller
+
+N_MESSAGES = 2000        # per path, in-process
+N_LIVE     = 200         # per path, end to end
+LIVE_GAP   = 0.01        # seconds between end-to-end messages
+RUNS       = 3           # memory: median of fresh processes
+GRIPS      = ('cylindrical', 'lateral', 'palm', 'rest')
+
+_CHILD = '''
+import json
+{code}
+with open('/proc/self/status') as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS'))
+print(json.dumps({{'rss_kb': rss}}))
+'''
+
+# Inference as both layouts run it: the same modules, model and rest gate
+INFERENCE = ('import numpy, paho.mqtt.client, decision_filter, emg_calibration, emg_features, emg_ring, '
+             'emg_source, latency_stats, model_reload, rest_gate, tracing, inference_server; '
+             'from flat_forest import load_for_inference; from inference_server import CLASSES, MODEL_DIR; '
+             'model = load_for_inference(MODEL_DIR, classes=CLASSES); '
+             'gate = rest_gate.load_rest_gate(MODEL_DIR, verbose=False)')
+NODES = {       # what each process holds before its loop starts
+    'comm_bridge':    'import comm_bridge, paho.mqtt.client as mqtt; '
+                      'client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)',
+    'myo_controller': 'import myo_controller, paho.mqtt.client as mqtt; '
+                      'client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)',
+    'finger_data':    'import finger_data',
+    'run_inference':  INFERENCE,
+}
+RUNTIME = ('import control_runtime, paho.mqtt.client as mqtt; '
+           'client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2); ' + INFERENCE)
+
+
+def footprint(code):
+    rss = []
+    for _ in range(RUNS):
+        out = subprocess.run([sys.executable, '-c', _CHILD.format(code=code)],
+                             capture_output=True, text=True, check=True).stdout
+        rss.append(json.loads(out.splitlines()[-1])['rss_kb'])
+    return statistics.median(rss) / 1024
+
+
+def rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmRSS')) / 1024
+    except (OSError, StopIteration):
+        return float('nan')
+
+
+def messages():
+    '''[(topic, payload)] alternating myo grips, then an FSR sweep.'''
+    myo = [(myo_controller.TOPIC_MYO_STATE, GRIPS[k % len(GRIPS)]) for k in range(N_MESSAGES)]
+    fsr = [(comm_bridge.TOPIC_FINGER, json.dumps({'m1': 3000 + k % 1300, 'm2': 4000 + k % 2400}))
+           for k in range(N_MESSAGES)]
+    return myo, fsr
+
+
+# ── In-process bus ────────────────────────────────────────────────────────────
+
+class _Recorder:
+    '''Stands in for the external paho client: notes when motor/command leaves.'''
+
+    def __init__(self):
+        self.sent = []
+        self.done = threading.Event()
+        self.expected = 0
+
+    def publish(self, topic, payload):
+        self.sent.append(time.perf_counter())
+        if len(self.sent) >= self.expected:
+            self.done.set()
+
+
+def in_process(path):
+    latencies = []
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        recorder = _Recorder()
+        bus = control_runtime.LocalBus(loop, recorder)
+        control_runtime.attach_nodes(bus)
+        myo_controller.current_mode, comm_bridge.current_mode = 'myo', 'fsr'
+
+        def feed():
+            for topic, payload in path:
+                recorder.sent.clear()
+                recorder.done.clear()
+                recorder.expected = 1
+                sent = time.perf_counter()
+                bus.deliver(None, None, control_runtime.Message(topic, payload.encode()))
+                recorder.done.wait(1.0)
+                latencies.append((recorder.sent[-1] - sent) * 1000 if recorder.sent else np.nan)
+
+        await loop.run_in_executor(None, feed)
+        return bus.counts
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):    # node prints, still paid
+        counts = asyncio.run(run())
+    myo_controller.current_mode = comm_bridge.current_mode = 'ui'
+    return np.array(latencies), counts
+
+
+# ── End to end through a broker ───────────────────────────────────────────────
+
+def broker_up():
+    try:
+        with socket.create_connection((control_runtime.MQTT_BROKER, control_runtime.MQTT_PORT), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+def live(layout):
+    import paho.mqtt.client as mqtt
+
+    scripts = ([['control_runtime.py', '--source', 'none']] if layout == 'single process' else
+               [['comm_bridge.py'], ['myo_controller.py'], ['finger_data.py']])
+    procs = [subprocess.Popen([sys.executable] + s, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+             for s in scripts]
+    received = []
+    got = threading.Event()
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+
+    def on_message(c, u, msg):
+        if 'goals' in json.loads(msg.payload):
+            received.append(time.perf_counter())
+            got.set()
+
+    client.on_message = on_message
+    client.connect(control_runtime.MQTT_BROKER, control_runtime.MQTT_PORT, 60)
+    client.subscribe(comm_bridge.TOPIC_MOTOR)
+    client.loop_start()
+    time.sleep(3.0)                                     # nodes connected and subscribed
+    rows = {}
+    for name, mode, topic, payload in (
+            ('sensor/myo/state', 'myo', myo_controller.TOPIC_MYO_STATE, lambda k: GRIPS[k % len(GRIPS)]),
+            ('fsr/finger', 'fsr', comm_bridge.TOPIC_FINGER,
+             lambda k: json.dumps({'m1': 3000 + k, 'm2': 4000 + k}))):
+        client.publish(comm_bridge.TOPIC_SYS_MODE, mode)
+        time.sleep(0.5)
+        ms = []
+        for k in range(N_LIVE):
+            got.clear()
+            sent = time.perf_counter()
+            client.publish(topic, payload(k))
+            ms.append((received[-1] - sent) * 1000 if got.wait(1.0) else np.nan)
+            time.sleep(LIVE_GAP)
+        rows[name] = np.array(ms)
+    client.publish(comm_bridge.TOPIC_SYS_MODE, 'ui')
+    memory = sum(rss_mb(p.pid) for p in procs)
+    client.loop_stop()
+    client.disconnect()
+    for p in procs:
+        p.terminate()
+        p.wait()
+    return rows, memory
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def _cells(ms):
+    ok = ms[~np.isnan(ms)]
+    if not len(ok):
+        return f'{"—":>8} {"—":>8} {"—":>8}'
+    return f'{np.percentile(ok, 50):>8.3f} {np.percentile(ok, 99):>8.3f} {ok.max():>8.3f}'
+
+
+if __name__ == '__main__':
+    problems = []
+
+    print(f'── Memory: fresh interpreters, VmRSS median of {RUNS} (MB) ──────────')
+    per_node = {node: footprint(code) for node, code in NODES.items()}
+    for node, mb in per_node.items():
+        print(f'  {node:<26} {mb:>7.1f}')
+    multi, single = sum(per_node.values()), footprint(RUNTIME)
+    print(f'  {"four processes":<26} {multi:>7.1f}')
+    print(f'  {"control_runtime":<26} {single:>7.1f}   ({1 - single / multi:.0%} less)')
+    print()
+
+    print(f'── In-process bus: handed in → motor/command out ({N_MESSAGES} each, ms) ──')
+    print(f'  {"path":<26} {"p50":>8} {"p99":>8} {"max":>8}')
+    for name, path in zip(('sensor/myo/state', 'fsr/finger'), messages()):
+        ms, counts = in_process(path)
+        print(f'  {name:<26} {_cells(ms)}')
+        if np.isnan(ms).any():
+            problems.append(f'{name}: {int(np.isnan(ms).sum())} messages produced no motor/command')
+        if counts['errors']:
+            problems.append(f'{name}: {counts["errors"]} handler errors')
+    print()
+
+    host = f'{control_runtime.MQTT_BROKER}:{control_runtime.MQTT_PORT}'
+    if broker_up():
+        print(f'── End to end through {host}: publish → motor/command ({N_LIVE} each, ms) ──')
+        print(f'  {"layout":<18} {"path":<18} {"p50":>8} {"p99":>8} {"max":>8}   {"RSS MB":>7}')
+        for layout in ('multi-process', 'single process'):
+            rows, memory = live(layout)
+            for name, ms in rows.items():
+                print(f'  {layout:<18} {name:<18} {_cells(ms)}   {memory:>7.1f}')
+                if np.isnan(ms).any():
+                    problems.append(f'{layout}, {name}: {int(np.isnan(ms).sum())} messages lost')
+    else:
+        print(f'── End to end: no MQTT broker at {host} — skipped (start mosquitto to compare live) ──')
+
+    if problems:
+        for p in problems:
+            print(f'  [!] {p}')
+        sys.exit(1)
+    print('\n  [ok] runtime routes both command paths in-process')
@@ -0,0 +1,136 @@
+'''
+Startup-time Benchmark
+
+How long a fresh interpreter takes from launch to its first prediction, per
+model artifact, plus what the heavy imports cost on their own. Every
+measurement is a new `python -c` process (nothing cached in the
+interpreter; file pages stay in the OS cache after the first run, as on a
+restarted host), repeated RUNS times, median reported:
+
+  imports   — the modules run_inference.py needs before it can load a model
+  load      — artifact → FlatForest
+  first     — first predict_one (page faults on a memory-mapped bundle land here)
+  total     — wall time of the whole process, interpreter start included
+
+Artifacts, where present in <results_dir>/:
+  joblib        model.joblib unpickled (imports sklearn) and flattened
+  flat npz      model_flat.npz read into memory
+  bundle full   the full forest as a memory-mapped bundle (written to a temp dir)
+  pruned npz    model_pruned.npz
+  bundle        model_bundle/ (python flat_forest.py --bundle)
+
+Exits non-zero if any artifact but joblib leaves sklearn or joblib in
+sys.modules: the live path must not pay for them.
+
+Run: python bench_startup.py [results_dir]
+'''
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from flat_forest import FlatForest, bundle_header, bundle_path, flat_path, pruned_path
+
+RUNS = 5
+
+IMPORTS = ('import numpy, paho.mqtt.client, decision_filter, emg_calibration, emg_features, '
+           'emg_ring, emg_source, flat_forest, latency_stats, model_reload, rest_gate')
+
+_CHILD = '''
+import json, sys, time
+t0 = time.perf_counter()
+{imports}
+t1 = time.perf_counter()
+{load}
+t2 = time.perf_counter()
+import numpy as np
+flat.predict_one(np.zeros(flat.feature.max() + 1, dtype=np.float32))
+t3 = time.perf_counter()
+print(json.dumps({{'imports': t1 - t0, 'load': t2 - t1, 'first': t3 - t2, 'trees': flat.n_trees,
+                  'heavy': sorted(m for m in ('sklearn', 'joblib', 'matplotlib') if m in sys.modules)}}))
+'''
+
+LOADERS = {
+    'joblib':      'import joblib; flat = flat_forest.FlatForest.from_sklearn(joblib.load({path!r}))',
+    'flat npz':    'flat = flat_forest.FlatForest.load({path!r})',
+    'bundle full': 'flat = flat_forest.FlatForest.load_bundle({path!r})',
+    'pruned npz':  'flat = flat_forest.FlatForest.load({path!r})',
+    'bundle':      'flat = flat_forest.FlatForest.load_bundle({path!r})',
+}
+
+
+def _run(code):
+    t0  = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    res = json.loads(out.stdout.strip().splitlines()[-1])
+    res['total'] = time.perf_counter() - t0
+    return res
+
+
+def measure(code, runs=RUNS):
+    '''Median of each phase over `runs` fresh processes (after one unmeasured run).'''
+    _run(code)
+    rows = [_run(code) for _ in range(runs)]
+    out  = {k: statistics.median(r[k] for r in rows) * 1000 for k in ('imports', 'load', 'first', 'total')}
+    out['trees'], out['heavy'] = rows[-1]['trees'], rows[-1]['heavy']
+    return out
+
+
+def import_cost(module, runs=RUNS):
+    '''Median ms to import one module in a fresh interpreter, beyond the bare interpreter.'''
+    def once(stmt):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, '-c', stmt], check=True)
+        return time.perf_counter() - t0
+    once(f'import {module}')
+    base = statistics.median(once('pass') for _ in range(runs))
+    return (statistics.median(once(f'import {module}') for _ in range(runs)) - base) * 1000
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results_all_phases'
+    model_path  = os.path.join(results_dir, 'model.joblib')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {'joblib': model_path, 'flat npz': flat_path(results_dir),
+                 'pruned npz': pruned_path(results_dir), 'bundle': bundle_path(results_dir)}
+        if os.path.exists(flat_path(results_dir)):
+            full = FlatForest.load(flat_path(results_dir))
+            paths['bundle full'] = os.path.join(tmp, 'bundle_full')
+            full.save_bundle(paths['bundle full'], **bundle_header(results_dir, flat_path(results_dir)))
+            del full
+
+        problems = []
+        print(f'── Launch → first prediction ({RUNS} fresh processes each, median ms) ──')
+        print(f'  {"artifact":<12} {"trees":>5} {"imports":>8} {"load":>8} {"first":>7} {"total":>8}  heavy modules')
+        for name, loader in LOADERS.items():
+            path = paths.get(name)
+            if path is None or not os.path.exists(path):
+                print(f'  {name:<12} (not found)')
+                continue
+            code = _CHILD.format(imports=IMPORTS, load=loader.format(path=path))
+            r = measure(code)
+            print(f'  {name:<12} {r["trees"]:>5} {r["imports"]:>8.1f} {r["load"]:>8.1f} {r["first"]:>7.2f} '
+                  f'{r["total"]:>8.1f}  {", ".join(r["heavy"]) or "—"}')
+            leaked = [m for m in r['heavy'] if m in ('sklearn', 'joblib')]
+            if name != 'joblib' and leaked:
+                problems.append(f'{name}: imports {", ".join(leaked)}')
+    print()
+
+    print(f'── Import cost (fresh interpreter, median ms over {RUNS}) ──')
+    for module in ('numpy', 'paho.mqtt.client', 'joblib', 'sklearn.metrics', 'sklearn.ensemble',
+                   'matplotlib.pyplot', 'test_model'):
+        print(f'  {module:<20} {import_cost(module):>8.1f}')
+    print()
+
+    if problems:
+        for p in problems:
+            print(f'  [!] {p}')
+        sys.exit(1)
+    print('  [ok] no sklearn / joblib on the npz and bundle paths')
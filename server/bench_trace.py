@@ -0,0 +1,171 @@
+'''
+End-to-end Trace Benchmark
+
+Both command paths traced end to end in one process, without a broker or
+hardware: the nodes' own MQTT handlers are wired to an in-process
+loopback broker (one delivery thread per subscription, as each node has
+its own network loop), and the motor driver's bus owner talks to a
+realtime dxl_mock.MockPort with motion, set up by setup_motors().
+
+  myo   InferenceServer on a synthetic armband (grip=cycle) publishing
+        sensor/myo/state → myo_controller.on_message → motor/command
+        → motor_driver_json.on_message → bus owner → motor/telemetry
+  fsr   fsr/finger readings (a slow sweep) → comm_bridge.on_message
+        → motor/command → motor driver → motor/telemetry
+
+Spans go to system/trace/spans and into a tracing.TraceCollector; the
+per-hop breakdown is printed per origin, and --out writes the Chrome
+trace. Exits non-zero if a path produced no trace that reached the
+motor/telemetry sample showing its goal.
+
+Run: python bench_trace.py [--out trace.json]
+'''
+
+import os
+os.environ['TRACE'] = '1'       # before the nodes import tracing
+
+import json
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import comm_bridge
+import motor_driver_json as driver
+import myo_controller
+from dxl_mock import MockPort
+from flat_forest import load_for_inference
+from inference_server import CLASSES, MODEL_DIR, InferenceServer
+from tracing import TOPIC_SPANS, TraceCollector, print_breakdown
+
+GRIPS        = {'rest': (4300, 4000)}     # start position (myo_controller's rest grip)
+MYO_SECONDS  = 14.0      # synthetic armband: 2 s calibration, then a grip change every HOLD s
+HOLD         = 2.0
+FSR_SECONDS  = 6.0
+FSR_RATE     = 5         # fsr/finger readings per second
+FSR_SWEEP    = ((4300, 3500), (4000, 5000))     # (m1 from, to), (m2 from, to), there and back
+
+
+class LoopbackBroker:
+    '''Topic → subscribers; each subscription delivers on its own thread.'''
+
+    def __init__(self):
+        self.subscribers = defaultdict(list)
+        self.delivered   = 0
+
+    def subscribe(self, topic, callback):
+        inbox = queue.Queue()
+        client = SimpleNamespace(publish=self.publish)
+
+        def deliver():
+            while True:
+                msg = inbox.get()
+                if msg is None:
+                    return
+                callback(client, None, msg)
+                self.delivered += 1
+
+        threading.Thread(target=deliver, daemon=True).start()
+        self.subscribers[topic].append(inbox)
+
+    def publish(self, topic, payload):
+        msg = SimpleNamespace(topic=topic, payload=payload.encode() if isinstance(payload, str) else payload)
+        for inbox in self.subscribers[topic]:
+            inbox.put(msg)
+
+    def close(self):
+        for inboxes in self.subscribers.values():
+            for inbox in inboxes:
+                inbox.put(None)
+
+
+def start_driver(broker):
+    port = MockPort(driver.MOTOR_IDS, baudrate=driver.BAUDRATE, realtime=True, motion=True,
+                    initial_position=dict(zip(driver.MOTOR_IDS, GRIPS['rest'])))
+    driver.portHandler = port
+    driver.goal_writer, driver.position_reader, driver.error_reader = driver.sync_groups(port)
+    driver.last_goals.clear()
+    driver.setup_motors()
+    driver.move_motors(dict(zip(driver.MOTOR_IDS, GRIPS['rest'])))
+
+    def publish_telemetry(positions, moving, trace):
+        payload = {'m1_pos': positions[driver.DXL_ID_1], 'm2_pos': positions[driver.DXL_ID_2], 'moving': moving}
+        if trace is not None:
+            payload['trace'] = trace
+        broker.publish('motor/telemetry', json.dumps(payload))
+
+    driver.tracer.publish = broker.publish
+    driver.goal_slots = driver.GoalSlots()
+    owner = driver.bus_owner = driver.BusOwner(driver.goal_slots, on_telemetry=publish_telemetry)
+    owner.start()
+    return owner
+
+
+def reached_telemetry(collector, origin):
+    '''(traces from origin, traces with a telemetry span).'''
+    traces = [spans for spans in collector.traces().values() if spans[0]['node'] == origin]
+    return len(traces), sum(any(s['name'].startswith('telemetry') for s in spans) for spans in traces)
+
+
+if __name__ == '__main__':
+    out = next((b for a, b in zip(sys.argv, sys.argv[1:]) if a == '--out'), None)
+
+    broker    = LoopbackBroker()
+    collector = TraceCollector()
+    broker.subscribe(TOPIC_SPANS, collector.on_message)
+    broker.subscribe(driver.MQTT_TOPIC, driver.on_message)
+    broker.subscribe(myo_controller.TOPIC_MYO_STATE, myo_controller.on_message)
+    broker.subscribe(comm_bridge.TOPIC_FINGER, comm_bridge.on_message)
+    owner = start_driver(broker)
+
+    print('Loading model...')
+    server = InferenceServer(load_for_inference(MODEL_DIR, classes=CLASSES), publish=broker.publish, trace=True)
+    stream = server.add_stream('myo', f'synthetic:grip=cycle,hold={HOLD}')
+    stream.topic = myo_controller.TOPIC_MYO_STATE       # stand in for run_inference's topic
+    myo_controller.current_mode = 'myo'
+    stop = threading.Event()
+    worker = threading.Thread(target=server.serve, args=(stop,), daemon=True)
+    worker.start()
+    print(f'  myo path: {MYO_SECONDS:.0f} s of synthetic EMG (grip change every {HOLD:.0f} s)')
+    time.sleep(MYO_SECONDS)
+    stop.set()
+    worker.join(timeout=2)
+    server.stop()
+    myo_controller.current_mode = 'ui'
+    time.sleep(1.0)                                     # last move settles
+
+    comm_bridge.current_mode = 'fsr'
+    n = int(FSR_SECONDS * FSR_RATE)
+    print(f'  fsr path: {n} fsr/finger readings at {FSR_RATE}/s')
+    for k in range(n):
+        x = 1 - abs(2 * k / (n - 1) - 1)                # 0 → 1 → 0
+        m1, m2 = (round(a + (b - a) * x) for a, b in FSR_SWEEP)
+        broker.publish(comm_bridge.TOPIC_FINGER, json.dumps({'m1': m1, 'm2': m2}))
+        time.sleep(1 / FSR_RATE)
+    time.sleep(1.0)
+    alive = owner._worker.is_alive()
+    owner.stop()
+    time.sleep(0.2)                                     # last spans delivered
+    broker.close()
+    print()
+
+    problems = []
+    for origin in ('inference_server', 'comm_bridge'):
+        print_breakdown(collector, origin, f'From {origin}')
+        traces, reached = reached_telemetry(collector, origin)
+        print(f'  {reached}/{traces} traces reached motor/telemetry (others superseded by a newer goal)\n')
+        if not reached:
+            problems.append(f'no trace from {origin} reached motor/telemetry')
+    if not alive:
+        problems.append('bus owner thread died')
+    if out:
+        collector.write_chrome_trace(out)
+        print(f'Chrome trace → {out}')
+
+    if problems:
+        for p in problems:
+            print(f'  [!] {p}')
+        sys.exit(1)
+    print('  [ok] traces followed both paths from origin to motor telemetry')
@@ -20,16 +20,17 @@ New trials are appended by load-concatenate-save.
 
 Usage:
   python collect_data.py
+  python collect_data.py --source synthetic:grip=palm   # no armband (load / soak testing)
 '''
 
 import threading
-import queue
 import time
 import os
 import struct
 import numpy as np
 
-from pyomyo import Myo, emg_mode
+from emg_ring import SampleRing
+from emg_source import open_source, source_spec
 
 # ── Configuration ─────────────────────────────────────────────────────────────
 
@@ -50,25 +51,25 @@ RELEASE_DURATION = 2.0   # seconds
 SAMPLE_RATE      = 200   # Hz (FILTERED mode)
 
 DATA_DIR = "data_collection"
+EMG_SOURCE = source_spec()  # --source / $EMG_SOURCE: myo, replay:<file.npy>, synthetic[:opts]
 
-INIT_SAMPLES    = int(INIT_DURATION    * SAMPLE_RATE)  # 300
-STEADY_SAMPLES  = int(STEADY_DURATION  * SAMPLE_RATE)  # 600
-RELEASE_SAMPLES = int(RELEASE_DURATION * SAMPLE_RATE)  # 300
+INIT_SAMPLES    = int(INIT_DURATION    * SAMPLE_RATE)  # 400
+STEADY_SAMPLES  = int(STEADY_DURATION  * SAMPLE_RATE)  # 800
+RELEASE_SAMPLES = int(RELEASE_DURATION * SAMPLE_RATE)  # 400
 
 # ── Myo background thread ─────────────────────────────────────────────────────
 
-_emg_queue  = queue.Queue()
+# A phase is read in one go once it is all in: the ring holds twice the
+# longest phase, so the packets arriving while the read wakes find room
+_emg_ring   = SampleRing(capacity=2 * max(INIT_SAMPLES, STEADY_SAMPLES, RELEASE_SAMPLES))
 _stop_event = threading.Event()
 
 
 def _myo_worker():
-    m = Myo(mode=emg_mode.FILTERED)
+    m = open_source(EMG_SOURCE)
     m.connect()
 
-    def on_emg(emg, moving):
-        _emg_queue.put(np.abs(np.array(emg, dtype=np.float32)))
-
-    m.add_emg_handler(on_emg)
+    m.add_emg_handler(lambda emg, moving: _emg_ring.put(emg))
     m.set_leds([128, 128, 0], [128, 128, 0])
     m.vibrate(1)
 
@@ -84,23 +85,26 @@ def _myo_worker():
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
-def _flush_queue():
-    while not _emg_queue.empty():
-        try:
-            _emg_queue.get_nowait()
-        except queue.Empty:
-            break
+def _flush_ring():
+    _emg_ring.clear()
 
 
 def _collect(n_samples):
-    '''Block until exactly n_samples have been received from the Myo.'''
-    samples = []
-    while len(samples) < n_samples:
-        try:
-            samples.append(_emg_queue.get(timeout=0.5))
-        except queue.Empty:
+    '''Block until exactly n_samples have been received from the Myo (rectified).'''
+    samples = np.empty((n_samples, _emg_ring.channels), dtype=np.float32)
+    dropped = _emg_ring.dropped
+    n = 0
+    while n < n_samples:
+        # Sleep until the rest of the phase is in (or 0.5s), then copy it in one go
+        got = _emg_ring.read(samples[n:], timeout=0.5, min_count=n_samples - n)
+        if not got:
             print("  Warning: no EMG data received — check Myo connection.")
-    return np.array(samples, dtype=np.float32)
+        n += got
+    lost = _emg_ring.dropped - dropped
+    if lost:
+        # the recording has a gap: the ring overflowed while this phase was read
+        print(f"  Warning: {lost} EMG samples dropped during this phase — consider redoing the trial.")
+    return np.abs(samples, out=samples)
 
 
 def _countdown(seconds):
@@ -144,7 +148,7 @@ def _run_trial(class_name):
     print("  Starting in:", end=' ')
     _countdown(3)
 
-    _flush_queue()
+    _flush_ring()
 
     print(f"\n  [INITIATION]  Transition into {class_name}...  ({INIT_DURATION}s)")
     init_data = _collect(INIT_SAMPLES)
@@ -173,7 +177,7 @@ def _run_trial(class_name):
     total = INIT_DURATION + STEADY_DURATION + RELEASE_DURATION
     print(f"\n  [REST]  Relax for {total:.0f}s — collecting rest data automatically...")
 
-    _flush_queue()
+    _flush_ring()
     rest_init    = _collect(INIT_SAMPLES)
     rest_steady  = _collect(STEADY_SAMPLES)
     rest_release = _collect(RELEASE_SAMPLES)
@@ -197,6 +201,7 @@ def main():
     print(f"  Classes : {', '.join(CLASSES)}")
     print(f"  Phases  : init {INIT_DURATION}s  |  steady {STEADY_DURATION}s  |  release {RELEASE_DURATION}s")
     print(f"  Output  : {DATA_DIR}/")
+    print(f"  Source  : {EMG_SOURCE}")
     print("═" * 52)
 
     myo_thread = threading.Thread(target=_myo_worker, daemon=True)
@@ -3,6 +3,8 @@ import time
 import json
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
+from readiness import notify_ready
+from tracing import TRACE_ENABLED, Tracer, new_trace, with_trace
 
 load_dotenv()
 
@@ -13,12 +15,14 @@ TOPIC_FINGER = 'fsr/finger'
 TOPIC_MOTOR  = "motor/command"
 TOPIC_SYS_MODE = "system/control_mode"
 TOPIC_LOGS = "system/logs"
+SUBSCRIPTIONS = [TOPIC_TOGGLE, TOPIC_FINGER, TOPIC_SYS_MODE]
 
 current_mode = "ui" 
+tracer = Tracer("comm_bridge")
 
-def send_motor_command(client, m1_position, m2_position):
-    client.publish(TOPIC_MOTOR, json.dumps({"id": 1, "position": m1_position}))
-    client.publish(TOPIC_MOTOR, json.dumps({"id": 2, "position": m2_position}))
+def send_motor_command(client, m1_position, m2_position, trace=None):
+    # both motors in one message: the driver writes them in one sync write
+    client.publish(TOPIC_MOTOR, json.dumps(with_trace({"goals": {1: m1_position, 2: m2_position}}, trace)))
 
 def on_message(client, userdata, msg):
     global current_mode
@@ -36,24 +40,34 @@ def on_message(client, userdata, msg):
       
     elif msg.topic == TOPIC_FINGER:
         if current_mode == "fsr":
+            t_recv = time.time()
+            # the FSR reading enters the system here (the ESP32 clock is not synced)
+            trace = new_trace(t_recv) if TRACE_ENABLED else None
             try:
                 data = json.loads(payload)
                 # print(f"[fsr] {data}")
-                send_motor_command(client, data["m1"], data["m2"])
+                send_motor_command(client, data["m1"], data["m2"], trace)
             except (json.JSONDecodeError, KeyError):
-                pass
+                return
+            tracer.record(trace, "bridge", t_recv, time.time())
+            tracer.flush(client.publish)
 
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-client.connect(MQTT_BROKER, MQTT_PORT, 60)
+def main():
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.connect(MQTT_BROKER, MQTT_PORT, 60)
 
-client.on_message = on_message
-client.subscribe([(TOPIC_TOGGLE, 0), (TOPIC_FINGER, 0), (TOPIC_SYS_MODE, 0)])
+    client.on_message = on_message
+    client.subscribe([(topic, 0) for topic in SUBSCRIPTIONS])
 
-print("Connected to MQTT")
-print("Started... listening for sensors")
-client.publish(TOPIC_LOGS, "[FSR] Ready")
+    print("Connected to MQTT")
+    print("Started... listening for sensors")
+    client.publish(TOPIC_LOGS, "[FSR] Ready")
+    notify_ready("comm_bridge", client)
 
-try:
-    client.loop_forever()
-except KeyboardInterrupt:
-    print("\nStopping...")
\ No newline at end of file
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,185 @@
+'''
+Single-process Control Runtime
+
+Optional replacement for running comm_bridge.py, myo_controller.py,
+finger_data.py and run_inference.py as four processes with four MQTT
+clients. Here they are components of one asyncio event loop, wired by an
+in-process pub/sub bus (LocalBus) that keeps the MQTT topic names:
+
+  bridge       comm_bridge.on_message       fsr/finger → motor/command
+  myo          myo_controller.on_message    sensor/myo/state → motor/command
+  dashboard    finger_data (websocket server on ws://localhost:8765 + its MQTT handler)
+  inference    inference_server.InferenceServer on one stream, publishing
+               sensor/myo/state (worker thread; source as in run_inference:
+               --source / $EMG_SOURCE, default myo; --source none leaves
+               it to a separate run_inference.py). --rest-gate and
+               --early-exit[=delta] work as in run_inference; not carried
+               over: the stored calibration profile (--user / --armband —
+               every start calibrates for CALIB_SEC) and the per-stage
+               latency on system/metrics/inference (server-wide metrics go
+               to system/metrics/inference_server, calibration events to
+               system/metrics/calibration/myo)
+
+Each component's handler is the one its script uses, called on the loop
+thread with the script's (client, userdata, msg) signature, so the
+components stay standalone scripts too. A publish reaches every local
+subscriber on the next loop iteration; only EXPORT_TOPICS (motor/command
+for the driver and the finger ESP32, trace spans) go out to the broker,
+and only the topics the components subscribe to come in from it (ESP32
+sensors, motor telemetry, logs). A grip change reaches the motor driver
+after one broker crossing instead of two.
+
+Run: python control_runtime.py [--source myo|none|<source spec>] [--rest-gate] [--early-exit[=delta]] [--pruned]
+     (start_system.py --single-process starts it instead of the four nodes)
+'''
+
+import asyncio
+import os
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv
+
+import comm_bridge
+import finger_data
+import myo_controller
+from emg_source import source_spec
+from readiness import notify_ready
+from tracing import TOPIC_SPANS
+
+load_dotenv()
+
+MQTT_BROKER   = os.getenv("MQTT_BROKER", "localhost")
+MQTT_PORT     = int(os.getenv("MQTT_PORT", 1883))
+EXPORT_TOPICS = (comm_bridge.TOPIC_MOTOR, TOPIC_SPANS)    # everything else stays in-process
+
+# paho's message as seen by the handlers: .topic, .payload (bytes)
+Message = namedtuple('Message', 'topic payload')
+
+
+# ── In-process bus ────────────────────────────────────────────────────────────
+
+class LocalBus:
+    '''
+    Topic → handlers, dispatched on one event loop. publish() is safe from
+    any thread (the inference worker, paho's network thread) and never
+    calls a handler re-entrantly: delivery is scheduled on the loop.
+    Topics in `export` are also handed to `external` (a paho client).
+    '''
+
+    def __init__(self, loop, external=None, export=EXPORT_TOPICS):
+        self.loop     = loop
+        self.external = external
+        self.export   = set(export)
+        self.handlers = defaultdict(list)
+        self.counts   = Counter()       # local, exported, imported, errors
+
+    def subscribe(self, topics, handler):
+        for topic in topics:
+            self.handlers[topic].append(handler)
+
+    def topics(self):
+        return sorted(self.handlers)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if topic in self.export and self.external is not None:
+            self.external.publish(topic, payload)
+            self.counts['exported'] += 1
+        if topic in self.handlers:
+            self.loop.call_soon_threadsafe(self._dispatch, Message(topic, payload))
+
+    def deliver(self, client, userdata, msg):
+        # paho on_message for the external client: broker → local subscribers
+        self.counts['imported'] += 1
+        self.loop.call_soon_threadsafe(self._dispatch, Message(msg.topic, msg.payload))
+
+    def _dispatch(self, msg):
+        for handler in self.handlers[msg.topic]:
+            self.counts['local'] += 1
+            try:
+                handler(self, None, msg)
+            except Exception as e:
+                self.counts['errors'] += 1
+                print(f"[Runtime] {msg.topic} handler failed: {e}")
+
+
+# ── Components ────────────────────────────────────────────────────────────────
+
+def attach_nodes(bus):
+    '''Subscribe the bridge, myo controller and dashboard handlers to the bus.'''
+    bus.subscribe(comm_bridge.SUBSCRIPTIONS, comm_bridge.on_message)
+    bus.subscribe(myo_controller.SUBSCRIPTIONS, myo_controller.on_message)
+    bus.subscribe(finger_data.SUBSCRIPTIONS, finger_data.on_mqtt_message)
+    finger_data.mqtt_client = bus       # the websocket handler publishes UI commands here
+
+
+def start_inference(bus, spec):
+    '''InferenceServer on one stream publishing sensor/myo/state to the bus; returns a stop().'''
+    from emg_features import FEATURE_DIM
+    from flat_forest import early_exit_arg, load_for_inference
+    from inference_server import CLASSES, MODEL_DIR, InferenceServer
+    from model_reload import TOPIC_MODEL_CMD, ModelReloader
+    from rest_gate import gate_enabled, load_rest_gate
+
+    model  = load_for_inference(MODEL_DIR, classes=CLASSES)
+    server = InferenceServer(model, publish=bus.publish, early_exit=early_exit_arg(),
+                             gate=load_rest_gate(MODEL_DIR) if gate_enabled() else None)
+    server.reloader = ModelReloader(MODEL_DIR, model, CLASSES, FEATURE_DIM, publish=bus.publish)
+    server.reloader.start_watching()
+    bus.subscribe([TOPIC_MODEL_CMD], lambda c, u, msg: server.reloader.on_command(msg.payload.decode()))
+    stream = server.add_stream('myo', spec)
+    stream.topic = myo_controller.TOPIC_MYO_STATE       # the topic run_inference publishes
+
+    stop = threading.Event()
+    worker = threading.Thread(target=server.serve, args=(stop,), daemon=True, name='inference')
+    worker.start()
+
+    def shutdown():
+        stop.set()
+        worker.join(timeout=2)
+        server.reloader.stop()
+        server.stop()
+    return shutdown
+
+
+async def run(emg='myo'):
+    loop     = asyncio.get_running_loop()
+    external = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    bus      = LocalBus(loop, external)
+    attach_nodes(bus)
+    stop_inference = start_inference(bus, emg) if emg != 'none' else None
+
+    external.on_message = bus.deliver
+    external.on_connect = lambda client, userdata, flags, reason_code, properties: \
+        client.subscribe([(topic, 0) for topic in bus.topics()])
+    try:
+        external.connect(MQTT_BROKER, MQTT_PORT, 60)
+        external.loop_start()
+    except Exception as e:
+        print(f"Warning: MQTT not connected in control_runtime.py: {e}")
+    bus.publish(comm_bridge.TOPIC_LOGS, "[Runtime] Ready")
+    print(f"Runtime up: {len(bus.topics())} topics in-process, exporting {', '.join(EXPORT_TOPICS)}"
+          + ("" if stop_inference else " (sensor/myo/state from run_inference.py)"))
+    try:
+        # websocket server, runs until cancelled
+        await finger_data.main(ready=lambda: notify_ready('control_runtime', external))
+    finally:
+        if stop_inference is not None:
+            stop_inference()
+        external.loop_stop()
+        external.disconnect()
+
+
+def main():
+    emg = source_spec()
+    try:
+        asyncio.run(run(emg))
+    except KeyboardInterrupt:
+        print("\nStopping...")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''
+Decision Smoothing and Dwell Filter
+
+The state machine between the per-window model output and the published
+grip class, shared by run_inference.py (live, wall clock) and
+replay_inference.py (recorded trials, simulated clock), with the decision
+cadence STRIDE they (and inference_server.py) share:
+
+  1. Majority vote over the last smooth_n predictions
+  2. Dwell time — the committed class only changes after the voted
+     candidate has held for dwell_time seconds
+
+update() takes the caller's clock, so the same code runs in real time or
+as fast as the CPU allows.
+'''
+
+from collections import deque
+
+import numpy as np
+
+STRIDE     = 20    # samples between decisions (20 → every 100ms at 200 Hz); any value ≥ 1 works
+SMOOTH_N   = 5     # majority-vote over last N predictions
+DWELL_TIME = 0.3   # seconds candidate must hold before becoming committed class
+
+
+class DecisionFilter:
+
+    def __init__(self, classes, smooth_n=SMOOTH_N, dwell_time=DWELL_TIME, now=0.0):
+        self.classes    = list(classes)
+        self.dwell_time = dwell_time
+        self.recent     = deque(maxlen=smooth_n)
+        self.smoothed   = 0                   # index of the voted class
+        self.committed  = self.classes[0]     # currently active output class
+        self.candidate  = self.classes[0]     # class being evaluated
+        self.candidate_since = now
+
+    def update(self, pred, now):
+        '''Feed one class index predicted at time now; returns the committed label.'''
+        self.recent.append(pred)
+        self.smoothed = int(np.bincount(self.recent, minlength=len(self.classes)).argmax())
+        label = self.classes[self.smoothed]
+        if label != self.candidate:
+            self.candidate       = label
+            self.candidate_since = now
+        elif now - self.candidate_since >= self.dwell_time:
+            self.committed = self.candidate
+        return self.committed
+
+    @property
+    def pending(self):
+        return self.candidate != self.committed
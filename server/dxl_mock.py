@@ -0,0 +1,414 @@
+'''
+Mock Dynamixel Bus (Protocol 2.0)
+
+MockPort stands in for dynamixel_sdk.PortHandler: the real PacketHandler /
+GroupSyncWrite / GroupSyncRead build and parse packets exactly as on
+hardware, and MockPort answers them from a per-motor control table
+(X-series addresses) instead of a serial port. Every instruction packet
+is one bus transaction; the port counts them by instruction and models
+the time they occupy the bus and the host:
+
+  bus time  — instruction bytes + each status packet's Return Delay Time
+              and bytes, at BITS_PER_BYTE / baud rate (8N1 → 10 µs per byte at 1 Mbps)
+  host time — bus time + one USB-serial turnaround (USB_LATENCY_US) per
+              transaction that waits for status packets
+
+Supported instructions: PING, READ, WRITE, SYNC_READ, SYNC_WRITE. By
+default a write to Goal Position lands in Present Position immediately.
+With motion=True the motors move instead, as an XL430 in velocity-based
+profile mode does:
+
+  - nothing moves until Torque Enable (64) is 1; EEPROM writes (Operating
+    Mode and below 64) are refused with an Access Error while it is
+  - Position Control Mode (3) refuses goals outside 0-4095 with a Data
+    Range Error; Extended Position (4) takes the driver's 3000-6900
+  - goals are approached under Profile Velocity (112, 0.229 rpm units,
+    capped by Velocity Limit) and Profile Acceleration (108, 214.577
+    rev/min² units; 0 = unlimited), re-planned from the current speed when
+    a new goal arrives; Moving (122), Present Velocity (128) and Present
+    Position (132) follow the motion, integrated in MOTION_STEP steps
+  - arrivals records (time, id, goal) when a motor comes to rest on its goal
+
+error_rate injects comm errors: that share of transactions is lost on the
+wire (the motors never see the instruction — a sync write's goals vanish
+silently, a read times out) or has its status packet corrupted (bad CRC,
+the write still happened). A missing status packet costs the host the
+SDK's packet timeout (LATENCY_TIMER × 2 + 2 ms + bytes), as on hardware.
+
+Time is virtual by default: nothing sleeps, so a benchmark of thousands
+of transactions runs in milliseconds, and the clock (now()) is the host
+time spent so far plus advance(seconds). With realtime=True every
+transaction sleeps for its host time instead (the caller holds the port
+as long as on hardware) and the clock is time.perf_counter(). goal_log
+records (time, id, goal) for every Goal Position write.
+
+  port = MockPort([1, 2], motion=True, error_rate=0.01, initial_position={1: 4300, 2: 4000})
+  port.registers[1]       # bytearray control table of motor 1
+  port.stats()            # transactions, bytes, bus_ms, host_ms, by_instruction, errors
+
+Run: python dxl_mock.py   (self-check: ping, read/write, sync read/write, motion and errors through the SDK)
+'''
+
+import math
+import random
+import time
+from collections import Counter
+
+from dynamixel_sdk import (BROADCAST_ID, COMM_RX_CORRUPT, COMM_RX_TIMEOUT, COMM_SUCCESS, DXL_HIBYTE, DXL_LOBYTE,
+                           DXL_MAKEWORD, INST_PING, INST_READ, INST_SYNC_READ, INST_SYNC_WRITE, INST_WRITE,
+                           PKT_ID, PKT_INSTRUCTION, PKT_LENGTH_H, PKT_LENGTH_L, PKT_PARAMETER0, PacketHandler,
+                           PortHandler)
+from dynamixel_sdk.port_handler import LATENCY_TIMER
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+BITS_PER_BYTE    = 10       # start + 8 data + stop
+RETURN_DELAY_US  = 500      # X-series factory Return Delay Time (250 × 2 µs)
+USB_LATENCY_US   = 1000     # USB-serial turnaround per reply (FTDI latency timer at 1 ms)
+CONTROL_TABLE    = 147      # bytes of X-series control table (EEPROM + RAM)
+MODEL_NUMBER     = 1060     # XL430-W250 (PING reply)
+FIRMWARE_VERSION = 45
+MOTION_STEP      = 0.001    # seconds per motion integration step
+
+TICKS_PER_REV      = 4096
+VELOCITY_UNIT      = 0.229 * TICKS_PER_REV / 60        # ticks/s per Profile Velocity unit
+ACCELERATION_UNIT  = 214.577 * TICKS_PER_REV / 3600    # ticks/s² per Profile Acceleration unit
+VELOCITY_LIMIT     = 265                               # XL430 factory Velocity Limit (units of 0.229 rpm)
+
+ADDR_MODEL_NUMBER         = 0
+ADDR_OPERATING_MODE       = 11
+ADDR_VELOCITY_LIMIT       = 44
+ADDR_TORQUE_ENABLE        = 64      # first RAM address: below it is EEPROM
+ADDR_PROFILE_ACCELERATION = 108
+ADDR_PROFILE_VELOCITY     = 112
+ADDR_GOAL_POSITION        = 116
+ADDR_MOVING               = 122
+ADDR_PRESENT_VELOCITY     = 128
+ADDR_PRESENT_POSITION     = 132
+
+MODE_POSITION, MODE_EXTENDED_POSITION = 3, 4
+ERR_DATA_RANGE, ERR_ACCESS = 0x04, 0x07              # status packet error field
+
+INSTRUCTIONS = {INST_PING: 'ping', INST_READ: 'read', INST_WRITE: 'write',
+                INST_SYNC_READ: 'sync_read', INST_SYNC_WRITE: 'sync_write'}
+
+def profile_time(distance, profile_velocity, profile_acceleration, velocity_limit=VELOCITY_LIMIT):
+    '''Seconds for a move of `distance` ticks from rest under a velocity-based trapezoidal profile.'''
+    v = (min(profile_velocity, velocity_limit) if profile_velocity else velocity_limit) * VELOCITY_UNIT
+    if not profile_acceleration:
+        return distance / v
+    a = profile_acceleration * ACCELERATION_UNIT
+    return distance / v + v / a if distance >= v * v / a else 2 * math.sqrt(distance / a)
+
+
+# ── Port ──────────────────────────────────────────────────────────────────────
+
+class MockPort(PortHandler):
+
+    def __init__(self, ids, baudrate=1000000, return_delay_us=RETURN_DELAY_US,
+                 usb_latency_us=USB_LATENCY_US, realtime=False, motion=False, error_rate=0.0, seed=0,
+                 initial_position=0):
+        super().__init__('mock')
+        self.baudrate        = baudrate
+        self.return_delay_us = return_delay_us
+        self.usb_latency_us  = usb_latency_us
+        self.realtime        = realtime
+        self.motion          = motion
+        self.error_rate      = error_rate
+        if not isinstance(initial_position, dict):
+            initial_position = dict.fromkeys(ids, initial_position)
+        self.registers = {dxl_id: bytearray(CONTROL_TABLE) for dxl_id in ids}
+        for dxl_id, regs in self.registers.items():
+            regs[ADDR_MODEL_NUMBER:ADDR_MODEL_NUMBER + 2]     = MODEL_NUMBER.to_bytes(2, 'little')
+            regs[ADDR_OPERATING_MODE]                         = MODE_POSITION
+            regs[ADDR_VELOCITY_LIMIT:ADDR_VELOCITY_LIMIT + 4] = VELOCITY_LIMIT.to_bytes(4, 'little')
+            for addr in (ADDR_GOAL_POSITION, ADDR_PRESENT_POSITION):
+                regs[addr:addr + 4] = initial_position[dxl_id].to_bytes(4, 'little', signed=True)
+        self._state = {dxl_id: [float(initial_position[dxl_id]), 0.0] for dxl_id in ids}   # position, velocity
+        self._ph = PacketHandler(2.0)     # CRC and byte stuffing, same code as the host side
+        self._rx = bytearray()
+        self._rng = random.Random(seed)
+        self._timeout_us = 0.0
+        self._idle_s = 0.0
+        self._host_base = 0.0
+        self.reset_stats()
+        self._moved_to = self.now()
+
+    def now(self):
+        return time.perf_counter() if self.realtime else (self._host_base + self.host_us) / 1e6 + self._idle_s
+
+    def advance(self, seconds):
+        # virtual time: let the motors move for `seconds` without bus traffic
+        self._idle_s += seconds
+
+    def reset_stats(self):
+        self._host_base    += getattr(self, 'host_us', 0.0)     # the virtual clock keeps running
+        self.transactions   = 0
+        self.tx_bytes       = 0
+        self.rx_bytes       = 0
+        self.bus_us         = 0.0
+        self.host_us        = 0.0
+        self.by_instruction = Counter()
+        self.errors         = Counter()       # injected: lost, corrupt; seen by the host: timeout
+        self.goal_log       = []
+        self.arrivals       = []
+
+    def stats(self):
+        return {'transactions': self.transactions, 'tx_bytes': self.tx_bytes, 'rx_bytes': self.rx_bytes,
+                'bus_ms': self.bus_us / 1000, 'host_ms': self.host_us / 1000,
+                'by_instruction': dict(self.by_instruction), 'errors': dict(self.errors)}
+
+    def byte_us(self, n):
+        return n * BITS_PER_BYTE * 1e6 / self.baudrate
+
+    # ── PortHandler interface ─────────────────────────────────────────────
+
+    def openPort(self):
+        self.is_open = True
+        return True
+
+    def closePort(self):
+        self.is_open = False
+
+    def clearPort(self):
+        # txPacket flushes what is left of an earlier reply (e.g. after a corrupt status packet)
+        self._rx.clear()
+
+    def setBaudRate(self, baudrate):
+        self.baudrate = baudrate
+        return True
+
+    def getBytesAvailable(self):
+        return len(self._rx)
+
+    def readPort(self, length):
+        data = bytes(self._rx[:length])
+        del self._rx[:length]
+        return data
+
+    def writePort(self, packet):
+        self._handle(list(packet))
+        return len(packet)
+
+    def setPacketTimeout(self, packet_length):
+        # same budget as PortHandler.setPacketTimeout
+        self._timeout_us = self.byte_us(packet_length) + (LATENCY_TIMER * 2.0 + 2.0) * 1000
+
+    def setPacketTimeoutMillis(self, msec):
+        self._timeout_us = msec * 1000
+
+    def isPacketTimeout(self):
+        # Replies are queued whole by writePort, so an empty buffer means none is coming:
+        # the host has waited out the whole packet timeout
+        if self._rx:
+            return False
+        self.errors['timeout'] += 1
+        self.host_us += self._timeout_us
+        if self.realtime:
+            time.sleep(self._timeout_us / 1e6)
+        return True
+
+    # ── Bus side ──────────────────────────────────────────────────────────
+
+    def _handle(self, packet):
+        start, host_start = self.bus_us, self.host_us
+        self.transactions += 1
+        self.tx_bytes     += len(packet)
+        self.bus_us       += self.byte_us(len(packet))
+        packet = self._ph.removeStuffing(packet)
+        inst   = packet[PKT_INSTRUCTION]
+        self.by_instruction[INSTRUCTIONS.get(inst, inst)] += 1
+        if self.motion:
+            self._move(self.now())
+
+        fault = None
+        if self.error_rate and self._rng.random() < self.error_rate:
+            fault = self._rng.choice(('lost', 'corrupt'))
+            self.errors[fault] += 1
+        if fault == 'lost':
+            self.host_us += self.bus_us - start
+            if self.realtime:
+                time.sleep((self.host_us - host_start) / 1e6)
+            return
+
+        dxl_id = packet[PKT_ID]
+        length = DXL_MAKEWORD(packet[PKT_LENGTH_L], packet[PKT_LENGTH_H])
+        params = packet[PKT_PARAMETER0:PKT_PARAMETER0 + length - 3]
+        replies = []
+        if inst == INST_PING:
+            ids = self.registers if dxl_id == BROADCAST_ID else [dxl_id]
+            replies = [(i, [DXL_LOBYTE(MODEL_NUMBER), DXL_HIBYTE(MODEL_NUMBER), FIRMWARE_VERSION])
+                       for i in ids if i in self.registers]
+        elif inst == INST_READ and dxl_id in self.registers:
+            addr, n = DXL_MAKEWORD(params[0], params[1]), DXL_MAKEWORD(params[2], params[3])
+            replies = [(dxl_id, list(self.registers[dxl_id][addr:addr + n]))]
+        elif inst == INST_WRITE:
+            error = 0
+            for i in (self.registers if dxl_id == BROADCAST_ID else [dxl_id]):
+                if i in self.registers:
+                    error = self._write(i, DXL_MAKEWORD(params[0], params[1]), params[2:])
+            if dxl_id in self.registers:
+                replies = [(dxl_id, [], error)]
+        elif inst == INST_SYNC_READ:
+            addr, n = DXL_MAKEWORD(params[0], params[1]), DXL_MAKEWORD(params[2], params[3])
+            replies = [(i, list(self.registers[i][addr:addr + n])) for i in params[4:] if i in self.registers]
+        elif inst == INST_SYNC_WRITE:
+            addr, n = DXL_MAKEWORD(params[0], params[1]), DXL_MAKEWORD(params[2], params[3])
+            for k in range(4, len(params), n + 1):
+                if params[k] in self.registers:
+                    self._write(params[k], addr, params[k + 1:k + 1 + n])
+
+        for reply_id, data, *error in replies:
+            self._status(reply_id, data, *error, corrupt=fault == 'corrupt')
+        self.host_us += self.bus_us - start + (self.usb_latency_us if replies else 0.0)
+        if self.realtime:
+            time.sleep((self.host_us - host_start) / 1e6)
+
+    def _write(self, dxl_id, addr, data):
+        # returns the status packet error field (0: written)
+        regs = self.registers[dxl_id]
+        goal = addr <= ADDR_GOAL_POSITION < addr + len(data)
+        if self.motion:
+            if addr < ADDR_TORQUE_ENABLE and regs[ADDR_TORQUE_ENABLE]:
+                return ERR_ACCESS
+            if goal and regs[ADDR_OPERATING_MODE] == MODE_POSITION:
+                new = bytearray(regs[addr:addr + len(data)])
+                new[:] = bytes(data)
+                offset = ADDR_GOAL_POSITION - addr
+                if not 0 <= int.from_bytes(new[offset:offset + 4], 'little', signed=True) < TICKS_PER_REV:
+                    return ERR_DATA_RANGE
+        regs[addr:addr + len(data)] = bytes(data)
+        if goal:
+            if not self.motion:
+                regs[ADDR_PRESENT_POSITION:ADDR_PRESENT_POSITION + 4] = regs[ADDR_GOAL_POSITION:ADDR_GOAL_POSITION + 4]
+            self.goal_log.append((self.now(), dxl_id,
+                                  int.from_bytes(regs[ADDR_GOAL_POSITION:ADDR_GOAL_POSITION + 4], 'little')))
+        return 0
+
+    # ── Motion ────────────────────────────────────────────────────────────
+
+    def _move(self, until):
+        # integrate every motor's profile from the last update to `until`
+        start, self._moved_to = self._moved_to, until
+        for dxl_id, state in self._state.items():
+            regs = self.registers[dxl_id]
+            goal = int.from_bytes(regs[ADDR_GOAL_POSITION:ADDR_GOAL_POSITION + 4], 'little', signed=True)
+            position, velocity = state
+            if not regs[ADDR_TORQUE_ENABLE] or (position == goal and velocity == 0.0):
+                state[1] = 0.0
+                self._present(regs, position, 0.0, moving=False)
+                continue
+            limit  = int.from_bytes(regs[ADDR_VELOCITY_LIMIT:ADDR_VELOCITY_LIMIT + 4], 'little')
+            v_unit = int.from_bytes(regs[ADDR_PROFILE_VELOCITY:ADDR_PROFILE_VELOCITY + 4], 'little')
+            a_unit = int.from_bytes(regs[ADDR_PROFILE_ACCELERATION:ADDR_PROFILE_ACCELERATION + 4], 'little')
+            v_max  = (min(v_unit, limit) if v_unit else limit) * VELOCITY_UNIT
+            a_max  = a_unit * ACCELERATION_UNIT if a_unit else math.inf
+
+            t = start
+            while t < until:
+                dt = min(MOTION_STEP, until - t)
+                t += dt
+                remaining = goal - position
+                direction = math.copysign(1.0, remaining)
+                if velocity * direction > 0 and velocity ** 2 / (2 * a_max) >= abs(remaining) - abs(velocity) * dt:
+                    # braking: the deceleration that stops exactly on the goal
+                    new = velocity - direction * min(velocity ** 2 / (2 * abs(remaining)) if remaining else math.inf,
+                                                         abs(velocity) / dt) * dt
+                else:
+                    target, step = direction * v_max, a_max * dt
+                    new = target if abs(target - velocity) <= step else velocity + math.copysign(step, target - velocity)
+                position += (velocity + new) / 2 * dt
+                velocity = new
+                if (goal - position) * direction <= 0 or (velocity * direction <= 0 and abs(goal - position) < 0.5):
+                    position, velocity = float(goal), 0.0
+                    self.arrivals.append((t, dxl_id, goal))
+                    break
+            state[0], state[1] = position, velocity
+            self._present(regs, position, velocity, moving=velocity != 0.0)
+
+    @staticmethod
+    def _present(regs, position, velocity, moving):
+        regs[ADDR_MOVING] = int(moving)
+        regs[ADDR_PRESENT_VELOCITY:ADDR_PRESENT_VELOCITY + 4] = \
+            int(velocity / VELOCITY_UNIT).to_bytes(4, 'little', signed=True)
+        regs[ADDR_PRESENT_POSITION:ADDR_PRESENT_POSITION + 4] = round(position).to_bytes(4, 'little', signed=True)
+
+    def _status(self, dxl_id, data, error=0, corrupt=False):
+        length = len(data) + 4                      # INST ERR CRC_L CRC_H
+        packet = [0xFF, 0xFF, 0xFD, 0x00, dxl_id, DXL_LOBYTE(length), DXL_HIBYTE(length), 0x55, error] \
+            + data + [0, 0]
+        packet = self._ph.addStuffing(packet)
+        total  = DXL_MAKEWORD(packet[PKT_LENGTH_L], packet[PKT_LENGTH_H]) + 7
+        crc    = self._ph.updateCRC(0, packet, total - 2)
+        packet[total - 2], packet[total - 1] = DXL_LOBYTE(crc), DXL_HIBYTE(crc)
+        if corrupt:
+            packet[total - 1] ^= 0xFF
+        self._rx      += bytes(packet[:total])
+        self.rx_bytes += total
+        self.bus_us   += self.return_delay_us + self.byte_us(total)
+
+
+# ── Self-check ────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    from dynamixel_sdk import GroupSyncRead, GroupSyncWrite
+
+    port = MockPort([1, 2])
+    ph   = PacketHandler(2.0)
+    port.openPort()
+
+    model, result, _ = ph.ping(port, 1)
+    assert result == COMM_SUCCESS and model == MODEL_NUMBER, (model, result)
+    assert ph.write4ByteTxRx(port, 1, ADDR_GOAL_POSITION, 4095)[0] == COMM_SUCCESS
+    pos, result, _ = ph.read4ByteTxRx(port, 1, ADDR_PRESENT_POSITION)
+    assert result == COMM_SUCCESS and pos == 4095, (pos, result)
+
+    writer = GroupSyncWrite(port, ph, ADDR_GOAL_POSITION, 4)
+    reader = GroupSyncRead(port, ph, ADDR_PRESENT_POSITION, 4)
+    goals  = {1: 3500, 2: 0x00FFFFFD}                # 2's bytes contain FF FF FD: stuffing path
+    for dxl_id, goal in goals.items():
+        writer.addParam(dxl_id, list(goal.to_bytes(4, 'little')))
+        reader.addParam(dxl_id)
+    port.reset_stats()
+    assert writer.txPacket() == COMM_SUCCESS
+    assert reader.txRxPacket() == COMM_SUCCESS
+    for dxl_id, goal in goals.items():
+        assert reader.getData(dxl_id, ADDR_PRESENT_POSITION, 4) == goal
+
+    s = port.stats()
+    print(f'  sync write + sync read: {s["transactions"]} transactions, {s["tx_bytes"]} B out, '
+          f'{s["rx_bytes"]} B in, bus {s["bus_ms"]:.3f} ms, host {s["host_ms"]:.3f} ms')
+
+    # motion: torque gates motion and EEPROM, profiles shape it
+    port = MockPort([1], motion=True, initial_position=4000)
+    ph.write4ByteTxRx(port, 1, ADDR_GOAL_POSITION, 4090)
+    port.advance(1.0)
+    assert ph.read4ByteTxRx(port, 1, ADDR_PRESENT_POSITION)[0] == 4000          # torque off: no motion
+    assert ph.write1ByteTxRx(port, 1, ADDR_TORQUE_ENABLE, 1) == (COMM_SUCCESS, 0)
+    assert ph.write1ByteTxRx(port, 1, ADDR_OPERATING_MODE, MODE_EXTENDED_POSITION)[1] == ERR_ACCESS
+    assert ph.write4ByteTxRx(port, 1, ADDR_GOAL_POSITION, 6400)[1] == ERR_DATA_RANGE
+    ph.write1ByteTxRx(port, 1, ADDR_TORQUE_ENABLE, 0)
+    assert ph.write1ByteTxRx(port, 1, ADDR_OPERATING_MODE, MODE_EXTENDED_POSITION) == (COMM_SUCCESS, 0)
+    ph.write4ByteTxRx(port, 1, ADDR_PROFILE_ACCELERATION, 50)
+    ph.write4ByteTxRx(port, 1, ADDR_PROFILE_VELOCITY, 300)
+    ph.write1ByteTxRx(port, 1, ADDR_TORQUE_ENABLE, 1)
+    ph.read4ByteTxRx(port, 1, ADDR_PRESENT_POSITION)                             # settle on 4090 first
+    port.advance(1.0)
+    ph.read4ByteTxRx(port, 1, ADDR_PRESENT_POSITION)
+    start = port.now()
+    ph.write4ByteTxRx(port, 1, ADDR_GOAL_POSITION, 6400)
+    port.advance(0.3)
+    assert ph.read1ByteTxRx(port, 1, ADDR_MOVING)[0] == 1
+    port.advance(2.0)
+    assert ph.read4ByteTxRx(port, 1, ADDR_PRESENT_POSITION)[0] == 6400
+    took, expected = port.arrivals[-1][0] - start, profile_time(6400 - 4090, 300, 50)
+    assert abs(took - expected) < 0.005, (took, expected)
+    print(f'  4090 → 6400 under profile 300/50: {took * 1000:.0f} ms (trapezoid {expected * 1000:.0f} ms)')
+
+    # comm errors: lost instructions time out, corrupted replies fail the CRC
+    port = MockPort([1], error_rate=0.5, seed=1)
+    results = Counter(ph.read4ByteTxRx(port, 1, ADDR_PRESENT_POSITION)[1] for _ in range(200))
+    assert results[COMM_RX_TIMEOUT] and results[COMM_RX_CORRUPT] and results[COMM_SUCCESS], results
+    assert port.errors['timeout'] == port.errors['lost'] == results[COMM_RX_TIMEOUT]
+    print(f'  error_rate 0.5, 200 reads: {dict(port.errors)}, host {port.stats()["host_ms"]:.0f} ms')
+    print('  [ok] mock bus answers ping, read/write and sync read/write; motion and comm errors behave')
@@ -0,0 +1,300 @@
+'''
+Streaming EMG Calibration
+
+Per-channel amplitude scale (std of rectified EMG, floored at 1.0 — the
+same quantity as emg_features.calibration_scale) maintained online with
+Welford running statistics in constant memory, instead of buffering a
+block of samples and calling std once.
+
+  calib = StreamingCalibration()
+  calib.push(raw)                  # every sample, allocation-free
+  calib.ready                      # True once CALIB_SEC of samples are in
+  change = calib.decide(is_rest, now)   # at every model decision
+
+Startup: the first CALIB_SEC of samples (the user is asked to relax) set
+the initial scale — the live loop keeps running meanwhile and only starts
+deciding once ready.
+
+Profiles: a scale saved for this user/armband (save_profile, keyed by
+profile_key) makes the calibration ready immediately. The first
+PROFILE_CHECK_SEC of samples (the user relaxes at startup, as for a fresh
+calibration — not gated on decisions, which a stale profile would skew)
+are then compared with it; if any channel
+is off by more than PROFILE_MAX_DRIFT, decide() reports 'recalibrate' and
+the full CALIB_SEC calibration runs as if there were no profile.
+
+Drift: afterwards, samples are collected per decision interval; they are
+merged into the rest statistics (Chan's parallel form of Welford) only if
+that decision was rest, otherwise discarded. Once DRIFT_MIN_REST rest
+samples are in and DRIFT_INTERVAL seconds have passed since the last
+update, the scale moves towards the rest std by at most DRIFT_MAX_STEP
+per channel, and decide() returns a summary of the change for publishing.
+
+Run: python emg_calibration.py   (checks against calibration_scale, simulates drift
+                                   and a profile check)
+'''
+
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from emg_features import N_CHANNELS, SAMPLE_RATE, calibration_scale
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+CALIB_SEC      = 2       # seconds of rest for the initial scale
+SCALE_FLOOR    = 1.0     # avoid dividing by near-zero noise
+DRIFT_MIN_REST = 2 * SAMPLE_RATE   # rest samples needed per drift update
+DRIFT_INTERVAL = 10.0    # seconds between drift updates (at most)
+DRIFT_MAX_STEP = 0.02    # max relative scale change per update
+DRIFT_DEADBAND = 0.005   # skip updates smaller than this on every channel
+
+PROFILE_PATH      = 'calibration_profiles.json'   # {"<user>@<armband>": {"scale": [...], ...}}
+PROFILE_CHECK_SEC = 1      # seconds of live rest checked against a stored profile
+PROFILE_MAX_DRIFT = 0.25   # recalibrate if any channel differs by more than this
+USER_ENV, ARMBAND_ENV = 'EMG_USER', 'EMG_ARMBAND'
+
+
+# ── Profiles ──────────────────────────────────────────────────────────────────
+
+def _arg(argv, name):
+    for i, arg in enumerate(argv):
+        if arg.startswith(f'--{name}='):
+            return arg.split('=', 1)[1]
+        if arg == f'--{name}' and i + 1 < len(argv):
+            return argv[i + 1]
+    return None
+
+
+def profile_key(source='myo', argv=None):
+    '''
+    '<user>@<armband>': --user / $EMG_USER (default 'default') and --armband /
+    $EMG_ARMBAND (default: the EMG source kind, e.g. 'myo' or 'synthetic').
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    user    = _arg(argv, 'user') or os.getenv(USER_ENV, 'default')
+    armband = _arg(argv, 'armband') or os.getenv(ARMBAND_ENV, source.partition(':')[0])
+    return f'{user}@{armband}'
+
+
+def _read_profiles(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_profile(key, path=PROFILE_PATH, n_channels=N_CHANNELS):
+    '''Stored per-channel scale for key, or None.'''
+    entry = _read_profiles(path).get(key)
+    if not entry or len(entry.get('scale', ())) != n_channels:
+        return None
+    return np.maximum(np.asarray(entry['scale'], dtype=np.float64), SCALE_FLOOR)
+
+
+def save_profile(key, scale, path=PROFILE_PATH):
+    '''Store scale under key (other profiles kept; written atomically).'''
+    profiles = _read_profiles(path)
+    profiles[key] = {'scale': [round(float(v), 4) for v in scale], 'saved': time.time()}
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp, path)
+
+
+class _Welford:
+    '''Running count / mean / M2 per channel (preallocated, merge without allocating).'''
+
+    def __init__(self, n_channels):
+        # Counts are floats: ints above 256 are heap objects, floats come
+        # from the interpreter's free list (see bench_alloc.py)
+        self.n    = 0.0
+        self.mean = np.zeros(n_channels)
+        self.m2   = np.zeros(n_channels)
+        self._delta  = np.zeros(n_channels)
+        self._weight = np.zeros(())
+
+    def clear(self):
+        self.n = 0.0
+        self.mean.fill(0.0)
+        self.m2.fill(0.0)
+
+    def std(self):
+        return np.sqrt(self.m2 / self.n)
+
+    def merge(self, other):
+        '''Chan et al. parallel combination: self ← self ∪ other.'''
+        if not other.n:
+            return
+        n = self.n + other.n
+        d = self._delta
+        np.subtract(other.mean, self.mean, out=d)
+        np.add(self.m2, other.m2, out=self.m2)
+        self._weight[...] = other.n / n
+        np.multiply(d, self._weight, out=d)
+        np.add(self.mean, d, out=self.mean)
+        # δ² · n_a·n_b/n  ==  (δ·n_b/n)² · n·n_a/n_b
+        self._weight[...] = n * self.n / other.n
+        np.multiply(d, d, out=d)
+        np.multiply(d, self._weight, out=d)
+        np.add(self.m2, d, out=self.m2)
+        self.n = n
+
+
+class StreamingCalibration:
+
+    def __init__(self, n_channels=N_CHANNELS, calib_samples=int(CALIB_SEC * SAMPLE_RATE),
+                 min_rest=DRIFT_MIN_REST, interval=DRIFT_INTERVAL, max_step=DRIFT_MAX_STEP,
+                 deadband=DRIFT_DEADBAND, profile=None,
+                 check_samples=int(PROFILE_CHECK_SEC * SAMPLE_RATE), max_drift=PROFILE_MAX_DRIFT):
+        self.calib_samples = calib_samples
+        self.min_rest = min_rest
+        self.interval = interval
+        self.max_step = max_step
+        self.deadband = deadband
+        self.check_samples = check_samples
+        self.max_drift = max_drift
+
+        # With a stored profile: usable at once, verified on the first rest samples
+        self.scale    = np.ones(n_channels) if profile is None else np.array(profile, dtype=np.float64)
+        self.ready    = profile is not None
+        self.checking = profile is not None
+        self.updates  = 0
+        self._pending = _Welford(n_channels)   # samples since the last decision
+        self._rest    = _Welford(n_channels)   # rest samples since the last update
+        self._last_update = None
+
+        # Per-sample scratch; the 0-d count avoids converting an int per ufunc call
+        self._x     = np.zeros(n_channels)
+        self._delta = np.zeros(n_channels)
+        self._tmp   = np.zeros(n_channels)
+        self._count = np.zeros(())
+
+    def push(self, raw):
+        '''raw: (C,) unrectified EMG. Welford update of the pending statistics.'''
+        p = self._pending
+        p.n += 1.0
+        self._count[...] = p.n
+        np.copyto(self._x, raw)                      # widen to float64 first
+        np.abs(self._x, out=self._x)
+        np.subtract(self._x, p.mean, out=self._delta)
+        np.divide(self._delta, self._count, out=self._tmp)
+        np.add(p.mean, self._tmp, out=p.mean)
+        np.subtract(self._x, p.mean, out=self._tmp)
+        np.multiply(self._delta, self._tmp, out=self._tmp)
+        np.add(p.m2, self._tmp, out=p.m2)
+        if not self.ready and p.n >= self.calib_samples:
+            self.scale = np.maximum(p.std(), SCALE_FLOOR)
+            self.ready = True
+            p.clear()
+
+    def decide(self, is_rest, now):
+        '''
+        Call once per model decision. Keeps the samples since the previous
+        decision if it was rest (any decision while checking a stored
+        profile), checks the profile once enough samples are in, and applies a rate-limited drift update when due. Returns a dict
+        with 'event' set to 'profile_ok', 'recalibrate' (ready is False again
+        until CALIB_SEC of new samples are in) or 'drift' (scale changed),
+        else None.
+        '''
+        if not self.ready:
+            return None
+        if is_rest or self.checking:
+            self._rest.merge(self._pending)
+        self._pending.clear()
+        if self.checking:
+            return self._check_profile(now) if self._rest.n >= self.check_samples else None
+        if self._last_update is None:
+            self._last_update = now
+        if self._rest.n < self.min_rest or now - self._last_update < self.interval:
+            return None
+
+        target = np.maximum(self._rest.std(), SCALE_FLOOR)
+        ratio  = np.clip(target / self.scale, 1 - self.max_step, 1 + self.max_step)
+        rest_n = int(self._rest.n)
+        self._rest.clear()
+        self._last_update = now
+        if np.all(np.abs(ratio - 1) < self.deadband):
+            return None
+        self.scale = self.scale * ratio
+        self.updates += 1
+        return {
+            'event':        'drift',
+            'scale':        [round(float(v), 3) for v in self.scale],
+            'change':       [round(float(v) - 1, 4) for v in ratio],
+            'target':       [round(float(v), 3) for v in target],
+            'rest_samples': rest_n,
+            'updates':      self.updates,
+        }
+
+    def _check_profile(self, now):
+        target = np.maximum(self._rest.std(), SCALE_FLOOR)
+        ratio  = target / self.scale
+        rest_n = int(self._rest.n)
+        self._rest.clear()
+        self.checking = False
+        self._last_update = now
+        ok = bool(np.all(np.abs(ratio - 1) <= self.max_drift))
+        if not ok:
+            self.ready = False         # push() recalibrates from the next sample
+        return {
+            'event':        'profile_ok' if ok else 'recalibrate',
+            'scale':        [round(float(v), 3) for v in self.scale],
+            'change':       [round(float(v) - 1, 4) for v in ratio],
+            'target':       [round(float(v), 3) for v in target],
+            'rest_samples': rest_n,
+            'updates':      self.updates,
+        }
+
+
+# ── Self-check ────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    rest = np.load('data_collection/rest_steady.npy')
+    rng  = np.random.default_rng(0)
+    signed = rest * rng.choice([-1, 1], size=rest.shape)   # recordings are rectified
+
+    calib = StreamingCalibration()
+    for x in signed[:calib.calib_samples]:
+        calib.push(x)
+    ref = calibration_scale(signed[:calib.calib_samples])
+    print('── Initial scale ─────────────────────────────────────')
+    print(f'  streaming  {np.round(calib.scale, 3)}')
+    print(f'  batch      {np.round(ref, 3)}')
+    print(f'  max abs diff {np.abs(calib.scale - ref).max():.2e}')
+
+    # Simulated electrode drift: rest amplitude grows 40% over 10 minutes; every
+    # third decision is a grip (5× amplitude) that must not leak into the scale
+    print('\n── Drift (rest ×1.4 over 10 min, every 3rd decision a grip) ──')
+    stride = 20
+    base = signed[:calib.calib_samples]
+    n = 10 * 60 * SAMPLE_RATE
+    for k in range(n):
+        grip = (k // stride) % 3 == 2
+        gain = (1 + 0.4 * k / n) * (5 if grip else 1)
+        calib.push(base[k % len(base)] * gain)
+        if (k + 1) % stride == 0:
+            t = (k + 1) / SAMPLE_RATE
+            change = calib.decide(is_rest=not grip, now=t)
+            if change and change['updates'] % 5 == 1:
+                print(f'  t={t:5.0f}s  update {change["updates"]:>2}  '
+                      f'mean change {np.mean(change["change"]):+.3f}  '
+                      f'scale/initial {np.mean(calib.scale / ref):.3f}  '
+                      f'true {1 + 0.4 * k / n:.3f}')
+    print(f'  final scale/initial {np.mean(calib.scale / ref):.3f}  (true gain 1.400)')
+
+    # Stored profile: accepted as-is, or rejected after an electrode shift
+    print('\n── Profile check (first 1s after startup) ───────────')
+    for label, gain in (('same armband', 1.0), ('shifted ×1.6', 1.6)):
+        calib = StreamingCalibration(profile=ref)
+        k, event = 0, None
+        while event is None:
+            calib.push(base[k % len(base)] * gain)
+            k += 1
+            if k % stride == 0:
+                event = calib.decide(is_rest=True, now=k / SAMPLE_RATE)
+        print(f'  {label:<14} ready from sample 0  →  {event["event"]:<11} after {k} samples  '
+              f'(max change {np.max(np.abs(event["change"])):.2f})')
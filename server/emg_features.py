@@ -0,0 +1,330 @@
+'''
+Shared EMG Feature Extraction
+
+Single implementation of the 48-dimensional window features used by
+process_data.py, analyse_data.py and run_inference.py:
+
+  MAV  — mean absolute value
+  RMS  — root mean square
+  VAR  — variance
+  WL   — waveform length (cumulative signal change)
+  SSC  — slope sign changes
+  WAMP — Willison amplitude (spike count above threshold)
+
+Features are laid out feature-major: [MAV ch1..8, RMS ch1..8, ..., WAMP ch1..8].
+
+extract_windows() computes every window of a trial in one call using a
+strided sliding-window view — no per-window Python loop. Reductions run
+over the same axis order as the original per-window code, so results are
+bit-for-bit identical to it.
+
+Run: python emg_features.py   (equivalence check + timing on data_collection/)
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+SAMPLE_RATE = 200                        # Hz (FILTERED mode)
+N_CHANNELS  = 8
+WINDOW_SIZE = int(0.200 * SAMPLE_RATE)   # 200ms = 40 samples
+STRIDE      = WINDOW_SIZE // 2           # 50% overlap = 20 samples
+WAMP_THRESH = 10.0
+
+FEATURES    = ('MAV', 'RMS', 'VAR', 'WL', 'SSC', 'WAMP')
+FEATURE_DIM = len(FEATURES) * N_CHANNELS  # 48
+
+FEATURE_NAMES = [f'{feat}_ch{i+1}' for feat in FEATURES for i in range(N_CHANNELS)]
+
+# ── Batch extraction ──────────────────────────────────────────────────────────
+
+def n_windows(n_samples, window_size=WINDOW_SIZE, stride=STRIDE):
+    '''Number of complete windows in a trial of n_samples.'''
+    if n_samples < window_size:
+        return 0
+    return (n_samples - window_size) // stride + 1
+
+
+def extract_windows(trial, window_size=WINDOW_SIZE, stride=STRIDE, wamp_thresh=WAMP_THRESH):
+    '''
+    trial: (..., T, C) rectified EMG — any leading batch dims (e.g. trials)
+    returns: (..., N_windows, 6 * C) in the input's float dtype
+    '''
+    trial = np.asarray(trial)
+    if not np.issubdtype(trial.dtype, np.floating):
+        trial = trial.astype(np.float32)
+
+    *lead, n_samples, n_ch = trial.shape
+    n_win = n_windows(n_samples, window_size, stride)
+    out = np.empty((*lead, n_win, len(FEATURES) * n_ch), dtype=trial.dtype)
+    if n_win == 0:
+        return out
+
+    # (..., N, W, C) views — window axis second-to-last, matching window.mean(axis=0)
+    win  = sliding_window_view(trial, window_size, axis=-2)[..., ::stride, :, :].swapaxes(-1, -2)
+    diff = np.diff(trial, axis=-2)
+    dwin = sliding_window_view(diff, window_size - 1, axis=-2)[..., ::stride, :, :].swapaxes(-1, -2)
+    adiff = np.abs(dwin)
+
+    mav, rms, var, wl, ssc, wamp = (out[..., k * n_ch:(k + 1) * n_ch] for k in range(len(FEATURES)))
+    mav[...]  = win.mean(axis=-2)
+    rms[...]  = np.sqrt((win ** 2).mean(axis=-2))
+    var[...]  = win.var(axis=-2)
+    wl[...]   = adiff.sum(axis=-2)
+    ssc[...]  = (np.diff(np.sign(dwin), axis=-2) != 0).sum(axis=-2)
+    wamp[...] = (adiff > wamp_thresh).sum(axis=-2)
+    return out
+
+
+def extract_features(window, wamp_thresh=WAMP_THRESH):
+    '''
+    window: (W, C) rectified EMG
+    returns: (6 * C,) feature vector
+
+    Direct single-window path; also the reference extract_windows() is
+    checked against.
+    '''
+    diff = np.diff(window, axis=0)
+    mav  = window.mean(axis=0)
+    rms  = np.sqrt((window ** 2).mean(axis=0))
+    var  = window.var(axis=0)
+    wl   = np.abs(diff).sum(axis=0)
+    ssc  = (np.diff(np.sign(diff), axis=0) != 0).sum(axis=0).astype(np.float32)
+    wamp = (np.abs(diff) > wamp_thresh).sum(axis=0).astype(np.float32)
+    return np.concatenate([mav, rms, var, wl, ssc, wamp])
+
+
+# ── Calibration ───────────────────────────────────────────────────────────────
+
+def calibration_scale(rest):
+    '''
+    Per-channel amplitude scale from relaxed EMG (T, C): std of the rectified
+    signal, floored at 1.0 to avoid dividing by near-zero noise.
+    '''
+    scale = np.abs(rest).std(axis=0)
+    scale[scale < 1.0] = 1.0
+    return scale
+
+
+# ── Streaming extraction ──────────────────────────────────────────────────────
+
+class StreamingFeatures:
+    '''
+    O(1)-per-sample sliding-window features for live inference.
+
+    Keeps running per-channel sums over the last window_size samples
+    (sum, sum of squares, |diff| sum, WAMP and SSC counts) and updates them
+    as each sample enters and the oldest leaves, so a feature vector can be
+    read after any push — every sample if desired — without recomputing
+    the window.
+
+    Each sample's contributions are stored in one ring slot, so evicting
+    the oldest sample and adding the newest is one subtract and one add:
+      x, x²      — counted while the sample is in the window
+      |d|, WAMP  — diff to the previous sample, counted once both are in
+      SSC        — slope sign change at this sample, counted once the two
+                   diffs it compares are both in the window
+
+    Sums are float64 (counts are exact in float64) and resynchronised from
+    the ring every RESYNC_WINDOWS windows so add/subtract rounding cannot
+    drift over long sessions.
+
+    push(), push_raw() and features(out=...) are allocation-free: every
+    view, constant and scratch array is built in reset(), and counters stay
+    small enough to be cached ints.
+    '''
+
+    RESYNC_WINDOWS = 100
+    _X, _X2, _AD, _WAMP, _SSC = range(5)
+
+    def __init__(self, n_channels=N_CHANNELS, window_size=WINDOW_SIZE, wamp_thresh=WAMP_THRESH):
+        self.n_channels  = n_channels
+        self.window_size = window_size
+        self.wamp_thresh = wamp_thresh
+        self._scale      = np.ones(n_channels)
+        self.reset()
+
+    def reset(self):
+        W, C = self.window_size, self.n_channels
+        self._ring = np.zeros((W, 5, C))    # per-sample contributions
+        self._sums = np.zeros((5, C))       # column sums of the ring
+        self._slots = [(row, *row) for row in self._ring]
+        self._prev      = np.zeros(C)
+        self._diff      = np.zeros(C)
+        self._sign      = np.zeros(C)
+        self._prev_sign = np.zeros(C)
+        self._rect      = np.zeros(C)
+        self._mask      = np.zeros(C, dtype=bool)
+        self._ones      = np.ones(W)
+        self._ring_2d   = self._ring.reshape(W, -1)
+        self._sums_1d   = self._sums.reshape(-1)
+
+        self._out   = np.zeros((len(FEATURES), C))   # features() scratch, feature-major
+        self._flat  = self._out.reshape(-1)
+        self._out_rows = tuple(self._out)
+        self._sum_rows = tuple(self._sums)
+        self._tmp   = np.zeros(C)
+        self._w     = np.array(float(W))
+        self._thr   = np.array(float(self.wamp_thresh))
+        self._zero  = np.array(0.0)
+
+        self._slot   = 0   # ring slot the next sample is written to
+        self._filled = 0   # samples in the window, saturates at W
+        self._wraps  = 0   # ring wraps since the last resync
+
+    @property
+    def ready(self):
+        '''True once a full window has been seen.'''
+        return self._filled == self.window_size
+
+    def set_scale(self, scale):
+        '''Per-channel normalisation applied by push_raw().'''
+        np.copyto(self._scale, scale)
+
+    def normalise(self, raw):
+        '''raw: (C,) unrectified EMG → rectified, scaled copy in an internal buffer.'''
+        np.copyto(self._rect, raw)          # widen to float64 first; mixed-dtype
+        np.abs(self._rect, out=self._rect)  # ufuncs would allocate cast buffers
+        np.divide(self._rect, self._scale, out=self._rect)
+        return self._rect
+
+    def push_raw(self, raw):
+        '''raw: (C,) unrectified EMG — normalise() then push().'''
+        self.push(self.normalise(raw))
+
+    def push(self, sample):
+        '''sample: (C,) rectified, normalised EMG'''
+        row, x, x2, ad, wamp, ssc = self._slots[self._slot]
+
+        # Evict the sample leaving the window (zeros until the ring has filled)
+        np.subtract(self._sums, row, out=self._sums)
+
+        np.copyto(x, sample)
+        np.multiply(x, x, out=x2)
+        if self._filled:
+            np.subtract(x, self._prev, out=self._diff)
+            np.abs(self._diff, out=ad)
+            np.greater(ad, self._thr, out=self._mask)      # bool scratch: writing a
+            np.copyto(wamp, self._mask)                    # bool ufunc straight into
+            np.sign(self._diff, out=self._sign)            # float64 would allocate
+            if self._filled > 1:
+                np.not_equal(self._sign, self._prev_sign, out=self._mask)
+                np.copyto(ssc, self._mask)
+            np.copyto(self._prev_sign, self._sign)
+        np.copyto(self._prev, x)
+
+        np.add(self._sums, row, out=self._sums)
+
+        if self._filled < self.window_size:
+            self._filled += 1
+        self._slot += 1
+        if self._slot == self.window_size:
+            self._slot = 0
+            self._wraps += 1
+            if self._wraps == self.RESYNC_WINDOWS:
+                self._wraps = 0
+                np.dot(self._ones, self._ring_2d, out=self._sums_1d)   # column sums, no temporaries
+
+    def features(self, out=None):
+        '''
+        Feature vector for the current window, same layout as extract_features().
+        out: optional (6 * C,) array to write into
+        '''
+        if out is None:
+            out = np.empty(self._flat.shape, dtype=np.float32)
+
+        mav, rms, var, wl, ssc, wamp = self._out_rows
+        sums = self._sum_rows
+        # The oldest slot's diff reaches outside the window; the two oldest
+        # slots' slope sign changes do too.
+        oldest = self._slots[self._slot]
+        second = self._slots[self._slot + 1 if self._slot + 1 < self.window_size else 0]
+
+        np.divide(sums[self._X], self._w, out=mav)
+        np.divide(sums[self._X2], self._w, out=var)       # mean of squares
+        np.sqrt(var, out=rms)
+        np.multiply(mav, mav, out=self._tmp)
+        np.subtract(var, self._tmp, out=var)
+        np.maximum(var, self._zero, out=var)
+        np.subtract(sums[self._AD], oldest[1 + self._AD], out=wl)
+        np.subtract(sums[self._SSC], oldest[1 + self._SSC], out=ssc)
+        np.subtract(ssc, second[1 + self._SSC], out=ssc)
+        np.subtract(sums[self._WAMP], oldest[1 + self._WAMP], out=wamp)
+
+        np.copyto(out, self._flat, casting='same_kind')
+        return out
+
+
+# ── Equivalence check ─────────────────────────────────────────────────────────
+
+def _reference_windows(trial):
+    '''Original per-window loop, the ground truth for the batch check below.'''
+    return np.array([
+        extract_features(trial[start:start + WINDOW_SIZE])
+        for start in range(0, len(trial) - WINDOW_SIZE + 1, STRIDE)
+    ], dtype=np.float32)
+
+
+if __name__ == '__main__':
+    import glob
+    import os
+    import time
+
+    DATA_DIR = 'data_collection'
+    PHASE_SAMPLES = {'init': 400, 'steady': 800, 'release': 400}
+
+    print('── Batch extraction: equivalence + timing ────────────')
+    t_ref = t_new = 0.0
+    n_checked = 0
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, '*.npy'))):
+        phase = os.path.basename(path)[:-4].rsplit('_', 1)[1]
+        n = PHASE_SAMPLES[phase]
+        raw = np.load(path)
+        trials = np.abs(raw[:len(raw) // n * n].reshape(-1, n, N_CHANNELS))
+
+        t0 = time.perf_counter()
+        ref = np.vstack([_reference_windows(t) for t in trials])
+        t_ref += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        new = extract_windows(trials).reshape(-1, FEATURE_DIM)
+        t_new += time.perf_counter() - t0
+
+        if ref.dtype != new.dtype or not np.array_equal(ref, new):
+            bad = np.argwhere(ref != new)
+            raise SystemExit(f'  MISMATCH in {path}: {len(bad)} values differ (first at {bad[0]})')
+        n_checked += len(new)
+
+    print(f'  {n_checked} windows bit-for-bit identical')
+    print(f'  per-window loop : {t_ref:7.3f}s')
+    print(f'  strided batch   : {t_new:7.3f}s   ({t_ref / max(t_new, 1e-9):.1f}× faster)')
+
+    print('\n── Streaming extraction: equivalence + timing ────────')
+    raw = np.abs(np.load(os.path.join(DATA_DIR, 'cylindrical_forward_steady.npy')))[:8000]
+    batch = extract_windows(raw.astype(np.float64), stride=1)
+    stream = StreamingFeatures()
+    feats = np.empty(FEATURE_DIM, dtype=np.float64)
+    worst = 0.0
+    t_push = 0.0
+    for t, sample in enumerate(raw):
+        t0 = time.perf_counter()
+        stream.push(sample)
+        t_push += time.perf_counter() - t0
+        if stream.ready:
+            stream.features(out=feats)
+            ref = batch[t - WINDOW_SIZE + 1]
+            worst = max(worst, float(np.max(np.abs(feats - ref) / np.maximum(np.abs(ref), 1.0))))
+    if worst > 1e-9:
+        raise SystemExit(f'  MISMATCH: streaming features differ from batch by up to {worst:.2e}')
+    print(f'  {len(batch)} stride-1 windows match batch (max rel. error {worst:.1e})')
+    t0 = time.perf_counter()
+    for t in range(0, len(raw) - WINDOW_SIZE + 1, STRIDE):
+        extract_features(raw[t:t + WINDOW_SIZE])
+    t_window = (time.perf_counter() - t0) / n_windows(len(raw))
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        stream.features(out=feats)
+    t_read = (time.perf_counter() - t0) / 1000
+    print(f'  push            : {t_push / len(raw) * 1e6:7.1f}µs/sample')
+    print(f'  features()      : {t_read * 1e6:7.1f}µs/read   (full-window recompute: {t_window * 1e6:.1f}µs)')
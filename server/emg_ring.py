@@ -0,0 +1,263 @@
+'''
+Preallocated EMG Sample Ring
+
+Fixed-capacity float32 ring that carries Myo samples from the BLE callback
+thread to the consumer without allocating per sample. Replaces the
+unbounded queue.Queue of per-sample np.array objects.
+
+  producer: ring.put(emg)                 — called from the Myo EMG handler
+  consumer: ring.get_into(out, timeout)   — copies the oldest sample into out
+            ring.read(block, timeout)     — drains up to len(block) pending samples
+                                            into one contiguous (n, C) array
+
+get_into() is the allocation-free per-sample path of the live loop; read()
+is the bulk path for consumers that want everything pending at once
+(collect_data, calibration). Frames are fixed-size float32 rows of
+`channels` values, so raw 1 kHz mode or several armbands only change the
+capacity and channel count.
+
+Each slot also records its arrival time (perf_counter) so the consumer can
+measure how long a sample waited in the ring (last_stamp).
+
+Rows, ring indices and successor indices are all built once up front, so
+neither side creates numpy views or large Python ints in steady state.
+Only the producer moves head and only the consumer moves tail; if the
+consumer falls `capacity - 1` samples behind, new samples are discarded
+and counted in `dropped` rather than blocking the BLE thread.
+'''
+
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from emg_features import N_CHANNELS
+
+
+class SampleRing:
+
+    def __init__(self, capacity=256, channels=N_CHANNELS):
+        self.capacity = capacity
+        self.channels = channels
+        self._unroll  = channels == 8   # pyomyo's 8-tuple is unpacked element-wise
+        self._buf  = np.zeros((capacity, channels), dtype=np.float32)
+        self._rows = list(self._buf)                       # one view per slot, reused
+        self._next = list(range(1, capacity)) + [0]        # successor of each slot index
+        self._stamps = [0.0] * capacity                    # perf_counter() at put()
+        self.last_stamp = 0.0   # arrival time of the sample last returned by get_into()
+        self._head = 0   # next slot the producer writes
+        self._tail = 0   # next slot the consumer reads
+        self._ready = threading.Event()
+        self._want  = 1   # pending samples the sleeping consumer is waiting for
+        self.dropped = 0
+
+    def put(self, emg):
+        '''Producer side: copy one 8-channel sample (tuple or array) into the ring.'''
+        head = self._head
+        nxt  = self._next[head]
+        if nxt == self._tail:
+            self.dropped += 1
+            return
+        row = self._rows[head]
+        if self._unroll:
+            # Element-wise unpack of pyomyo's 8-tuple; np.copyto would build a temporary array
+            row[0], row[1], row[2], row[3], row[4], row[5], row[6], row[7] = emg
+        else:
+            row[:] = emg
+        self._stamps[head] = time.perf_counter()
+        self._head = nxt
+        if not self._ready.is_set():      # only wake a consumer that has gone to sleep
+            if self._want == 1 or (nxt - self._tail) % self.capacity >= self._want:
+                self._ready.set()
+
+    def _wait(self, timeout):
+        '''Block until at least one sample is pending; False on timeout.'''
+        while self._tail == self._head:
+            self._ready.clear()
+            if self._tail != self._head:
+                break
+            if not self._ready.wait(timeout):
+                return False
+        return True
+
+    def get_into(self, out, timeout=None):
+        '''
+        Consumer side: copy the oldest sample into out (C,) float32.
+        Returns False if nothing arrived within timeout.
+        '''
+        if not self._wait(timeout):
+            return False
+        tail = self._tail
+        np.copyto(out, self._rows[tail])
+        self.last_stamp = self._stamps[tail]
+        self._tail = self._next[tail]
+        return True
+
+    def _wait_count(self, count, timeout):
+        '''
+        Block until count samples are pending (the producer only wakes us then).
+        On timeout, returns whether anything at all is pending.
+        '''
+        while (self._head - self._tail) % self.capacity < count:
+            self._want = count
+            self._ready.clear()
+            if (self._head - self._tail) % self.capacity >= count:
+                break
+            if not self._ready.wait(timeout):
+                self._want = 1
+                return self._tail != self._head
+        self._want = 1
+        return True
+
+    def read(self, out, timeout=None, min_count=1):
+        '''
+        Consumer side, bulk: copy up to len(out) pending samples, oldest first,
+        into out (n, C) — at most two slice copies, however many are pending.
+        min_count > 1 sleeps until that many are pending (capped at len(out) and
+        capacity - 1), so a consumer that needs a block wakes once, not per packet.
+        Returns the number copied (0 if nothing arrived within timeout).
+        '''
+        count = min(max(min_count, 1), len(out), self.capacity - 1)
+        if not (self._wait(timeout) if count == 1 else self._wait_count(count, timeout)):
+            return 0
+        tail = self._tail
+        n = min((self._head - tail) % self.capacity, len(out))
+        first = min(n, self.capacity - tail)
+        out[:first] = self._buf[tail:tail + first]
+        if n > first:
+            out[first:n] = self._buf[:n - first]
+        end = (tail + n) % self.capacity
+        self.last_stamp = self._stamps[end - 1]
+        self._tail = end
+        return n
+
+    def clear(self):
+        '''Discard everything pending.'''
+        self._tail = self._head
+
+    def __len__(self):
+        return (self._head - self._tail) % self.capacity
+
+
+# ── Cross-process ring ────────────────────────────────────────────────────────
+
+class SharedSampleRing:
+    '''
+    SampleRing over a multiprocessing.shared_memory block, for a producer in
+    another process. Layout: head/tail indices, then per slot a sequence
+    number, an arrival stamp (perf_counter, a system-wide monotonic clock)
+    and the float32 frame.
+
+    The producer numbers every sample it is handed, including ones it has to
+    discard because the ring is full; the consumer checks the numbers as it
+    reads, so `dropped` counts samples lost anywhere between the BLE callback
+    and the consumer, and `gaps` counts the separate holes.
+
+    There is no cross-process Event: an empty consumer polls every POLL s.
+    '''
+
+    POLL = 0.0005
+
+    def __init__(self, capacity=256, channels=N_CHANNELS, name=None):
+        size = 16 + capacity * (8 + 8 + 4 * channels)
+        self._shm = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        buf = self._shm.buf
+        self.name     = self._shm.name
+        self.capacity = capacity
+        self.channels = channels
+        self._hdr    = np.ndarray(2, np.int64, buf, 0)                      # head, tail
+        self._seq    = np.ndarray(capacity, np.int64, buf, 16)
+        self._stamps = np.ndarray(capacity, np.float64, buf, 16 + 8 * capacity)
+        self._buf    = np.ndarray((capacity, channels), np.float32, buf, 16 + 16 * capacity)
+        if name is None:
+            self._hdr[:] = 0
+        self._rows = list(self._buf)
+        self._put_seq = 0        # producer: number of the next sample handed to put()
+        self._expect  = None     # consumer: next sequence number (None → resync)
+        self.last_stamp = 0.0
+        self.dropped = 0
+        self.gaps    = 0
+
+    @classmethod
+    def attach(cls, name, capacity, channels=N_CHANNELS):
+        '''Open an existing ring by name (in the producer process).'''
+        return cls(capacity, channels, name=name)
+
+    def close(self):
+        self._hdr = self._seq = self._stamps = self._buf = None
+        self._rows = []
+        self._shm.close()
+
+    def unlink(self):
+        '''Free the shared block (creator only, after both sides are done).'''
+        self.close()
+        self._shm.unlink()
+
+    # ── Producer ──────────────────────────────────────────────────────────
+
+    def put(self, emg):
+        seq = self._put_seq
+        self._put_seq = seq + 1
+        head = int(self._hdr[0])
+        nxt  = head + 1 if head + 1 < self.capacity else 0
+        if nxt == self._hdr[1]:
+            return                       # full: the consumer sees the missing number
+        self._rows[head][:] = emg
+        self._seq[head]    = seq
+        self._stamps[head] = time.perf_counter()
+        self._hdr[0] = nxt               # publish last, after the frame is written
+
+    # ── Consumer ──────────────────────────────────────────────────────────
+
+    def __len__(self):
+        return int(self._hdr[0] - self._hdr[1]) % self.capacity
+
+    def _wait(self, count, timeout):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while len(self) < count:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return len(self) > 0
+            time.sleep(self.POLL)
+        return True
+
+    def _check(self, first, last, n, holes=0):
+        '''Account for sequence numbers first..last arriving as n frames with `holes` breaks.'''
+        if self._expect is not None and first != self._expect:
+            self.gaps    += 1
+            self.dropped += first - self._expect
+        self.gaps    += holes
+        self.dropped += last - first + 1 - n
+        self._expect = last + 1
+
+    def get_into(self, out, timeout=None):
+        if not self._wait(1, timeout):
+            return False
+        tail = int(self._hdr[1])
+        np.copyto(out, self._rows[tail])
+        self.last_stamp = float(self._stamps[tail])
+        seq = int(self._seq[tail])
+        self._check(seq, seq, 1)
+        self._hdr[1] = tail + 1 if tail + 1 < self.capacity else 0
+        return True
+
+    def read(self, out, timeout=None, min_count=1):
+        count = min(max(min_count, 1), len(out), self.capacity - 1)
+        if not self._wait(count, timeout):
+            return 0
+        tail  = int(self._hdr[1])
+        n     = min(len(self), len(out))
+        first = min(n, self.capacity - tail)
+        out[:first] = self._buf[tail:tail + first]
+        if n > first:
+            out[first:n] = self._buf[:n - first]
+        end  = (tail + n) % self.capacity
+        seqs = np.concatenate([self._seq[tail:tail + first], self._seq[:n - first]])
+        self._check(int(seqs[0]), int(seqs[-1]), n, int(np.count_nonzero(np.diff(seqs) != 1)))
+        self.last_stamp = float(self._stamps[end - 1])
+        self._hdr[1] = end
+        return n
+
+    def clear(self):
+        self._hdr[1] = self._hdr[0]
+        self._expect = None
@@ -0,0 +1,375 @@
+'''
+Pluggable EMG Sources
+
+Every source exposes the part of pyomyo.Myo the scripts use, so the
+acquisition loops stay unchanged whichever backend is selected:
+
+  src = open_source(source_spec())
+  src.add_emg_handler(lambda emg, moving: ...)   # emg: tuple of ints, like pyomyo
+  src.connect(); src.set_leds(...); src.vibrate(1)
+  while running:
+      src.run()                                  # delivers every sample that is due
+  src.disconnect()
+
+Backends (selected with --source <spec> or the EMG_SOURCE environment variable):
+  myo                                   live armband via pyomyo (default)
+  replay:<file.npy>[,<file.npy>...]     recorded samples paced at exactly 200 Hz,
+                                        looped; globs allowed (data_collection/palm_*.npy)
+  synthetic[:k=v,...]                   generated EMG; options:
+      grip=cycle|rest|cylindrical|lateral|palm   (cycle: rest→grip→rest→… every hold s)
+      hold=4        seconds per grip when cycling
+      channels=8    rate=200
+      dropout=0     probability per sample of a dropout burst (no samples delivered)
+      dropout_len=20   samples per burst
+      seed=0
+
+Paced sources schedule sample k at t0 + k / rate (no drift); if the caller
+falls behind, the overdue samples are delivered in a burst, like BLE packets.
+
+run_source() is the acquisition loop (open, stream into a callback until
+stopped); start_acquisition_process() runs it in a child process feeding
+an emg_ring.SharedSampleRing.
+
+Run: python emg_source.py [spec]   (prints delivered rate, gaps and jitter for 5 s)
+'''
+
+import abc
+import glob
+import multiprocessing
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+SOURCE_ENV = 'EMG_SOURCE'
+
+# Mean rectified amplitude per channel while holding each grip, from the
+# steady phase of data_collection/ (rest, cylindrical forward, lateral forward, palm)
+GRIP_PROFILES = {
+    'rest':        [2, 2, 2, 1, 2, 2, 2, 2],
+    'cylindrical': [15, 6, 3, 4, 9, 22, 16, 11],
+    'lateral':     [6, 6, 7, 8, 18, 28, 17, 23],
+    'palm':        [5, 6, 13, 23, 6, 4, 8, 6],
+}
+
+# ── Selection ─────────────────────────────────────────────────────────────────
+
+def source_spec(argv=None, default='myo'):
+    '''--source <spec> (or --source=<spec>) from argv, else $EMG_SOURCE, else default.'''
+    argv = sys.argv[1:] if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg.startswith('--source='):
+            return arg.split('=', 1)[1]
+        if arg == '--source' and i + 1 < len(argv):
+            return argv[i + 1]
+    return os.getenv(SOURCE_ENV, default)
+
+
+def _parse(spec):
+    kind, _, rest = spec.partition(':')
+    args, opts = [], {}
+    for part in filter(None, rest.split(',')):
+        if '=' in part:
+            k, v = part.split('=', 1)
+            opts[k.strip()] = v.strip()
+        else:
+            args.append(part.strip())
+    return kind.strip().lower(), args, opts
+
+
+def open_source(spec='myo', mode=None):
+    '''Build the source described by spec (see module docstring).'''
+    kind, args, opts = _parse(spec)
+    if kind == 'myo':
+        from pyomyo import Myo, emg_mode
+        return Myo(mode=mode or emg_mode.FILTERED)
+    if kind == 'replay':
+        paths = [p for a in args + opts.get('path', '').split() for p in sorted(glob.glob(a))]
+        if not paths:
+            raise ValueError(f'replay source: no .npy files match {args or opts.get("path")}')
+        return ReplaySource(paths, rate=float(opts.get('rate', 200)),
+                            loop=opts.get('loop', '1') != '0')
+    if kind == 'synthetic':
+        return SyntheticSource(
+            grip        = opts.get('grip', args[0] if args else 'cycle'),
+            hold        = float(opts.get('hold', 4.0)),
+            channels    = int(opts.get('channels', 8)),
+            rate        = float(opts.get('rate', 200)),
+            dropout     = float(opts.get('dropout', 0.0)),
+            dropout_len = int(opts.get('dropout_len', 20)),
+            seed        = int(opts.get('seed', 0)),
+        )
+    raise ValueError(f'Unknown EMG source {spec!r} (myo, replay:<files>, synthetic[:opts])')
+
+
+# ── Paced sources ─────────────────────────────────────────────────────────────
+
+class EMGSource(abc.ABC):
+    '''
+    Base class for sources paced by the wall clock. Subclasses implement
+    _sample(k) → tuple of ints, or None when sample k is dropped (or, with
+    finished set, when the source has run out).
+    '''
+
+    def __init__(self, rate=200.0):
+        self.rate = rate
+        self.emg_handlers = []
+        self.imu_handlers = []
+        self.pose_handlers = []
+        self.delivered = 0
+        self.dropped   = 0
+        self.finished  = False
+        self._k  = 0
+        self._t0 = None
+
+    # pyomyo.Myo surface
+    def add_emg_handler(self, h):
+        self.emg_handlers.append(h)
+
+    def add_imu_handler(self, h):
+        self.imu_handlers.append(h)
+
+    def add_pose_handler(self, h):
+        self.pose_handlers.append(h)
+
+    def connect(self, addr=None):
+        self._t0 = time.perf_counter()
+        self._k  = 0
+
+    def disconnect(self):
+        self._t0 = None
+
+    def set_leds(self, logo, line):
+        pass
+
+    def vibrate(self, length):
+        pass
+
+    def on_emg(self, emg, moving):
+        for h in self.emg_handlers:
+            h(emg, moving)
+
+    def run(self):
+        '''Deliver every sample due by now; sleep until the next one if none are.'''
+        if self.finished:
+            # Nothing left: block for a sample period like an idle armband
+            # instead of letting `while running: src.run()` spin
+            time.sleep(1.0 / self.rate)
+            return
+        if self._t0 is None:
+            self.connect()
+        due = int((time.perf_counter() - self._t0) * self.rate) + 1
+        if due <= self._k:
+            time.sleep(max(self._t0 + self._k / self.rate - time.perf_counter(), 0.0))
+            due = self._k + 1
+        while self._k < due and not self.finished:
+            emg = self._sample(self._k)
+            self._k += 1
+            if emg is None:
+                if self.finished:
+                    break
+                self.dropped += 1
+                continue
+            self.delivered += 1
+            self.on_emg(emg, 0)
+
+    @abc.abstractmethod
+    def _sample(self, k):
+        ...
+
+
+class ReplaySource(EMGSource):
+    '''Recorded (n, C) .npy samples, concatenated and looped at `rate` Hz.'''
+
+    def __init__(self, paths, rate=200.0, loop=True):
+        super().__init__(rate)
+        self.paths = list(paths)
+        self.loop  = loop
+        data = np.concatenate([np.load(p) for p in self.paths])
+        self._rows = [tuple(int(round(v)) for v in row) for row in data]
+
+    def _sample(self, k):
+        if k >= len(self._rows) and not self.loop:
+            self.finished = True
+            return None
+        return self._rows[k % len(self._rows)]
+
+
+class SyntheticSource(EMGSource):
+    '''
+    Zero-mean Gaussian EMG per channel, scaled so the rectified mean matches
+    the current grip's profile; int8-range integers like FILTERED mode.
+    '''
+
+    BLOCK = 1000   # samples generated at a time
+
+    def __init__(self, grip='cycle', hold=4.0, channels=8, rate=200.0,
+                 dropout=0.0, dropout_len=20, seed=0, profiles=GRIP_PROFILES):
+        super().__init__(rate)
+        if grip != 'cycle' and grip not in profiles:
+            raise ValueError(f'synthetic source: unknown grip {grip!r} ({", ".join(profiles)})')
+        self.channels    = channels
+        self.dropout     = dropout
+        self.dropout_len = dropout_len
+        self.hold_samples = max(int(hold * rate), 1)
+        if grip == 'cycle':
+            grips = [g for g in profiles if g != 'rest']
+            self.schedule = [s for g in grips for s in ('rest', g)]
+        else:
+            self.schedule = [grip]
+        # E|x| = σ·sqrt(2/π) for a Gaussian, so σ = profile·sqrt(π/2)
+        self._sigma = {g: np.resize(np.asarray(p, dtype=np.float64), channels) * np.sqrt(np.pi / 2)
+                       for g, p in profiles.items()}
+        self._rng   = np.random.default_rng(seed)
+        self._block = []
+        self._block_start = 0
+        self._gap_until   = 0
+
+    def grip_at(self, k):
+        '''Ground-truth grip for sample k.'''
+        return self.schedule[(k // self.hold_samples) % len(self.schedule)]
+
+    @property
+    def grip(self):
+        return self.grip_at(max(self._k - 1, 0))
+
+    def _generate(self, start):
+        k = start + np.arange(self.BLOCK)
+        sigma = np.stack([self._sigma[self.grip_at(i)] for i in k])
+        x = np.clip(np.rint(self._rng.standard_normal(sigma.shape) * sigma), -128, 127)
+        self._block = [tuple(row) for row in x.astype(int).tolist()]
+        self._block_start = start
+
+    def _sample(self, k):
+        if k < self._gap_until:
+            return None
+        if self.dropout and self._rng.random() < self.dropout:
+            self._gap_until = k + self.dropout_len
+            return None
+        if not self._block_start <= k < self._block_start + len(self._block):
+            self._generate(k)
+        return self._block[k - self._block_start]
+
+
+# ── Acquisition loop ──────────────────────────────────────────────────────────
+
+def run_source(spec, on_emg, stop, leds=None):
+    '''
+    Open the source and stream samples into on_emg(emg) until stop is set.
+    Used by the reader thread and by the acquisition process alike.
+    '''
+    m = open_source(spec)
+    m.connect()
+    m.add_emg_handler(lambda emg, moving: on_emg(emg))
+    if leds:
+        m.set_leds(leds, leds)
+        m.vibrate(1)
+    try:
+        while not stop.is_set():
+            try:
+                m.run()
+            except struct.error:
+                pass
+    except KeyboardInterrupt:     # Ctrl+C reaches the acquisition process too
+        pass
+    finally:
+        if leds:
+            m.set_leds([0, 0, 0], [0, 0, 0])
+        m.disconnect()
+
+
+def _acquisition_main(spec, ring_name, capacity, channels, stop, leds):
+    from emg_ring import SharedSampleRing
+    ring = SharedSampleRing.attach(ring_name, capacity, channels)
+    try:
+        run_source(spec, ring.put, stop, leds)
+    finally:
+        ring.close()
+
+
+def start_acquisition_process(spec, ring, leds=None):
+    '''
+    Run the source in its own process, writing into SharedSampleRing ring, so
+    BLE handling never waits on the consumer's GIL. Returns (process, stop
+    event); set the event and join the process to shut down. The process is
+    spawned, not forked: the caller already runs threads (paho's network
+    loop, the model watcher), and a forked child can inherit one of their
+    locks held. Spawn re-imports the caller's main module, so it must not
+    connect or start threads at import.
+    '''
+    ctx  = multiprocessing.get_context('spawn')
+    stop = ctx.Event()
+    proc = ctx.Process(
+        target=_acquisition_main, name='emg-acquisition', daemon=True,
+        args=(spec, ring.name, ring.capacity, ring.channels, stop, leds))
+    proc.start()
+    return proc, stop
+
+
+# ── pyomyo classifier on any source ───────────────────────────────────────────
+
+def classifier_source(source, cls, hist_len=25):
+    '''
+    pyomyo.Classifier.MyoClassifier (rolling-vote pose output) driven by a
+    non-Myo source. For 'myo' use MyoClassifier directly.
+    '''
+    from collections import Counter, deque
+    from pyomyo.Classifier import MyoClassifier
+
+    class SourceClassifier(MyoClassifier):
+        def __init__(self):
+            # MyoClassifier state without Myo.__init__'s dongle lookup
+            self.source = source
+            self.cls = cls
+            self.hist_len = hist_len
+            self.history = deque([0] * hist_len, hist_len)
+            self.history_cnt = Counter(self.history)
+            self.last_pose = None
+            self.emg_handlers = []
+            self.imu_handlers = []
+            self.arm_handlers = []
+            self.pose_handlers = []
+            self.battery_handlers = []
+            self.add_emg_handler(self.emg_handler)
+            source.add_emg_handler(self.on_emg)
+            source.add_imu_handler(self.on_imu)
+
+        def connect(self, addr=None):
+            self.source.connect()
+
+        def run(self):
+            self.source.run()
+
+        def disconnect(self):
+            self.source.disconnect()
+
+        def set_leds(self, logo, line):
+            pass
+
+        def vibrate(self, length):
+            pass
+
+    return SourceClassifier()
+
+
+# ── Self-check ────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    spec   = sys.argv[1] if len(sys.argv) > 1 else 'synthetic:dropout=0.002'
+    src    = open_source(spec)
+    stamps = []
+    src.add_emg_handler(lambda emg, moving: stamps.append(time.perf_counter()))
+    src.connect()
+    end = time.perf_counter() + 5.0
+    while time.perf_counter() < end and not getattr(src, 'finished', False):
+        src.run()
+    src.disconnect()
+
+    dt = np.diff(stamps) * 1000
+    elapsed = stamps[-1] - stamps[0]
+    print(f'── {spec} ──')
+    print(f'  delivered {len(stamps)} samples in {elapsed:.2f}s  →  {(len(stamps) - 1) / elapsed:.1f} Hz'
+          f'  (dropped {getattr(src, "dropped", 0)})')
+    print(f'  interval  p50 {np.median(dt):.2f}ms   p99 {np.percentile(dt, 99):.2f}ms   '
+          f'max {dt.max():.2f}ms')
@@ -5,6 +5,8 @@ import os
 import paho.mqtt.client as mqtt
 from datetime import datetime
 from dotenv import load_dotenv
+from readiness import notify_ready
+from tracing import unpack_state
 import time
 
 load_dotenv()
@@ -18,6 +20,9 @@ TOPIC_TELEMETRY = "motor/telemetry"
 TOPIC_HARDWARE_SENSORS = "sensor/hardware_telemetry" # Toe ESP32
 TOPIC_TELEMETRY_FINGER = "sensor/hardware_telemetry1" # Finger ESP32
 TOPIC_SYS_MODE = "system/control_mode"
+TOPIC_METRICS_INFERENCE = "system/metrics/inference"
+SUBSCRIPTIONS = [TOPIC_MYO_STATE, TOPIC_LOGS, TOPIC_TELEMETRY, TOPIC_HARDWARE_SENSORS,
+                 TOPIC_SYS_MODE, TOPIC_TELEMETRY_FINGER, TOPIC_METRICS_INFERENCE]
 
 current_sys_mode = "ui"
 current_myo_state = "UNKNOWN"
@@ -30,6 +35,7 @@ live_m2_pos = 4000
 live_fsr = [0, 0, 0]
 live_imu = [0, 0, 0]
 live_toe_fsr = [0, 0]
+live_latency = {} # latest per-stage latency summary from run_inference
 
 def map_range(x, in_min, in_max, out_min, out_max):
     """Maps a number from one range to another, with strict clamping"""
@@ -37,10 +43,10 @@ def map_range(x, in_min, in_max, out_min, out_max):
     return (clamped_x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min
 
 def on_mqtt_message(client, userdata, msg):
-    global current_myo_state, current_sys_mode, system_logs, live_m1_pos, live_m2_pos, live_fsr, live_imu, live_toe_fsr
+    global current_myo_state, current_sys_mode, system_logs, live_m1_pos, live_m2_pos, live_fsr, live_imu, live_toe_fsr, live_latency
     
     if msg.topic == TOPIC_MYO_STATE:
-        current_myo_state = msg.payload.decode()
+        current_myo_state = unpack_state(msg.payload.decode())[0]
     elif msg.topic == TOPIC_LOGS:
         timestamp = datetime.now().strftime("%H:%M:%S")
         formatted_log = f"[{timestamp}] {msg.payload.decode()}"
@@ -72,21 +78,22 @@ def on_mqtt_message(client, userdata, msg):
                 live_imu = data["imu"]
         except json.JSONDecodeError:
             pass
+    elif msg.topic == TOPIC_METRICS_INFERENCE:
+        try:
+            live_latency = json.loads(msg.payload.decode())
+        except json.JSONDecodeError:
+            pass
     # elif msg.topic == TOPIC_SYS_MODE:
     #     current_sys_mode = msg.payload.decode()
 
+# anything with publish(topic, payload): the paho client, or control_runtime's in-process bus
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 mqtt_client.on_message = on_mqtt_message
-mqtt_client.connect(MQTT_BROKER, 1883, 60)
-mqtt_client.subscribe([
-    (TOPIC_MYO_STATE, 0),
-    (TOPIC_LOGS, 0),
-    (TOPIC_TELEMETRY, 0),
-    (TOPIC_HARDWARE_SENSORS, 0),
-    (TOPIC_SYS_MODE, 0),
-    (TOPIC_TELEMETRY_FINGER, 0)
-])
-mqtt_client.loop_start()
+
+def connect_mqtt():
+    mqtt_client.connect(MQTT_BROKER, 1883, 60)
+    mqtt_client.subscribe([(topic, 0) for topic in SUBSCRIPTIONS])
+    mqtt_client.loop_start()
 
 async def handle_connection(websocket):
     print(f"React Client Connected")
@@ -117,6 +124,7 @@ async def handle_connection(websocket):
                     "myo": {
                         "state": current_myo_state
                     },
+                    "latency": live_latency,
                     # "system": { "mode": current_sys_mode },
                     "logs": system_logs,
                     "timestamp": int(time.time() * 1000)
@@ -202,14 +210,17 @@ async def handle_connection(websocket):
     # run tasks concurrently
     await asyncio.gather(send_sensor_data(), receive_commands())
 
-async def main():
+async def main(ready=None):
     print(f"Starting Finger_OS Server on ws://localhost:{PORT}")
     async with websockets.serve(handle_connection, "localhost", PORT):
+        if ready is not None:
+            ready()
         await asyncio.get_running_loop().create_future()
 
 if __name__ == "__main__":
+    connect_mqtt()
     try:
-        asyncio.run(main())
+        asyncio.run(main(ready=lambda: notify_ready("finger_data", mqtt_client)))
     except KeyboardInterrupt:
         mqtt_client.loop_stop()
         print("Stopped.")
@@ -26,6 +26,9 @@ Training Tips:
 Classification Mode:
 1. Set TRAINING_MODE = False
 2. Call get_hand_position() to get current hand state
+
+EMG source: the Myo by default; --source (or $EMG_SOURCE) selects a recorded
+replay or synthetic generator instead (see emg_source.py).
 '''
 
 import pygame
@@ -39,8 +42,11 @@ from pyomyo import Myo, emg_mode
 from pyomyo.Classifier import Live_Classifier, MyoClassifier, EMGHandler
 from xgboost import XGBClassifier
 
+from emg_source import classifier_source, open_source, source_spec
+
 TRAINING_MODE = False
 USE_IMU = False  # False = EMG only (8 features), True = EMG + IMU (18 features)
+EMG_SOURCE = source_spec()  # --source / $EMG_SOURCE: myo, replay:<file.npy>, synthetic[:opts] (no IMU)
 
 CLASSES = {
     0: "rest",
@@ -158,7 +164,10 @@ def get_hand_position():
 
 
 def _setup_myo(clr):
-    m = MyoClassifier(clr, mode=emg_mode.FILTERED, hist_len=6)
+    if EMG_SOURCE == 'myo':
+        m = MyoClassifier(clr, mode=emg_mode.FILTERED, hist_len=6)
+    else:
+        m = classifier_source(open_source(EMG_SOURCE), clr, hist_len=6)
     if USE_IMU:
         m.add_imu_handler(_imu_handler)
     return m
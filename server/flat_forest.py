@@ -0,0 +1,452 @@
+'''
+Flat-array Random Forest Evaluator
+
+Exports a trained sklearn RandomForestClassifier to compact node arrays
+and evaluates it with plain NumPy, returning label and probabilities in
+one pass — no sklearn input validation, no joblib dispatch, and no second
+walk of the forest for predict_proba.
+
+Node arrays (all trees concatenated, `roots` holds each tree's first node):
+  feature   — int32 feature index tested at the node
+  threshold — float64 split threshold (go left if x[feature] <= threshold)
+  children  — (n_nodes, 2) int32 [left, right]; leaves point to themselves
+  value     — (n_nodes, n_classes) float64 per-leaf class distribution,
+              normalised exactly as DecisionTreeClassifier.predict_proba does
+
+Trees are walked in lock-step; leaves are self-loops with an +inf
+threshold, so finished trees stay put, and the walk stops early once every
+tree has reached a leaf (checked every EXIT_CHECK steps). Per-tree probabilities
+are summed in tree order and divided by the tree count, matching sklearn.
+
+predict_one_early() walks the trees in doubling batches (EARLY_BATCH first) and stops as
+soon as the leading class can no longer be overtaken by the trees left
+(exact: same label as the full forest, never before a majority of the
+trees, so no faster than predict_one), or — with delta > 0 — once the
+mean per-tree margin of the leader over the runner-up exceeds a
+Hoeffding–Serfling bound, i.e. the full forest would agree with
+probability ≥ 1 - delta. Trees of a random forest are exchangeable, so a
+prefix is a random sample of the forest.
+
+A model bundle (model_bundle/, save_bundle / load_bundle) is the
+fast-start form of the forest the live pipeline serves: one .npy file per
+node array, opened memory-mapped (no copy, pages read on first touch), and
+a small header.json with the class order and the feature settings the
+forest was trained with (window, stride, sample rate, WAMP threshold,
+feature layout). Loading it needs neither sklearn nor joblib, and
+load_for_inference() refuses a bundle whose settings differ from the live
+emg_features.py.
+
+prune() keeps the first n trees and/or truncates every tree at a depth
+(internal nodes at the cut become leaves with their own class distribution);
+prune_model.py uses it to write model_pruned.npz.
+
+Run: python flat_forest.py [results_dir]                       (export model.joblib → model_flat.npz)
+     python flat_forest.py [results_dir] --bundle [--pruned]   (served forest → model_bundle/)
+'''
+
+import json
+import os
+import sys
+import numpy as np
+
+FLAT_NAME   = 'model_flat.npz'
+PRUNED_NAME = 'model_pruned.npz'
+BUNDLE_NAME = 'model_bundle'      # directory: <array>.npy + header.json
+BUNDLE_HEADER = 'header.json'
+BUNDLE_ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots', 'classes')
+BUNDLE_FORMAT = 1
+EARLY_BATCH = 25     # trees in the first early-exit batch (doubling after)
+
+# ── Evaluator ─────────────────────────────────────────────────────────────────
+
+class FlatForest:
+
+    EXIT_CHECK = 4
+
+    def __init__(self, feature, threshold, children, value, roots, classes, max_depth):
+        self.feature   = feature
+        self.threshold = threshold
+        self.children  = children
+        self.value     = value
+        self.roots     = roots
+        self.classes   = classes
+        self.max_depth = int(max_depth)
+        self._left     = children[:, 0]
+        self._right    = children[:, 1]
+        self._is_leaf  = np.isinf(threshold)
+        self.header    = None        # bundle header.json, when loaded from a bundle
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    # ── Export / load ─────────────────────────────────────────────────────
+
+    @classmethod
+    def from_sklearn(cls, model):
+        '''Flatten a fitted RandomForestClassifier (or single DecisionTreeClassifier).'''
+        trees = getattr(model, 'estimators_', [model])
+        feature, threshold, children, value, roots = [], [], [], [], []
+        offset = 0
+        for est in trees:
+            t = est.tree_
+            n = t.node_count
+            idx  = np.arange(n)
+            leaf = t.children_left == -1
+
+            feat = t.feature.astype(np.int32)
+            feat[leaf] = 0
+            thr = t.threshold.astype(np.float64)
+            thr[leaf] = np.inf
+            ch = np.stack([t.children_left, t.children_right], axis=1).astype(np.int64)
+            ch[leaf] = idx[leaf, None]
+            ch += offset
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            val = t.value[:, 0, :model.n_classes_].astype(np.float64)
+            normalizer = val.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            val /= normalizer
+
+            feature.append(feat)
+            threshold.append(thr)
+            children.append(ch)
+            value.append(val)
+            roots.append(offset)
+            offset += n
+
+        return cls(
+            feature   = np.concatenate(feature),
+            threshold = np.concatenate(threshold),
+            children  = np.concatenate(children).astype(np.int32),
+            value     = np.concatenate(value),
+            roots     = np.array(roots, dtype=np.int32),
+            classes   = np.asarray(model.classes_),
+            max_depth = max(est.tree_.max_depth for est in trees),
+        )
+
+    def save(self, path):
+        np.savez(path, feature=self.feature, threshold=self.threshold,
+                 children=self.children, value=self.value, roots=self.roots,
+                 classes=self.classes, max_depth=self.max_depth)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            return cls(d['feature'], d['threshold'], d['children'], d['value'],
+                       d['roots'], d['classes'], d['max_depth'])
+
+    def save_bundle(self, path, **header):
+        '''
+        Write the node arrays as .npy files under path/ and header.json last,
+        each to a temporary file renamed into place: a live process keeps
+        its mapping of the old files (rewriting them in place would pull the
+        pages out from under it), and a bundle with a header is complete.
+        '''
+        os.makedirs(path, exist_ok=True)
+        for name in BUNDLE_ARRAYS:
+            tmp = os.path.join(path, f'{name}.tmp.npy')
+            np.save(tmp, getattr(self, name))
+            os.replace(tmp, os.path.join(path, f'{name}.npy'))
+        header = {'format': BUNDLE_FORMAT, 'trees': self.n_trees, 'nodes': self.n_nodes,
+                  'max_depth': self.max_depth, **header}
+        tmp = os.path.join(path, BUNDLE_HEADER + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(header, f, indent=2)
+        os.replace(tmp, os.path.join(path, BUNDLE_HEADER))
+
+    @classmethod
+    def load_bundle(cls, path, mmap=True):
+        '''Forest from a bundle directory; arrays are memory-mapped read-only unless mmap=False.'''
+        with open(os.path.join(path, BUNDLE_HEADER)) as f:
+            header = json.load(f)
+        if header.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f'{path}: bundle format {header.get("format")}, expected {BUNDLE_FORMAT}')
+        # np.asarray drops the np.memmap subclass: plain ndarray views on the
+        # mapping, so indexing in the hot loop returns plain arrays
+        arrays = {name: np.asarray(np.load(os.path.join(path, f'{name}.npy'),
+                                           mmap_mode='r' if mmap else None))
+                  for name in BUNDLE_ARRAYS}
+        flat = cls(**arrays, max_depth=header['max_depth'])
+        flat.header = header
+        return flat
+
+    # ── Pruning ───────────────────────────────────────────────────────────
+
+    def depths(self):
+        '''(n_nodes,) depth of every node within its tree (roots are 0).'''
+        depth = np.zeros(self.n_nodes, dtype=np.int32)
+        frontier = self.roots
+        d = 0
+        while len(frontier):
+            depth[frontier] = d
+            inner = frontier[~self._is_leaf[frontier]]
+            frontier = np.concatenate([self._left[inner], self._right[inner]])
+            d += 1
+        return depth
+
+    def prune(self, n_trees=None, max_depth=None):
+        '''
+        Smaller forest: the first n_trees trees, each cut at max_depth.
+        Nodes at the cut become leaves predicting their stored distribution;
+        nodes below it are dropped and the arrays are compacted.
+        '''
+        n_trees = self.n_trees if n_trees is None else min(n_trees, self.n_trees)
+        end     = self.roots[n_trees] if n_trees < self.n_trees else self.n_nodes
+        depth   = self.depths()[:end]
+        cut     = self.max_depth if max_depth is None else min(max_depth, self.max_depth)
+
+        keep = depth <= cut
+        leaf = self._is_leaf[:end] | (depth == cut)
+        new_index = np.cumsum(keep) - 1
+
+        idx       = np.flatnonzero(keep)
+        feature   = self.feature[idx].copy()
+        threshold = self.threshold[idx].copy()
+        children  = new_index[self.children[idx]].astype(np.int32)
+        is_leaf   = leaf[idx]
+        feature[is_leaf]   = 0
+        threshold[is_leaf] = np.inf
+        children[is_leaf]  = np.arange(len(idx), dtype=np.int32)[is_leaf, None]
+
+        return FlatForest(
+            feature   = feature,
+            threshold = threshold,
+            children  = children,
+            value     = self.value[idx],
+            roots     = new_index[self.roots[:n_trees]].astype(np.int32),
+            classes   = self.classes,
+            max_depth = min(cut, int(depth.max())),
+        )
+
+    # ── Prediction ────────────────────────────────────────────────────────
+
+    def leaves(self, X, roots=None):
+        '''X: (n, F) → (n, n_trees) leaf node index per sample and tree (or per roots given).'''
+        X = np.asarray(X, dtype=np.float32)
+        roots = self.roots if roots is None else roots
+        rows = np.arange(len(X))[:, np.newaxis]
+        node = np.broadcast_to(roots, (len(X), len(roots)))
+        for depth in range(1, self.max_depth + 1):
+            go_right = X[rows, self.feature[node]] > self.threshold[node]
+            node = np.where(go_right, self._right[node], self._left[node])
+            if depth % self.EXIT_CHECK == 0 and self._is_leaf[node].all():
+                break
+        return node
+
+    def predict_proba(self, X):
+        '''X: (n, F) → (n, n_classes), tree contributions summed in tree order.'''
+        proba = self.value[self.leaves(X)].sum(axis=1)
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        '''X: (n, F) → (labels, probabilities) from a single pass over the forest.'''
+        proba = self.predict_proba(X)
+        return self.classes.take(proba.argmax(axis=1)), proba
+
+    def predict_one(self, x):
+        '''x: (F,) or (1, F) → (label, (n_classes,) probabilities).'''
+        labels, proba = self.predict(np.reshape(x, (1, -1)))
+        return labels[0], proba[0]
+
+    def _walk_one(self, x, roots):
+        '''x: (F,) → leaf index for each tree starting at roots (leaves() for one sample).'''
+        node = roots
+        for depth in range(1, self.max_depth + 1):
+            go_right = x[self.feature[node]] > self.threshold[node]
+            node = np.where(go_right, self._right[node], self._left[node])
+            if depth % self.EXIT_CHECK == 0 and self._is_leaf[node].all():
+                break
+        return node
+
+    def predict_one_early(self, x, delta=0.0, batch=EARLY_BATCH):
+        '''
+        x: (F,) or (1, F) → (label, probabilities over the trees evaluated,
+        number of trees evaluated). delta=0 stops only when the label is
+        decided, which needs a majority of the trees walked: about the cost
+        of predict_one, so only delta > 0 (confidence 1 - delta) is faster.
+        '''
+        x = np.reshape(x, -1)
+        T = self.n_trees
+        log_term = 2 * np.log(1 / delta) if delta > 0 else None
+        sums = np.zeros(self.value.shape[1])
+        done = 0
+        if log_term is None:
+            # The gap is at most the trees walked, so the exact test cannot
+            # pass before a majority: walk that majority in one go
+            batch = max(batch, T // 2 + 1)
+        while done < T:
+            # Batches double: easy windows stop after one or two walks, hard
+            # ones cost O(log T) walks instead of T / batch
+            step = min(batch, T - done)
+            sums += self.value[self._walk_one(x, self.roots[done:done + step])].sum(axis=0)
+            done += step
+            batch *= 2
+            left = T - done
+            if not left:
+                break
+            lead   = int(sums.argmax())
+            runner = int(np.argmax(np.where(np.arange(len(sums)) == lead, -np.inf, sums)))
+            gap    = sums[lead] - sums[runner]
+            # Each remaining tree moves any class by at most 1; ties go to the lower index
+            if gap > left or (gap == left and lead < runner):
+                break
+            if log_term is not None and gap / done > np.sqrt((1 - (done - 1) / T) * log_term / done):
+                break
+        proba = sums / done
+        return self.classes[proba.argmax()], proba, done
+
+
+def early_exit_arg(argv=None):
+    '''
+    --early-exit[=delta] (run_inference, replay_inference) → delta for
+    predict_one_early (0.01 if no value given), else None: every tree.
+    '''
+    argv = sys.argv[1:] if argv is None else argv
+    return next((float(a.partition('=')[2] or 0.01) for a in argv if a.split('=')[0] == '--early-exit'), None)
+
+
+def pruned_enabled(argv=None):
+    '''--pruned or EMG_PRUNED=1: serve model_pruned.npz instead of the full forest.'''
+    argv = sys.argv[1:] if argv is None else argv
+    return '--pruned' in argv or os.getenv('EMG_PRUNED') == '1'
+
+
+def flat_path(results_dir):
+    return os.path.join(results_dir, FLAT_NAME)
+
+
+def pruned_path(results_dir):
+    return os.path.join(results_dir, PRUNED_NAME)
+
+
+def bundle_path(results_dir):
+    return os.path.join(results_dir, BUNDLE_NAME)
+
+
+def bundle_header(results_dir, source):
+    '''Header for a bundle of results_dir's model: class order + live feature settings.'''
+    from emg_features import FEATURE_DIM, FEATURES, N_CHANNELS, SAMPLE_RATE, STRIDE, WAMP_THRESH, WINDOW_SIZE
+    meta_path = os.path.join(results_dir, 'results.json')
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    return {'source': os.path.basename(source), 'class_order': meta.get('class_order'),
+            'phases_used': meta.get('phases_used'), 'sample_rate': SAMPLE_RATE,
+            'window': WINDOW_SIZE, 'stride': STRIDE, 'wamp_thresh': WAMP_THRESH,
+            'features': list(FEATURES), 'n_channels': N_CHANNELS, 'feature_dim': FEATURE_DIM}
+
+
+def bundle_mismatch(header, classes=None):
+    '''Why a bundle cannot serve the live pipeline (emg_features.py settings, class order), or None.'''
+    from emg_features import FEATURE_DIM, FEATURES, N_CHANNELS, SAMPLE_RATE, WAMP_THRESH, WINDOW_SIZE
+    live = {'sample_rate': SAMPLE_RATE, 'window': WINDOW_SIZE, 'wamp_thresh': WAMP_THRESH,
+            'features': list(FEATURES), 'n_channels': N_CHANNELS, 'feature_dim': FEATURE_DIM}
+    if classes is not None and header.get('class_order') is not None:
+        live['class_order'] = list(classes)
+    for key, value in live.items():
+        if header.get(key) != value:
+            return f'bundle {key} = {header.get(key)!r}, live pipeline uses {value!r}'
+    return None
+
+
+def _newest(paths):
+    return max((os.path.getmtime(p) for p in paths if os.path.exists(p)), default=0.0)
+
+
+def _bundle_source(header_path):
+    with open(header_path) as f:
+        return json.load(f).get('source')
+
+
+def load_for_inference(results_dir, verbose=True, classes=None, pruned=None):
+    '''
+    The forest the live pipeline runs: model_bundle/ (memory-mapped, newer than
+    every other model file), then model_flat.npz (python flat_forest.py),
+    otherwise model.joblib flattened on the spot. The pruned forest
+    (model_pruned.npz, prune_model.py) is opt-in: with pruned (default
+    pruned_enabled()) it is tried before model_flat.npz, and a bundle is only
+    served if it was built from the same choice. Exports older than
+    model.joblib are ignored (without a model.joblib, e.g. exports deployed
+    alone, none are). A bundle built with other feature settings (or class
+    order, if classes is given) raises ValueError rather than serving wrong
+    predictions.
+    '''
+    pruned      = pruned_enabled() if pruned is None else pruned
+    model_path  = os.path.join(results_dir, 'model.joblib')
+    header_path = os.path.join(bundle_path(results_dir), BUNDLE_HEADER)
+    exports     = (pruned_path(results_dir), flat_path(results_dir)) if pruned else (flat_path(results_dir),)
+    if (os.path.exists(header_path) and os.path.getmtime(header_path) >= _newest((model_path,) + exports)
+            and (_bundle_source(header_path) == PRUNED_NAME) == pruned):
+        path = bundle_path(results_dir)
+        flat = FlatForest.load_bundle(path)
+        problem = bundle_mismatch(flat.header, classes)
+        if problem:
+            raise ValueError(f'{path}: {problem}')
+    else:
+        for path in exports:
+            if os.path.exists(path) and os.path.getmtime(path) >= _newest([model_path]):
+                flat = FlatForest.load(path)
+                break
+        else:
+            import joblib
+            path = model_path
+            flat = FlatForest.from_sklearn(joblib.load(model_path))
+    flat.source = path
+    if verbose:
+        origin = f' (from {flat.header.get("source")})' if flat.header is not None else ''
+        print(f'  Model: {path}{origin}: {flat.n_trees} trees, max depth {flat.max_depth}')
+        if not pruned and os.path.exists(pruned_path(results_dir)):
+            print(f'  {PRUNED_NAME} not served (--pruned or EMG_PRUNED=1 to use it)')
+    return flat
+
+
+# ── Export ────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    args        = [a for a in sys.argv[1:] if not a.startswith('--')]
+    results_dir = args[0] if args else 'results_all_phases'
+    model_path  = os.path.join(results_dir, 'model.joblib')
+
+    if '--bundle' in sys.argv:
+        print(f'── Bundling {results_dir}/ ───────────────────────────')
+        flat = load_for_inference(results_dir)
+        if flat.header is not None:
+            print('  Bundle is already the newest model file — nothing to do.')
+            sys.exit(0)
+        out = bundle_path(results_dir)
+        flat.save_bundle(out, **bundle_header(results_dir, flat.source))
+        size = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out))
+        print(f'  Saved {out}/  ({size / 1e6:.1f} MB, {flat.n_trees} trees from {flat.source})')
+        sys.exit(0)
+
+    import joblib
+    if not os.path.exists(model_path):
+        print(f'Error: {model_path} not found — run the training script first.')
+        sys.exit(1)
+
+    print(f'── Exporting {model_path} ─────────────────────────')
+    model = joblib.load(model_path)
+    flat  = FlatForest.from_sklearn(model)
+    out   = flat_path(results_dir)
+    flat.save(out)
+    print(f'  {flat.n_trees} trees  |  {flat.n_nodes} nodes  |  max depth {flat.max_depth}')
+    print(f'  Saved {out}  ({os.path.getsize(out) / 1e6:.1f} MB)')
+
+    X_test_path = os.path.join(results_dir, 'X_test.npy')
+    if os.path.exists(X_test_path):
+        X_test = np.load(X_test_path)
+        model.set_params(n_jobs=1)   # sequential accumulation, same order as FlatForest
+        labels, proba = flat.predict(X_test)
+        same_label = np.array_equal(labels, model.predict(X_test))
+        same_proba = np.array_equal(proba, model.predict_proba(X_test))
+        print(f'  Check on {len(X_test)} test windows: labels {"identical" if same_label else "DIFFER"}, '
+              f'probabilities {"identical" if same_proba else "DIFFER"}')
+        if not (same_label and same_proba):
+            sys.exit(1)
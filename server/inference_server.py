@@ -0,0 +1,351 @@
+'''
+Multi-stream Inference Server
+
+One process, one model, N EMG streams (armbands / rigs). Each stream keeps
+its own acquisition ring and reader, calibration (emg_calibration.py, with
+drift tracking), StreamingFeatures window and DecisionFilter (vote +
+dwell), exactly as run_inference does for a single Myo. What is shared is
+the model call: every TICK the server drains all rings into the
+per-stream windows, and on a common stride clock (STRIDE samples of time)
+the current window of every stream goes into one preallocated batch,
+classified by a single vectorised FlatForest.predict() — one forest walk
+for all armbands instead of one per stream.
+
+Per stream, committed classes are published on sensor/myo/<device>/state,
+for dashboards and loggers: nothing in the control chain listens there.
+myo_controller moves the finger from sensor/myo/state only, so the stream
+that drives it must publish there — --drive <device>, or set
+stream.topic = myo_controller.TOPIC_MYO_STATE as control_runtime.py and
+bench_trace.py do. Server-wide metrics (decisions/s, batch size, decision
+latency from the newest sample's arrival to publish, dropped samples) go
+to system/metrics/inference_server every METRICS_INTERVAL. The model
+hot-reloads like run_inference (model_reload.py, system/model/command).
+With TRACE=1 each grip change starts a trace as in run_inference (tracing.py).
+
+Streams:
+  --stream <device>=<source spec>   repeatable (spec as in emg_source.py)
+  --synthetic N                     N synthetic armbands: rig1..rigN, cycling grips
+  --drive <device>                  publish that stream on sensor/myo/state (moves the finger)
+  --rest-gate, --early-exit[=delta] as in run_inference (per-window cascade, no batched walk)
+  --pruned                          serve model_pruned.npz, as in run_inference
+
+A 'myo' spec opens the first armband pyomyo finds, so real armbands need
+one dongle per stream.
+
+Run: python inference_server.py --stream left=myo --stream rig2=replay:data_collection/palm_steady.npy --drive left
+     python inference_server.py --synthetic 8
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+import warnings
+import numpy as np
+import paho.mqtt.client as mqtt
+
+MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
+MQTT_PORT   = int(os.getenv("MQTT_PORT", 1883))
+TOPIC_STATE   = "sensor/myo/{device}/state"
+TOPIC_DRIVE   = "sensor/myo/state"      # myo_controller's input (run_inference publishes here)
+TOPIC_METRICS = "system/metrics/inference_server"
+TOPIC_CALIB   = "system/metrics/calibration/{device}"
+
+warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+from decision_filter import DWELL_TIME, SMOOTH_N, STRIDE, DecisionFilter
+from emg_calibration import StreamingCalibration
+from emg_features import FEATURE_DIM, N_CHANNELS, SAMPLE_RATE, StreamingFeatures
+from emg_ring import SampleRing
+from emg_source import run_source
+from flat_forest import early_exit_arg, load_for_inference
+from latency_stats import LatencyHistogram
+from model_reload import TOPIC_MODEL_CMD, ModelReloader
+from rest_gate import gate_enabled, load_rest_gate
+from tracing import TRACE_ENABLED, Tracer, new_trace, state_payload, wall
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+MODEL_DIR        = 'results_all_phases'
+CLASSES          = ['cylindrical', 'lateral', 'palm', 'rest']
+TICK             = 0.005   # seconds between ring sweeps (one sample period at 200 Hz)
+METRICS_INTERVAL = 2.0
+
+
+# ── Streams ───────────────────────────────────────────────────────────────────
+
+class _Stream:
+    '''Per-device state: ring, reader, calibration, window, vote/dwell.'''
+
+    def __init__(self, device, spec):
+        self.device   = device
+        self.spec     = spec
+        self.topic    = TOPIC_STATE.format(device=device)
+        self.ring     = SampleRing()
+        self.calib    = StreamingCalibration()
+        self.features = StreamingFeatures()
+        self.decision = DecisionFilter(CLASSES, SMOOTH_N, DWELL_TIME, now=time.monotonic())
+        self.sample   = np.empty(N_CHANNELS, dtype=np.float32)
+        self.since    = 0
+        self.running  = False
+        self.published = None
+        self.stop     = threading.Event()
+        self.reader   = None
+
+    def start(self):
+        self.reader = threading.Thread(target=run_source, daemon=True, name=f'emg-{self.device}',
+                                       args=(self.spec, self.ring.put, self.stop))
+        self.reader.start()
+
+
+class InferenceServer:
+    '''
+      server = InferenceServer(model, publish)
+      server.add_stream('left', 'myo'); ...
+      server.serve(stop_event)          # or call step() yourself (see bench_multistream.py)
+
+    Decisions run on one server-wide stride clock (every STRIDE samples'
+    worth of time), so the windows of all streams line up into one batch.
+    batched=False classifies each window with its own predict_one call
+    (the one-process-per-armband cost, kept for benchmarking). With a rest
+    gate or early_exit (run_inference's --rest-gate / --early-exit) each
+    window goes through run_inference's per-decision cascade instead.
+    '''
+
+    def __init__(self, model, publish=None, batched=True, trace=TRACE_ENABLED, gate=None, early_exit=None):
+        self.model    = model
+        self.publish  = publish or (lambda topic, payload: None)
+        self.batched  = batched
+        self.gate       = gate
+        self.early_exit = early_exit
+        self.trace    = trace
+        self.tracer   = Tracer('inference_server', publish=self.publish)
+        self.streams  = []
+        self.reloader = None
+        self.period   = STRIDE / SAMPLE_RATE
+        self._next_decision = time.perf_counter() + self.period
+        self.reset_stats()
+        self._alloc_batch(8)
+
+    def reset_stats(self):
+        self.latency   = LatencyHistogram(window=5000)   # ms, newest sample arrival → decision published
+        self.decisions = 0
+        self.batches   = 0
+
+    def _alloc_batch(self, rows):
+        self._batch  = np.empty((rows, FEATURE_DIM), dtype=np.float32)
+        self._owner  = [None] * rows
+        self._stamps = np.empty(rows)
+
+    def add_stream(self, device, spec, start=True):
+        st = _Stream(device, spec)
+        self.streams.append(st)
+        if len(self._owner) < len(self.streams):
+            self._alloc_batch(2 * len(self.streams))
+        if start:
+            st.start()
+        return st
+
+    def stop(self):
+        for st in self.streams:
+            st.stop.set()
+        for st in self.streams:
+            if st.reader is not None:
+                st.reader.join(timeout=2)
+
+    # ── One sweep ─────────────────────────────────────────────────────────
+
+    def step(self):
+        '''
+        Drain every ring into its stream's window; when the stride clock is
+        due, classify the current window of every stream that has new
+        samples in one model call. Returns the number of decisions made.
+        '''
+        for st in self.streams:
+            self._drain(st)
+        now = time.perf_counter()
+        if now < self._next_decision:
+            return 0
+        # a late step (GC, slow publish) does not owe a burst of catch-up decisions
+        self._next_decision = max(self._next_decision + self.period, now)
+
+        n = 0
+        for st in self.streams:
+            if st.running and st.features.ready and st.since:
+                st.since = 0
+                st.features.features(out=self._batch[n])
+                self._owner[n]  = st
+                self._stamps[n] = st.ring.last_stamp
+                n += 1
+        if not n:
+            return 0
+
+        if self.reloader is not None:
+            staged = self.reloader.take()
+            if staged is not None:
+                self.model = staged
+        batch = self._batch[:n]
+        if self.gate is not None or self.early_exit is not None:
+            labels = [self._predict_one(row) for row in batch]
+        elif self.batched:
+            labels, _ = self.model.predict(batch)
+        else:
+            labels = [self.model.predict_one(row)[0] for row in batch]
+        t_model = time.perf_counter()
+
+        now = time.monotonic()
+        rest_idx = CLASSES.index('rest')
+        for i in range(n):
+            st   = self._owner[i]
+            pred = int(labels[i])
+            committed = st.decision.update(pred, now)
+            event = st.calib.decide(pred == rest_idx and committed == 'rest', now)
+            if event is not None:
+                self.publish(TOPIC_CALIB.format(device=st.device), json.dumps(event))
+                if event['event'] == 'drift':
+                    st.features.set_scale(st.calib.scale)
+                elif event['event'] == 'recalibrate':
+                    st.running = False
+                    st.features.reset()
+                    st.since = 0
+                    continue         # as run_inference: no state or latency until recalibrated
+            if committed != st.published:
+                trace = new_trace(wall(st.decision.candidate_since, time.monotonic)) \
+                    if self.trace and st.published is not None else None
+                self.publish(st.topic, state_payload(committed, trace))
+                st.published = committed
+                if trace is not None:
+                    stamp = self._stamps[i]
+                    self.tracer.record(trace, 'vote+dwell', trace['t0'], wall(stamp))
+                    self.tracer.record_chain(trace, ('batch', 'publish'), (stamp, t_model, time.perf_counter()),
+                                             batch=n)
+                    self.tracer.flush()
+            self.latency.record((time.perf_counter() - self._stamps[i]) * 1000)
+        self.decisions += n
+        self.batches   += 1
+        return n
+
+    def _predict_one(self, row):
+        # run_inference: the gate answers clear rest, the forest (early exit) the rest
+        if self.gate is not None and self.gate.is_rest(row):
+            return CLASSES.index('rest')
+        if self.early_exit is None:
+            return self.model.predict_one(row)[0]
+        return self.model.predict_one_early(row, self.early_exit)[0]
+
+    def _drain(self, st):
+        ring, sample = st.ring, st.sample
+        while ring.get_into(sample, 0):
+            st.calib.push(sample)
+            if not st.calib.ready:
+                continue
+            if not st.running:
+                st.running = True
+                st.features.set_scale(st.calib.scale)
+            st.features.push(st.features.normalise(sample))
+            st.since += 1
+
+    # ── Loop ──────────────────────────────────────────────────────────────
+
+    def metrics(self, elapsed):
+        return {
+            'streams':            len(self.streams),
+            'decisions_per_sec':  round(self.decisions / elapsed, 1) if elapsed else 0.0,
+            'mean_batch':         round(self.decisions / self.batches, 2) if self.batches else 0.0,
+            'latency_ms':         self.latency.summary(),
+            'dropped':            {st.device: st.ring.dropped for st in self.streams},
+        }
+
+    def serve(self, stop):
+        next_tick    = time.perf_counter()
+        last_metrics = t0 = time.monotonic()
+        while not stop.is_set():
+            self.step()
+            now = time.monotonic()
+            if now - last_metrics >= METRICS_INTERVAL:
+                self.publish(TOPIC_METRICS, json.dumps(self.metrics(now - t0)))
+                last_metrics = now
+            next_tick += TICK
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()    # fell behind: don't try to catch up
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+def stream_specs(argv):
+    '''[(device, spec)] from --stream device=spec (repeatable) and --synthetic N.'''
+    specs = []
+    for i, arg in enumerate(argv):
+        if arg == '--stream' and i + 1 < len(argv):
+            device, _, spec = argv[i + 1].partition('=')
+            specs.append((device, spec or 'myo'))
+        elif arg == '--synthetic' and i + 1 < len(argv):
+            specs += [(f'rig{k + 1}', f'synthetic:grip=cycle,seed={k}')
+                      for k in range(int(argv[i + 1]))]
+    return specs
+
+
+def main():
+    specs = stream_specs(sys.argv[1:])
+    if not specs:
+        print(__doc__)
+        sys.exit(1)
+
+    mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    try:
+        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        mqtt_client.loop_start()
+    except Exception as e:
+        print(f"Warning: MQTT not connected in inference_server.py: {e}")
+
+    print('Loading model...')
+    model  = load_for_inference(MODEL_DIR, classes=CLASSES)
+    server = InferenceServer(model, publish=mqtt_client.publish, early_exit=early_exit_arg(),
+                             gate=load_rest_gate(MODEL_DIR) if gate_enabled() else None)
+    server.reloader = ModelReloader(MODEL_DIR, model, CLASSES, FEATURE_DIM, publish=mqtt_client.publish)
+    server.reloader.start_watching()
+    mqtt_client.message_callback_add(TOPIC_MODEL_CMD,
+                                     lambda c, u, msg: server.reloader.on_command(msg.payload.decode()))
+    mqtt_client.subscribe(TOPIC_MODEL_CMD)
+
+    drive = sys.argv[sys.argv.index('--drive') + 1] if '--drive' in sys.argv[:-1] else None
+    if drive is not None and drive not in dict(specs):
+        sys.exit(f'--drive {drive}: no such stream ({", ".join(d for d, _ in specs)})')
+    print(f'\n── Streams ({len(specs)}) ──────────────────────────────────────')
+    for device, spec in specs:
+        stream = server.add_stream(device, spec)
+        if device == drive:
+            stream.topic = TOPIC_DRIVE
+        print(f'  {device:<12} {spec:<40} → {stream.topic}')
+    print('\nRunning — relax for the first seconds (per-stream calibration). Ctrl+C to stop.\n')
+
+    stop = threading.Event()
+    worker = threading.Thread(target=server.serve, args=(stop,), daemon=True)
+    t0 = time.monotonic()
+    worker.start()
+    try:
+        while worker.is_alive():
+            time.sleep(METRICS_INTERVAL)
+            m = server.metrics(time.monotonic() - t0)
+            lat = m['latency_ms']
+            states = '  '.join(f'{st.device}:{st.published or "…"}' for st in server.streams[:8])
+            print(f'\r  {m["decisions_per_sec"]:>7.1f} dec/s  batch {m["mean_batch"]:>5.2f}  '
+                  f'p99 {lat.get("p99", 0):>6.2f}ms   {states}', end='', flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        worker.join(timeout=2)
+        server.reloader.stop()
+        server.stop()
+        mqtt_client.loop_stop()
+        mqtt_client.disconnect()
+        print('\nDone.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Rolling Latency Statistics
+
+Per-stage latency histograms for the live pipeline. Each stage keeps the
+last `window` samples in a preallocated ring and reports p50/p95/p99/max
+on demand, so percentiles always describe recent behaviour rather than
+the whole session.
+
+  stats = StageStats(['queue', 'features', 'model'])
+  stats.record('model', ms)
+  stats.summary()   →  {'model': {'n': .., 'p50': .., 'p95': .., 'p99': .., 'max': ..}, ...}
+
+Summaries are plain dicts of floats, ready for json.dumps onto an MQTT
+metrics topic.
+'''
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    '''Rolling window of the most recent latency samples (ms).'''
+
+    def __init__(self, window=1000):
+        self._buf   = np.zeros(window)
+        self._next  = 0
+        self._count = 0
+
+    def record(self, ms):
+        self._buf[self._next] = ms
+        self._next = (self._next + 1) % len(self._buf)
+        if self._count < len(self._buf):
+            self._count += 1
+
+    def summary(self):
+        if not self._count:
+            return {'n': 0}
+        vals = self._buf[:self._count]
+        p = np.percentile(vals, PERCENTILES)
+        out = {'n': self._count}
+        out.update({f'p{q}': round(float(v), 3) for q, v in zip(PERCENTILES, p)})
+        out['max'] = round(float(vals.max()), 3)
+        return out
+
+
+class StageStats:
+    '''One LatencyHistogram per named stage, in pipeline order.'''
+
+    def __init__(self, stages, window=1000):
+        self.stages = list(stages)
+        self._hist  = {s: LatencyHistogram(window) for s in self.stages}
+
+    def record(self, stage, ms):
+        self._hist[stage].record(ms)
+
+    def summary(self):
+        return {s: self._hist[s].summary() for s in self.stages}
+
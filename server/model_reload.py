@@ -0,0 +1,234 @@
+'''
+Hot Model Reload
+
+Lets run_inference pick up a retrained model without restarting (and
+without recalibrating). A reload is requested by:
+  - the results directory changing: model.joblib, model_flat.npz,
+    model_pruned.npz or model_bundle/header.json gets a new mtime/size
+    (polled every WATCH_INTERVAL, and only acted on once it has been stable
+    for one more poll, so a file still being written is not loaded half-way)
+  - an MQTT command on system/model/command: 'reload' or 'rollback'
+    (or JSON {"cmd": "reload" | "rollback"})
+
+The new model is loaded and pre-warmed in a background thread
+(load_for_inference, then PREWARM_CALLS predictions on a dummy window),
+checked against the live class list and feature width, and staged. The
+inference loop calls take() between strides: a staged model replaces the
+current one with a single reference swap, the acquisition ring keeps
+filling meanwhile, so no samples are lost. The replaced model is kept in
+memory; 'rollback' stages it again without touching the disk.
+
+Every outcome is reported as JSON on system/model/status:
+  {'event': 'staged' | 'swapped' | 'rolled_back' | 'first_live_predict' | 'rejected' | 'error',
+   'path', 'trees', 'max_depth', 'load_ms', 'first_predict_ms', 'warm_predict_ms', ...}
+
+Run: python model_reload.py [results_dir]   (loads + pre-warms once, prints the timings)
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+from flat_forest import BUNDLE_HEADER, BUNDLE_NAME, FLAT_NAME, PRUNED_NAME, load_for_inference
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+TOPIC_MODEL_CMD    = 'system/model/command'
+TOPIC_MODEL_STATUS = 'system/model/status'
+WATCH_INTERVAL     = 1.0    # seconds between results-directory polls
+PREWARM_CALLS      = 20     # dummy predictions before a model goes live
+WATCHED            = ('model.joblib', FLAT_NAME, PRUNED_NAME, os.path.join(BUNDLE_NAME, BUNDLE_HEADER))
+
+
+def directory_signature(results_dir):
+    '''(name, mtime_ns, size) of every model file present — changes on any rewrite.'''
+    sig = []
+    for name in WATCHED:
+        try:
+            st = os.stat(os.path.join(results_dir, name))
+        except OSError:
+            continue
+        sig.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def _describe(model):
+    return {'path': getattr(model, 'source', None), 'trees': model.n_trees,
+            'max_depth': model.max_depth}
+
+
+class ModelReloader:
+    '''
+    Owns the live model reference for the inference loop.
+
+      reloader = ModelReloader(results_dir, model, classes, n_features, publish)
+      reloader.start_watching()            # optional directory watch
+      reloader.on_command('reload')        # e.g. from an MQTT callback
+      ...
+      staged = reloader.take()             # between strides, in the inference thread
+      if staged is not None: model = staged
+
+    publish(topic, payload_str) is called from the loader / watcher threads.
+    '''
+
+    def __init__(self, results_dir, model, classes, n_features, publish=None):
+        self.results_dir = results_dir
+        self.current     = model
+        self.previous    = None
+        self.classes     = list(classes)
+        self.n_features  = n_features
+        self.publish     = publish
+        self.swaps       = 0
+
+        self._staged     = None      # (model, info) waiting for take()
+        self._first_live = False
+        self._lock       = threading.Lock()
+        self._loading    = threading.Lock()
+        self._stop       = threading.Event()
+        self._watcher    = None
+
+    # ── Requests ──────────────────────────────────────────────────────────
+
+    def on_command(self, payload):
+        ''''reload' / 'rollback', plain or as JSON {"cmd": ...}.'''
+        cmd = payload.strip()
+        if cmd.startswith('{'):
+            try:
+                cmd = json.loads(cmd).get('cmd', '')
+            except ValueError:
+                cmd = ''
+        if cmd == 'reload':
+            self.request_reload('command')
+        elif cmd == 'rollback':
+            self.rollback()
+        else:
+            self._report({'event': 'error', 'error': f'unknown command {payload!r}'})
+
+    def request_reload(self, reason='command'):
+        '''Load + pre-warm in a background thread; ignored while a load is running.'''
+        if not self._loading.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._load, args=(reason,), daemon=True).start()
+        return True
+
+    def rollback(self):
+        '''Stage the model that was live before the last swap (kept in memory).'''
+        with self._lock:
+            if self.previous is None:
+                info = {'event': 'error', 'error': 'no previous model to roll back to'}
+            else:
+                info = {'event': 'staged', 'reason': 'rollback', **_describe(self.previous)}
+                self._staged = (self.previous, info)
+        self._report(info)
+
+    # ── Inference-thread side ─────────────────────────────────────────────
+
+    def take(self):
+        '''Staged model if one is waiting (it becomes current), else None. Cheap when idle.'''
+        if self._staged is None:
+            return None
+        with self._lock:
+            model, info = self._staged
+            self._staged  = None
+            self.previous = self.current
+            self.current  = model
+            self.swaps   += 1
+        event = 'rolled_back' if info.get('reason') == 'rollback' else 'swapped'
+        self._report({**info, 'event': event, 'swaps': self.swaps})
+        self._first_live = True
+        return model
+
+    def live_prediction(self, ms):
+        '''Report the first live prediction after a swap (call after each model call).'''
+        if self._first_live:
+            self._first_live = False
+            self._report({'event': 'first_live_predict', 'predict_ms': round(ms, 3),
+                          'swaps': self.swaps, **_describe(self.current)})
+
+    # ── Loader ────────────────────────────────────────────────────────────
+
+    def _load(self, reason):
+        try:
+            t0 = time.perf_counter()
+            model = load_for_inference(self.results_dir, verbose=False, classes=self.classes)
+            load_ms = (time.perf_counter() - t0) * 1000
+
+            problem = self._check(model)
+            if problem:
+                self._report({'event': 'rejected', 'reason': reason, 'error': problem,
+                              **_describe(model)})
+                return
+
+            # First call pays for page faults / lazy numpy setup; the rest are steady state
+            x = np.zeros((1, self.n_features), dtype=np.float32)
+            t0 = time.perf_counter()
+            model.predict_one(x)
+            first_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            for _ in range(PREWARM_CALLS - 1):
+                model.predict_one(x)
+            warm_ms = (time.perf_counter() - t0) * 1000 / max(PREWARM_CALLS - 1, 1)
+
+            info = {'event': 'staged', 'reason': reason, **_describe(model),
+                    'load_ms': round(load_ms, 2), 'first_predict_ms': round(first_ms, 3),
+                    'warm_predict_ms': round(warm_ms, 3)}
+            with self._lock:
+                self._staged = (model, info)
+            self._report(info)
+        except Exception as e:
+            self._report({'event': 'error', 'reason': reason, 'error': f'{type(e).__name__}: {e}'})
+        finally:
+            self._loading.release()
+
+    def _check(self, model):
+        if len(model.value[0]) != len(self.classes):
+            return f'{len(model.value[0])} classes, live pipeline has {len(self.classes)}'
+        if model.feature.max() >= self.n_features:
+            return f'uses feature {int(model.feature.max())}, live pipeline has {self.n_features}'
+        return None
+
+    # ── Directory watch ───────────────────────────────────────────────────
+
+    def start_watching(self, interval=WATCH_INTERVAL):
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self, interval):
+        seen = directory_signature(self.results_dir)
+        last = seen
+        while not self._stop.wait(interval):
+            sig = directory_signature(self.results_dir)
+            # Act on a change only once it has held for a full poll (writes finished)
+            if sig == last and sig != seen and sig:
+                if self.request_reload('watch'):
+                    seen = sig
+            last = sig
+
+    def _report(self, info):
+        if self.publish is not None:
+            self.publish(TOPIC_MODEL_STATUS, json.dumps(info))
+
+
+# ── Self-check ────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    from emg_features import FEATURE_DIM
+
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results_all_phases'
+    model = load_for_inference(results_dir)
+    reloader = ModelReloader(results_dir, model, ['cylindrical', 'lateral', 'palm', 'rest'],
+                             FEATURE_DIM, publish=lambda topic, payload: print(f'  {topic}  {payload}'))
+
+    print('── Reload ────────────────────────────────────────────')
+    reloader.request_reload('manual')
+    while reloader.take() is None:
+        time.sleep(0.01)
+    print('\n── Rollback ──────────────────────────────────────────')
+    reloader.on_command('rollback')
+    assert reloader.take() is model
@@ -2,10 +2,15 @@ import time
 import json
 import os
 import threading
+from collections import deque
 import paho.mqtt.client as mqtt
 from dynamixel_sdk import *
 from dotenv import load_dotenv
 
+from latency_stats import LatencyHistogram
+from readiness import notify_ready
+from tracing import Tracer, wall
+
 load_dotenv()
 
 # MQTT config
@@ -13,24 +18,70 @@ MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
 MQTT_PORT   = int(os.getenv("MQTT_PORT", 1883))
 MQTT_TOPIC = "motor/command"
 TOPIC_TELEMETRY = "motor/telemetry"
+TOPIC_METRICS = "system/metrics/motor"
 
 # motor config
 DXL_ID_1 = 1
 DXL_ID_2 = 2
+MOTOR_IDS = [DXL_ID_1, DXL_ID_2]
 BAUDRATE = 1000000
 DEVICENAME = os.getenv("DEVICE_NAME", "COM7")
 PROTOCOL_VERSION = 2.0
 
 ADDR_OPERATING_MODE = 11
 ADDR_TORQUE_ENABLE = 64
+ADDR_HARDWARE_ERROR = 70
 ADDR_GOAL_POSITION = 116
+ADDR_MOVING = 122
 ADDR_PRESENT_POSITION = 132
 ADDR_PROFILE_ACCELERATION = 108
 ADDR_PROFILE_VELOCITY = 112
 
+# physical bounds per motor
+POSITION_LIMITS = {DXL_ID_1: (3000, 4300), DXL_ID_2: (3000, 6900)}
+
+# telemetry polls fast while a motor moves or is short of its goal, slow once everything
+# has been still for TELEMETRY_IDLE_AFTER; a sample is published only if a position moved
+# by TELEMETRY_DEADBAND ticks, motion started/stopped, or TELEMETRY_HEARTBEAT passed
+TELEMETRY_ACTIVE_INTERVAL = 0.02   # seconds between position sync reads while moving
+TELEMETRY_IDLE_INTERVAL = 0.5      # seconds between position sync reads while idle
+TELEMETRY_IDLE_AFTER = 0.5         # seconds without motion before dropping to the idle rate
+TELEMETRY_DEADBAND = 5             # ticks
+TELEMETRY_HEARTBEAT = 5.0          # seconds
+GOAL_TOLERANCE = 10                # ticks between goal and present position that count as arrived
+HW_ERROR_INTERVAL = 1.0     # seconds between hardware error status sync reads
+METRICS_INTERVAL = 2.0      # seconds between bus metrics publishes
+
+# goals go into a latest-wins slot per motor, written at most GOAL_RATE times per second
+GOAL_RATE = 100             # goal sync writes per second
+
+# one thread owns the bus and runs jobs in this order; a job that waited longer
+# than its class deadline (ms, from runnable to started) counts as a miss
+BUS_PRIORITY = ("stop", "goal", "telemetry", "diagnostics")
+BUS_DEADLINE_MS = {"stop": 5.0, "goal": 15.0, "telemetry": 25.0, "diagnostics": 500.0}
+
 portHandler = PortHandler(DEVICENAME)
 packetHandler = PacketHandler(PROTOCOL_VERSION)
 
+def sync_groups(port):
+    # one sync write packet carries every motor's goal (no status packets to wait for),
+    # one sync read packet collects both motors' Moving flag .. Present Position (122-135) / error states
+    goal_writer = GroupSyncWrite(port, packetHandler, ADDR_GOAL_POSITION, 4)
+    position_reader = GroupSyncRead(port, packetHandler, ADDR_MOVING, ADDR_PRESENT_POSITION + 4 - ADDR_MOVING)
+    error_reader = GroupSyncRead(port, packetHandler, ADDR_HARDWARE_ERROR, 1)
+    for motor_id in MOTOR_IDS:
+        position_reader.addParam(motor_id)
+        error_reader.addParam(motor_id)
+    return goal_writer, position_reader, error_reader
+
+goal_writer, position_reader, error_reader = sync_groups(portHandler)
+
+# last goal written per motor (telemetry compares it with the present position)
+last_goals = {}
+
+# spans of traced commands (tracing.py): slot wait, sync write, motion, telemetry
+tracer = Tracer("motor_driver")
+
 # Prevent serial collisions between the read loop and incoming MQTT commands
 port_lock = threading.Lock()
 
@@ -39,6 +90,16 @@ def get_signed_position(unsigned_val):
         return unsigned_val - 4294967296
     return unsigned_val
 
+def clamp_position(motor_id, position):
+    low, high = POSITION_LIMITS.get(motor_id, (position, position))
+    return min(max(position, low), high)
+
+def position_bytes(position):
+    if position < 0:
+        position = 4294967296 + position
+    return [DXL_LOBYTE(DXL_LOWORD(position)), DXL_HIBYTE(DXL_LOWORD(position)),
+            DXL_LOBYTE(DXL_HIWORD(position)), DXL_HIBYTE(DXL_HIWORD(position))]
+
 def setup_motors():
     if portHandler.openPort():
         print("Succeeded to open the port")
@@ -67,25 +128,62 @@ def setup_motors():
             else:
                 print(f"Dynamixel {motor_id} Ready (Extended Mode)")
 
-def move_motor(motor_id, position):
-    if position < 0:
-        position = 4294967296 + position
+def write_goals(goals):
+    # goals: {motor_id: position}, one sync write packet; call with port_lock held
+    for motor_id, position in goals.items():
+        goal_writer.addParam(motor_id, position_bytes(position))
+    dxl_comm_result = goal_writer.txPacket()
+    goal_writer.clearParam()
+    if dxl_comm_result != COMM_SUCCESS:
+        print(f"move motors {list(goals)} Comm Error: {packetHandler.getTxRxResult(dxl_comm_result)}")
+    else:
+        last_goals.update(goals)
+    return dxl_comm_result
 
-    # goal position
+def move_motors(goals):
     with port_lock:
-        dxl_comm_result, dxl_error = packetHandler.write4ByteTxRx(portHandler, motor_id, ADDR_GOAL_POSITION, position)
-    
-        if dxl_comm_result != COMM_SUCCESS:
-            print(f"move motor {motor_id} Comm Error: {packetHandler.getTxRxResult(dxl_comm_result)}")
-        elif dxl_error != 0:
-            print(f"move motor {motor_id} Packet Error: {packetHandler.getRxPacketError(dxl_error)}")
+        return write_goals(goals)
+
+def move_motor(motor_id, position):
+    return move_motors({motor_id: position})
 
 def stop_motor(motor_id):
     # stops motor by reading current position and setting it as goal
     with port_lock:
-        current_pos, _, _ = packetHandler.read4ByteTxRx(portHandler, motor_id, ADDR_PRESENT_POSITION)
-        packetHandler.write4ByteTxRx(portHandler, motor_id, ADDR_GOAL_POSITION, current_pos)
-    print(f"Motor {motor_id} Halted at {current_pos}")
+        current_pos, dxl_comm_result, _ = packetHandler.read4ByteTxRx(portHandler, motor_id, ADDR_PRESENT_POSITION)
+        if dxl_comm_result != COMM_SUCCESS:
+            print(f"stop motor {motor_id} Comm Error: {packetHandler.getTxRxResult(dxl_comm_result)}")
+            return
+        write_goals({motor_id: get_signed_position(current_pos)})
+    print(f"Motor {motor_id} Halted at {get_signed_position(current_pos)}")
+
+def read_state():
+    # ({motor_id: signed position}, {motor_id: moving flag}) from one sync read, or (None, None) if it failed
+    with port_lock:
+        dxl_comm_result = position_reader.txRxPacket()
+    if dxl_comm_result != COMM_SUCCESS:
+        return None, None
+    positions = {motor_id: get_signed_position(position_reader.getData(motor_id, ADDR_PRESENT_POSITION, 4))
+                 for motor_id in MOTOR_IDS}
+    moving = {motor_id: bool(position_reader.getData(motor_id, ADDR_MOVING, 1)) for motor_id in MOTOR_IDS}
+    return positions, moving
+
+def read_positions():
+    # {motor_id: signed position} from one sync read, or None if the bus read failed
+    return read_state()[0]
+
+def check_hardware_errors():
+    # status packets of a sync write carry no error byte, so poll Hardware Error Status instead
+    with port_lock:
+        dxl_comm_result = error_reader.txRxPacket()
+    if dxl_comm_result != COMM_SUCCESS:
+        print(f"[WARNING] Hardware error read failed: {packetHandler.getTxRxResult(dxl_comm_result)}")
+        return
+    for motor_id in MOTOR_IDS:
+        status = error_reader.getData(motor_id, ADDR_HARDWARE_ERROR, 1)
+        if status:
+            print(f"[CRITICAL] Hardware Error ID {motor_id}: status 0x{status:02x}")
+            print("Action: Please check if motor is stalled or overheated.")
 
 def shutdown_motors():
     # disable torque before quitting
@@ -95,47 +193,299 @@ def shutdown_motors():
         portHandler.closePort()
     print("motors shutdown")
 
+class GoalSlots:
+    # latest goal per motor; the bus owner writes whatever is pending, superseded goals never reach the bus
+    def __init__(self, wake=None):
+        self.wake = wake or threading.Event()
+        self._slots = {}            # motor_id -> (position, time received, trace context or None)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.received = 0           # goals submitted
+        self.coalesced = 0          # goals replaced by a newer one (or a stop) before being written
+        self.executed = 0           # goals written to the bus
+        self.writes = 0             # sync write packets
+        self.delay = LatencyHistogram(window=2000)   # ms, goal received -> written
+
+    def submit(self, goals, trace=None):
+        now = time.perf_counter()
+        with self._lock:
+            for motor_id, position in goals.items():
+                replaced = self._slots.get(motor_id)
+                if replaced is not None:
+                    self.coalesced += 1
+                    tracer.record(replaced[2], f"superseded m{motor_id}", wall(now), wall(now))
+                self._slots[motor_id] = (position, now, trace)
+            self.received += len(goals)
+        self.wake.set()
+
+    def discard(self, motor_id):
+        # drop a pending goal (stop must not be overridden by an older goal)
+        with self._lock:
+            dropped = self._slots.pop(motor_id, None)
+        if dropped is not None:
+            self.coalesced += 1
+            tracer.record(dropped[2], f"stopped m{motor_id}", time.time(), time.time())
+
+    def oldest(self):
+        # receive time of the oldest pending goal, or None
+        with self._lock:
+            return min((received for _, received, _ in self._slots.values()), default=None)
+
+    def take(self):
+        with self._lock:
+            pending, self._slots = self._slots, {}
+        return pending
+
+    def written(self, pending, when):
+        for _, received, _ in pending.values():
+            self.delay.record((when - received) * 1000)
+        self.executed += len(pending)
+        self.writes += 1
+
+    def metrics(self):
+        return {"received": self.received, "coalesced": self.coalesced, "executed": self.executed,
+                "writes": self.writes, "pending": len(self._slots), "delay_ms": self.delay.summary()}
+
+
+class AdaptiveTelemetry:
+    # poll rate and publish decision for motor/telemetry; only the bus owner thread calls this
+    def __init__(self, active_interval=TELEMETRY_ACTIVE_INTERVAL, idle_interval=TELEMETRY_IDLE_INTERVAL,
+                 idle_after=TELEMETRY_IDLE_AFTER, deadband=TELEMETRY_DEADBAND, heartbeat=TELEMETRY_HEARTBEAT):
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self.active_until = 0.0     # poll fast until then
+        self.moving = False
+        self._in_motion = False     # moving as of the last read
+        self._last = None           # positions of the previous read
+        self._published = None      # positions of the last published sample
+        self._published_at = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.reads = 0              # position sync reads
+        self.published = 0          # samples published
+        self.heartbeats = 0         # of which only because the heartbeat was due
+
+    def interval(self, now):
+        # stay fast until a read has seen (and published) the end of the motion
+        return self.active_interval if now < self.active_until or self.moving else self.idle_interval
+
+    def goal_written(self, now):
+        # a new goal means motion is coming: poll fast before the first read sees it
+        self.active_until = now + self.idle_after
+
+    def _moved(self, positions, reference):
+        return reference is None or any(abs(positions[motor_id] - reference[motor_id]) >= self.deadband
+                                        for motor_id in positions)
+
+    def sample(self, positions, moving_flags, goals, now):
+        # True if this read should be published
+        self.reads += 1
+        moving = (any(moving_flags.values())
+                  or any(abs(goals[motor_id] - position) > GOAL_TOLERANCE
+                         for motor_id, position in positions.items() if motor_id in goals)
+                  or (self._last is not None and self._moved(positions, self._last)))
+        self._last = positions
+        if moving:
+            self.active_until = now + self.idle_after
+        # the read where the motors come to rest publishes the settled position right away;
+        # moving = polling fast, and the read that ends that is published too
+        settled = self._in_motion and not moving
+        self._in_motion = moving
+        active = now < self.active_until
+        changed = active != self.moving
+        self.moving = active
+
+        moved = self._moved(positions, self._published)
+        due = self._published_at is None or now - self._published_at >= self.heartbeat
+        if not (changed or settled or moved or due):
+            return False
+        if not (changed or settled or moved):
+            self.heartbeats += 1
+        self._published, self._published_at = positions, now
+        self.published += 1
+        return True
+
+    def metrics(self):
+        return {"reads": self.reads, "published": self.published, "heartbeats": self.heartbeats,
+                "moving": self.moving, "interval_ms": self.interval(time.perf_counter()) * 1000}
+
+
+class BusOwner:
+    # the only thread that talks to the motors once running: a fixed-priority,
+    # non-preemptive scheduler over stop > goal > telemetry > diagnostics
+    def __init__(self, slots, on_telemetry=None, goal_rate=GOAL_RATE, telemetry=None,
+                 diagnostics_interval=HW_ERROR_INTERVAL):
+        self.slots = slots
+        # on_telemetry(positions, moving, trace): trace is the context of a traced goal this sample shows reached
+        self.on_telemetry = on_telemetry or (lambda positions, moving, trace: None)
+        self.goal_period = 1.0 / goal_rate
+        self.telemetry = telemetry or AdaptiveTelemetry()
+        self.diagnostics_interval = diagnostics_interval
+        self.wake = slots.wake
+        self._stops = deque()       # (motor_id, time requested)
+        self._awaiting = {}         # motor_id -> (goal, trace, time written) of the last traced goal
+        self._halt = threading.Event()
+        self._worker = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.queue_wait = {cls: LatencyHistogram(window=2000) for cls in BUS_PRIORITY}   # ms, runnable -> started
+        self.hold = {cls: LatencyHistogram(window=2000) for cls in BUS_PRIORITY}         # ms, port held
+        self.deadline_misses = {cls: 0 for cls in BUS_PRIORITY}
+        self.jobs = {cls: 0 for cls in BUS_PRIORITY}
+        self.stop_to_halt = LatencyHistogram(window=200)   # ms, stop requested -> halt goal written
+
+    def request_stop(self, motor_id):
+        self.slots.discard(motor_id)
+        self._stops.append((motor_id, time.perf_counter()))
+        self.wake.set()
+
+    def start(self):
+        self._worker = threading.Thread(target=self._run, daemon=True, name="bus-owner")
+        self._worker.start()
+
+    def stop(self):
+        self._halt.set()
+        self.wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=1)
+
+    def _next_job(self, now, due):
+        # (class, time it became runnable) of the most urgent runnable job, or (None, next wake-up time)
+        if self._stops:
+            return "stop", self._stops[0][1]
+        oldest = self.slots.oldest()
+        if oldest is not None:
+            ready = max(oldest, due["goal"])
+            if ready <= now:
+                return "goal", ready
+        for cls in ("telemetry", "diagnostics"):
+            if due[cls] <= now:
+                return cls, due[cls]
+        wake_at = min(due["telemetry"], due["diagnostics"])
+        if oldest is not None:
+            wake_at = min(wake_at, max(oldest, due["goal"]))
+        return None, wake_at
+
+    def _run(self):
+        now = time.perf_counter()
+        due = {"goal": now, "telemetry": now, "diagnostics": now}
+        while not self._halt.is_set():
+            self.wake.clear()
+            now = time.perf_counter()
+            cls, ready = self._next_job(now, due)
+            if cls is None:
+                self.wake.wait(max(ready - now, 0.0))
+                continue
+
+            started = time.perf_counter()
+            if cls == "stop":
+                motor_id, _ = self._stops.popleft()
+                stop_motor(motor_id)
+                awaiting = self._awaiting.pop(motor_id, None)
+                if awaiting is not None:
+                    tracer.record(awaiting[1], f"stopped m{motor_id}", wall(started), wall(started))
+            elif cls == "goal":
+                pending = self.slots.take()
+                with port_lock:
+                    write_goals({motor_id: position for motor_id, (position, _, _) in pending.items()})
+                self._trace_goals(pending, started)
+            elif cls == "telemetry":
+                positions, moving = read_state()
+                if positions is not None:
+                    publish = self.telemetry.sample(positions, moving, last_goals, started)
+                    arrived = self._arrived(positions)
+                    if publish or arrived:
+                        self.on_telemetry(positions, self.telemetry.moving, arrived[-1][1] if arrived else None)
+                    self._trace_arrivals(arrived, started)
+            else:
+                check_hardware_errors()
+            done = time.perf_counter()
+            tracer.flush()
+
+            wait = (started - ready) * 1000
+            self.queue_wait[cls].record(wait)
+            self.hold[cls].record((done - started) * 1000)
+            self.jobs[cls] += 1
+            if wait > BUS_DEADLINE_MS[cls]:
+                self.deadline_misses[cls] += 1
+            if cls == "stop":
+                self.stop_to_halt.record((done - ready) * 1000)
+            elif cls == "goal":
+                self.slots.written(pending, done)
+                due["goal"] = done + self.goal_period
+                # a goal wakes idle telemetry instead of leaving it asleep for the idle interval
+                self.telemetry.goal_written(done)
+                due["telemetry"] = min(due["telemetry"], done + self.telemetry.active_interval)
+            elif cls == "telemetry":
+                # reads that fell behind skip ahead instead of bunching up
+                due[cls] = max(due[cls] + self.telemetry.interval(done), done)
+            else:
+                due[cls] = max(due[cls] + self.diagnostics_interval, done)
+
+    def _trace_goals(self, pending, started):
+        done = time.perf_counter()
+        for motor_id, (position, received, trace) in pending.items():
+            if trace is None:
+                continue
+            tracer.record(trace, f"slot m{motor_id}", wall(received), wall(started))
+            tracer.record(trace, f"write m{motor_id}", wall(started), wall(done))
+            replaced = self._awaiting.get(motor_id)
+            if replaced is not None:
+                tracer.record(replaced[1], f"superseded m{motor_id}", wall(done), wall(done))
+            self._awaiting[motor_id] = (position, trace, done)
+
+    def _arrived(self, positions):
+        # [(motor_id, trace, time written)] of traced goals this read shows reached
+        return [(motor_id, trace, written) for motor_id, (goal, trace, written) in self._awaiting.items()
+                if abs(positions[motor_id] - goal) <= GOAL_TOLERANCE]
+
+    def _trace_arrivals(self, arrived, started):
+        done = time.perf_counter()
+        for motor_id, trace, written in arrived:
+            del self._awaiting[motor_id]
+            tracer.record(trace, f"motion m{motor_id}", wall(written), wall(started))
+            tracer.record(trace, f"telemetry m{motor_id}", wall(started), wall(done))
+
+    def metrics(self):
+        return {"goals": self.slots.metrics(),
+                "stop_to_halt_ms": self.stop_to_halt.summary(),
+                "telemetry": self.telemetry.metrics(),
+                "bus": {cls: {"jobs": self.jobs[cls], "deadline_ms": BUS_DEADLINE_MS[cls],
+                              "deadline_misses": self.deadline_misses[cls],
+                              "queue_wait_ms": self.queue_wait[cls].summary(),
+                              "hold_ms": self.hold[cls].summary()} for cls in BUS_PRIORITY}}
+
+goal_slots = GoalSlots()
+bus_owner = BusOwner(goal_slots)
+
+def parse_goals(payload):
+    # {"goals": {"1": 3500, "2": 4000}} (myo_controller, comm_bridge)  or  {"id": 1, "position": 3500} (dashboard)
+    if 'goals' in payload:
+        goals = {int(motor_id): int(position) for motor_id, position in payload['goals'].items()}
+    else:
+        goals = {int(payload['id']): int(payload['position'])}
+    return {motor_id: clamp_position(motor_id, position) for motor_id, position in goals.items()}
+
 def on_message(client, userdata, msg):
     try:
         payload = json.loads(msg.payload.decode())
-        
-        target_id = int(payload['id'])
         mode = payload.get('mode', 'move')
         
         if mode == "stop":
+            target_id = int(payload['id'])
             print(f"UI Command: Stopping Motor {target_id}")
-            stop_motor(target_id)
+            bus_owner.request_stop(target_id)
             return
 
-        target_position = int(payload['position'])
-        
-        # print(f"motor id: {target_id}, position: {target_position}")
-
-        # define physical bounds
-        if target_id == 1:
-            if target_position < 3000: target_position = 3000
-            if target_position > 4300: target_position = 4300
-        if target_id == 2:
-            if target_position < 3000: target_position = 3000
-            if target_position > 6900: target_position = 6900
-
-        move_motor(target_id, target_position)
-        
-        # delay to let the bus stabilize
-        # time.sleep(0.01)
-
-        dxl_present_position, dxl_comm_result, dxl_error = packetHandler.read4ByteTxRx(portHandler, target_id, ADDR_PRESENT_POSITION)
-        
-        if dxl_comm_result != COMM_SUCCESS:
-            print(f"[WARNING] Read Failed ID {target_id}: {packetHandler.getTxRxResult(dxl_comm_result)}")
-        elif dxl_error != 0:
-            print(f"[CRITICAL] Hardware Error ID {target_id}: {packetHandler.getRxPacketError(dxl_error)}")
-            print("Action: Please check if motor is stalled or overheated.")
-        else:
-            # print current position if success
-            # real_position = get_signed_position(dxl_present_position)
-            # print(f"[SUCCESS] ID {target_id} at {real_position}")
-            pass
+        # no read-after-write: telemetry reads positions, check_hardware_errors reports faults
+        goal_slots.submit(parse_goals(payload), payload.get('trace'))
 
     except Exception as e:
         # prevents "list index out of range" crash
@@ -154,21 +504,25 @@ if __name__ == "__main__":
         client.subscribe(MQTT_TOPIC)
         print(f"Listening for commands on '{MQTT_TOPIC}'...")
 
+        def publish_telemetry(positions, moving, trace):
+            telemetry_payload = {
+                "m1_pos": positions[DXL_ID_1],
+                "m2_pos": positions[DXL_ID_2],
+                "moving": moving
+            }
+            if trace is not None:
+                telemetry_payload["trace"] = trace
+            client.publish(TOPIC_TELEMETRY, json.dumps(telemetry_payload))
+
+        bus_owner.on_telemetry = publish_telemetry
+        tracer.publish = client.publish
+        bus_owner.start()
         client.loop_start()
+        notify_ready("motor_driver", client)
 
         while True:
-            with port_lock:
-                pos1, comm1, err1 = packetHandler.read4ByteTxRx(portHandler, DXL_ID_1, ADDR_PRESENT_POSITION)
-                pos2, comm2, err2 = packetHandler.read4ByteTxRx(portHandler, DXL_ID_2, ADDR_PRESENT_POSITION)
-            
-            if comm1 == COMM_SUCCESS and comm2 == COMM_SUCCESS:
-                telemetry_payload = {
-                    "m1_pos": get_signed_position(pos1),
-                    "m2_pos": get_signed_position(pos2)
-                }
-                client.publish(TOPIC_TELEMETRY, json.dumps(telemetry_payload))
-            
-            time.sleep(0.05) # add delay to poll
+            time.sleep(METRICS_INTERVAL)
+            client.publish(TOPIC_METRICS, json.dumps(bus_owner.metrics()))
        
     except KeyboardInterrupt:
         print("\nDisconnecting...")
@@ -176,4 +530,5 @@ if __name__ == "__main__":
         print(f"Connection Failed: {e}")
     finally:
         client.loop_stop()
+        bus_owner.stop()
         shutdown_motors()
\ No newline at end of file
@@ -3,6 +3,8 @@ import json
 import os
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
+from readiness import notify_ready
+from tracing import Tracer, unpack_state, with_trace
 
 load_dotenv()
 MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
@@ -11,8 +13,10 @@ MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 TOPIC_MOTOR = "motor/command"
 TOPIC_SYS_MODE = "system/control_mode"
 TOPIC_MYO_STATE = "sensor/myo/state"
+SUBSCRIPTIONS = [TOPIC_SYS_MODE, TOPIC_MYO_STATE]
 
 current_mode = "ui" 
+tracer = Tracer("myo_controller")
 
 def on_message(client, userdata, msg):
     global current_mode
@@ -22,7 +26,8 @@ def on_message(client, userdata, msg):
         print(f"[Myo Controller] System mode changed to: {current_mode}")
         
     elif msg.topic == TOPIC_MYO_STATE:
-        predicted_class = msg.payload.decode()
+        t_recv = time.time()
+        predicted_class, trace = unpack_state(msg.payload.decode())
         print(f"[Myo Controller] Detected Grip: {predicted_class.upper()}")
         
         # Only move motors if the UI has Myo mode selected
@@ -40,9 +45,10 @@ def on_message(client, userdata, msg):
             else:
                 return
 
-            # Publish the commands to the motor driver
-            client.publish(TOPIC_MOTOR, json.dumps({"id": 1, "position": m1}))
-            client.publish(TOPIC_MOTOR, json.dumps({"id": 2, "position": m2}))
+            # Publish both goals to the motor driver in one command
+            client.publish(TOPIC_MOTOR, json.dumps(with_trace({"goals": {1: m1, 2: m2}}, trace)))
+            tracer.record(trace, "map", t_recv, time.time())
+            tracer.flush(client.publish)
 
 def main():
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
@@ -50,8 +56,8 @@ def main():
     
     try:
         client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        client.subscribe(TOPIC_SYS_MODE)
-        client.subscribe(TOPIC_MYO_STATE) # Listen for inference outputs
+        client.subscribe([(topic, 0) for topic in SUBSCRIPTIONS]) # mode + inference outputs
+        notify_ready("myo_controller", client)
         client.loop_forever() # Keep the script alive forever
         
     except KeyboardInterrupt:
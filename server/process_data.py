@@ -14,6 +14,7 @@ Features per window per channel (6 × 8 = 48 dimensions):
   WAMP — Willison amplitude (spike count above threshold)
 
 Windows are extracted within each trial (no cross-trial bleed).
+Feature code lives in emg_features.py, shared with analysis and inference.
 Output saved to data_processed/{class}_{phase}.npy, shape (N_trials * N_windows, 48).
 
 Run: python process_data.py
@@ -22,6 +23,8 @@ Run: python process_data.py
 import os
 import numpy as np
 
+from emg_features import WINDOW_SIZE, STRIDE, extract_windows
+
 # ── Configuration ─────────────────────────────────────────────────────────────
 
 CLASSES = [
@@ -50,43 +53,9 @@ PHASE_SAMPLES = {
     "release": RELEASE_SAMPLES,
 }
 
-WINDOW_SIZE  = int(0.200 * SAMPLE_RATE)  # 200ms = 40 samples
-STRIDE       = WINDOW_SIZE // 2          # 50% overlap = 20 samples
-WAMP_THRESH  = 10.0
-
 DATA_DIR      = "data_collection"
 PROCESSED_DIR = "data_processed"
 
-# ── Feature extraction ────────────────────────────────────────────────────────
-
-def extract_features(window):
-    '''
-    window: (WINDOW_SIZE, 8) rectified EMG
-    returns: (48,) feature vector — 6 features × 8 channels
-    '''
-    diff = np.diff(window, axis=0)   # (W-1, 8)
-
-    mav  = window.mean(axis=0)
-    rms  = np.sqrt((window ** 2).mean(axis=0))
-    var  = window.var(axis=0)
-    wl   = np.abs(diff).sum(axis=0)
-    ssc  = (np.diff(np.sign(diff), axis=0) != 0).sum(axis=0).astype(np.float32)
-    wamp = (np.abs(diff) > WAMP_THRESH).sum(axis=0).astype(np.float32)
-
-    return np.concatenate([mav, rms, var, wl, ssc, wamp])
-
-
-def extract_windows(trial):
-    '''
-    trial: (phase_samples, 8) single-trial EMG
-    returns: (N_windows, 48)
-    '''
-    windows = []
-    for start in range(0, len(trial) - WINDOW_SIZE + 1, STRIDE):
-        windows.append(extract_features(trial[start:start + WINDOW_SIZE]))
-    return np.array(windows, dtype=np.float32)
-
-
 # ── Processing ────────────────────────────────────────────────────────────────
 
 def _in_path(cls, phase):
@@ -111,18 +80,14 @@ def process_file(cls, phase):
 
     trials = raw.reshape(n_trials, n_samples, 8)
 
-    # Rectify then extract features per trial
-    all_windows = []
-    for trial in trials:
-        rectified = np.abs(trial)
-        all_windows.append(extract_windows(rectified))
-
-    result = np.vstack(all_windows)             # (N_trials * N_windows, 48)
+    # Rectify then extract features for every window of every trial at once
+    features = extract_windows(np.abs(trials))  # (N_trials, N_windows, 48)
+    windows_per_trial = features.shape[1]
+    result = features.reshape(-1, features.shape[2])  # (N_trials * N_windows, 48)
 
     dst = _out_path(cls, phase)
     np.save(dst, result)
 
-    windows_per_trial = all_windows[0].shape[0]
     return n_trials, windows_per_trial, result.shape
 
 
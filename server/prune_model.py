@@ -0,0 +1,259 @@
+'''
+Forest Pruning Tool — accuracy vs latency
+
+The training scripts pick the forest purely on balanced accuracy, so the
+grid winner is often a 300-tree, unlimited-depth forest that is too slow
+for the embedded host. This tool searches smaller versions of a trained
+forest — the first N trees, each truncated at depth D — and keeps the
+smallest one whose accuracy stays within TOLERANCE of the full forest.
+
+Accuracy is the pooled out-of-fold balanced accuracy on the same
+trial-aware GroupKFold folds the training scripts use (train split only,
+held-out test trials untouched): the forest is refit on each fold with the
+trained model's parameters and every (N, D) candidate is scored from a
+single walk of the fold's test windows. Latency is FlatForest.predict_one
+p50 on held-out windows; size is the serialized .npz size.
+
+Outputs saved next to the model in <results_dir>/:
+  model_pruned.npz   — selected forest in FlatForest format (run_inference --pruned serves it)
+  prune_report.json  — every candidate, the Pareto front and the selection
+  prune_pareto.png   — accuracy vs latency, Pareto front highlighted
+
+Usage:
+  python prune_model.py                           # results_all_phases/, tolerance 0.01
+  python prune_model.py results_steady
+  python prune_model.py results_all_phases 0.02   # allow 2 points of balanced accuracy
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import warnings
+import numpy as np
+import joblib
+
+warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import balanced_accuracy_score
+from sklearn.model_selection import GroupKFold
+from tqdm import tqdm
+
+from flat_forest import FlatForest, pruned_path
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+TOLERANCE   = 0.01   # max drop in CV balanced accuracy vs the full forest
+TREE_COUNTS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300)
+DEPTHS      = (4, 6, 8, 10, 12, 15, 20, 25)   # plus the full depth
+N_LATENCY   = 200    # held-out windows timed per candidate
+WARMUP      = 20
+
+# ── Data ──────────────────────────────────────────────────────────────────────
+
+def load_train_split(results_dir):
+    '''Train split and CV settings from the script that produced results_dir.'''
+    with open(os.path.join(results_dir, 'results.json')) as f:
+        meta = json.load(f)
+    if 'phases_used' in meta:
+        import train_model_all_phases as trainer
+    else:
+        import train_model as trainer
+    X, y, groups, _ = trainer.load_data()
+    X_tr, y_tr, groups_tr, _, _ = trainer.split_data(X, y, groups)
+    return X_tr, y_tr, groups_tr, meta.get('cv_folds', trainer.CV_FOLDS)
+
+
+# ── Candidate scoring ─────────────────────────────────────────────────────────
+
+def _depth_nodes(flat, X, depths):
+    '''
+    Node reached by every (window, tree) when cut at each depth → {d: (n, T)}.
+    Depths beyond the forest's own depth reuse the final leaves.
+    '''
+    X = np.asarray(X, dtype=np.float32)
+    rows = np.arange(len(X))[:, np.newaxis]
+    node = np.broadcast_to(flat.roots, (len(X), flat.n_trees))
+    out  = {}
+    for d in range(1, min(max(depths), flat.max_depth) + 1):
+        go_right = X[rows, flat.feature[node]] > flat.threshold[node]
+        node = np.where(go_right, flat._right[node], flat._left[node])
+        if d in depths:
+            out[d] = node
+    for d in depths:
+        out.setdefault(d, node)
+    return out
+
+
+def candidate_predictions(flat, X, tree_counts, depths):
+    '''
+    {(n_trees, depth): labels} for every candidate, from one walk of X.
+    Same arithmetic as flat.prune(n_trees, depth).predict(X).
+    '''
+    preds = {}
+    for d, node in _depth_nodes(flat, X, depths).items():
+        per_tree = flat.value[node]                      # (n, T, n_classes)
+        for k in tree_counts:
+            proba = per_tree[:, :k].sum(axis=1)
+            proba /= k
+            preds[(k, d)] = flat.classes.take(proba.argmax(axis=1))
+    return preds
+
+
+def cv_accuracy(model, X, y, groups, n_folds, tree_counts, depths):
+    '''Pooled out-of-fold balanced accuracy per candidate on trial-aware folds.'''
+    params = model.get_params()
+    params['n_jobs'] = -1
+    oof = {}
+    gkf = GroupKFold(n_splits=n_folds)
+    for tr_idx, te_idx in tqdm(gkf.split(X, y, groups), desc='  CV folds   ',
+                               total=n_folds, ncols=72):
+        fold_model = RandomForestClassifier(**params).fit(X[tr_idx], y[tr_idx])
+        flat = FlatForest.from_sklearn(fold_model)
+        for key, pred in candidate_predictions(flat, X[te_idx], tree_counts, depths).items():
+            oof.setdefault(key, np.empty_like(y))[te_idx] = pred
+    return {key: balanced_accuracy_score(y, pred) for key, pred in oof.items()}
+
+
+def serialized_size(flat):
+    buf = io.BytesIO()
+    np.savez(buf, feature=flat.feature, threshold=flat.threshold,
+             children=flat.children, value=flat.value, roots=flat.roots,
+             classes=flat.classes, max_depth=flat.max_depth)
+    return buf.tell()
+
+
+def latency_p50(flat, X):
+    for x in X[:WARMUP]:
+        flat.predict_one(x)
+    ms = np.empty(len(X))
+    for i, x in enumerate(X):
+        t0 = time.perf_counter()
+        flat.predict_one(x)
+        ms[i] = time.perf_counter() - t0
+    return float(np.median(ms) * 1000)
+
+
+# ── Selection ─────────────────────────────────────────────────────────────────
+
+def pareto_front(rows):
+    '''Rows not dominated on (higher accuracy, lower latency, smaller size).'''
+    def key(r):
+        return (r['cv_bal_acc'], -r['latency_ms'], -r['size_bytes'])
+
+    def dominates(a, b):
+        return all(x >= y for x, y in zip(a, b)) and a != b
+
+    return [r for r in rows if not any(dominates(key(o), key(r)) for o in rows)]
+
+
+def plot_pareto(rows, front, selected, path):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(7, 5))
+    ax.scatter([r['latency_ms'] for r in rows], [r['cv_bal_acc'] for r in rows],
+               s=12, color='lightgray', label='Candidates')
+    front = sorted(front, key=lambda r: r['latency_ms'])
+    ax.plot([r['latency_ms'] for r in front], [r['cv_bal_acc'] for r in front],
+            'o-', color='steelblue', markersize=4, label='Pareto front')
+    ax.scatter([selected['latency_ms']], [selected['cv_bal_acc']], s=80,
+               color='red', zorder=3,
+               label=f"Selected ({selected['n_trees']} trees, depth {selected['max_depth']})")
+    ax.set_xscale('log')
+    ax.set_xlabel('Single-sample latency p50 (ms)')
+    ax.set_ylabel('CV balanced accuracy')
+    ax.set_title('Forest pruning: accuracy vs latency')
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close()
+    print(f'  Saved {path}')
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results_all_phases'
+    tolerance   = float(sys.argv[2]) if len(sys.argv) > 2 else TOLERANCE
+    model_path  = os.path.join(results_dir, 'model.joblib')
+    if not os.path.exists(model_path):
+        print(f'Error: {model_path} not found — run the training script first.')
+        sys.exit(1)
+
+    model = joblib.load(model_path)
+    full  = FlatForest.from_sklearn(model)
+    tree_counts = sorted({k for k in TREE_COUNTS if k < full.n_trees} | {full.n_trees})
+    depths      = sorted({d for d in DEPTHS if d < full.max_depth} | {full.max_depth})
+    print(f'── Pruning {model_path} ─────────────────────────')
+    print(f'  Full forest : {full.n_trees} trees, max depth {full.max_depth}, {full.n_nodes} nodes')
+    print(f'  Candidates  : {len(tree_counts)} tree counts × {len(depths)} depths')
+    print()
+
+    print('── Trial-aware CV (train split) ──────────────────────')
+    X_tr, y_tr, groups_tr, n_folds = load_train_split(results_dir)
+    acc = cv_accuracy(model, X_tr, y_tr, groups_tr, n_folds, tree_counts, depths)
+    print()
+
+    print('── Latency and size ──────────────────────────────────')
+    X_test = np.load(os.path.join(results_dir, 'X_test.npy'))
+    X_lat  = X_test[np.random.default_rng(0).choice(len(X_test), min(N_LATENCY, len(X_test)),
+                                                    replace=False)]
+    rows = []
+    for k in tqdm(tree_counts, desc='  Timing     ', ncols=72):
+        for d in depths:
+            pruned = full.prune(k, d)
+            rows.append({
+                'n_trees':    k,
+                'max_depth':  d,
+                'n_nodes':    pruned.n_nodes,
+                'cv_bal_acc': float(acc[(k, d)]),
+                'latency_ms': latency_p50(pruned, X_lat),
+                'size_bytes': serialized_size(pruned),
+            })
+    full_row = next(r for r in rows if r['n_trees'] == full.n_trees and r['max_depth'] == full.max_depth)
+    front    = pareto_front(rows)
+    eligible = [r for r in rows if r['cv_bal_acc'] >= full_row['cv_bal_acc'] - tolerance]
+    selected = min(eligible, key=lambda r: (r['size_bytes'], r['latency_ms']))
+    print()
+
+    print(f'── Pareto front (tolerance {tolerance:.3f}) ──────────────────────')
+    print(f'  {"trees":>5} {"depth":>5} {"bal. acc.":>9} {"p50 ms":>8} {"size MB":>8}')
+    for r in sorted(front, key=lambda r: r['latency_ms']):
+        mark = '  ← selected' if r is selected else ('  (full)' if r is full_row else '')
+        print(f'  {r["n_trees"]:>5} {r["max_depth"]:>5} {r["cv_bal_acc"]:>9.3f} '
+              f'{r["latency_ms"]:>8.3f} {r["size_bytes"] / 1e6:>8.2f}{mark}')
+    print()
+    print(f'  Full     : {full_row["cv_bal_acc"]:.3f}  {full_row["latency_ms"]:.3f} ms  '
+          f'{full_row["size_bytes"] / 1e6:.2f} MB')
+    print(f'  Selected : {selected["cv_bal_acc"]:.3f}  {selected["latency_ms"]:.3f} ms  '
+          f'{selected["size_bytes"] / 1e6:.2f} MB  '
+          f'({selected["n_trees"]} trees, depth {selected["max_depth"]})')
+
+    y_test_path = os.path.join(results_dir, 'y_test.npy')
+    pruned = full.prune(selected['n_trees'], selected['max_depth'])
+    if os.path.exists(y_test_path):
+        y_test = np.load(y_test_path)
+        for name, f in (('full', full), ('pruned', pruned)):
+            print(f'  Test balanced acc. ({name:<6}) : '
+                  f'{balanced_accuracy_score(y_test, f.predict(X_test)[0]):.3f}  (held-out)')
+    print()
+
+    print('── Saving ────────────────────────────────────────────')
+    out = pruned_path(results_dir)
+    pruned.save(out)
+    print(f'  Saved {out}')
+    report = {
+        'model':       model_path,
+        'tolerance':   tolerance,
+        'cv_folds':    n_folds,
+        'full':        full_row,
+        'selected':    selected,
+        'pareto':      sorted(front, key=lambda r: r['latency_ms']),
+        'candidates':  rows,
+    }
+    json_path = os.path.join(results_dir, 'prune_report.json')
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'  Saved {json_path}')
+    plot_pareto(rows, front, selected, os.path.join(results_dir, 'prune_pareto.png'))
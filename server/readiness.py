@@ -0,0 +1,34 @@
+'''
+Node Readiness
+
+How a node tells start_system.py's supervisor it is up — connected,
+subscribed and able to act, not merely launched:
+
+  pipe  the supervisor passes the write end of a pipe in $NODE_READY_FD;
+        notify_ready() writes the node name to it once and closes it
+  MQTT  the name is also published on system/nodes/ready, for nodes the
+        supervisor did not start (or a supervisor on another host)
+
+Nodes started by hand have no $NODE_READY_FD and only publish.
+
+  client.connect(...); client.subscribe(...)
+  notify_ready('comm_bridge', client)
+'''
+
+import os
+
+TOPIC_READY  = 'system/nodes/ready'
+READY_FD_ENV = 'NODE_READY_FD'
+
+
+def notify_ready(node, client=None):
+    '''Report `node` ready on the supervisor's pipe (first call only) and on TOPIC_READY.'''
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is not None:
+        try:
+            os.write(int(fd), f'{node}\n'.encode())
+            os.close(int(fd))
+        except OSError:
+            pass        # supervisor gone: nothing to tell
+    if client is not None:
+        client.publish(TOPIC_READY, node)
@@ -0,0 +1,369 @@
+'''
+Offline Replay of the Online Decision Pipeline
+
+Runs run_inference.py's calibration → features → gate → model → vote →
+dwell chain on recorded data_collection/*.npy trials with a simulated clock
+(sample index / 200 Hz), as fast as the CPU allows.
+
+Each replayed session mimics a live one:
+  calibration — CALIB_SEC of a recorded rest trial
+  lead-in     — that rest trial's steady phase (rest, 4s)
+  grip        — the trial's init + steady + release phases (onset = init start)
+
+By default every sample goes through run_inference.main's loop: a
+StreamingCalibration (fresh CALIB_SEC calibration, or the stored profile
+with --profile, checked and recalibrated as live), drift updates on
+committed rest, StreamingFeatures every STRIDE samples, the rest gate
+(--rest-gate / EMG_REST_GATE=1) and early exit (--early-exit[=delta]) —
+the same flags, with the same defaults, as run_inference.py — and the same
+DecisionFilter (decision_filter.py).
+
+--batch is the fast approximation: one static calibration_scale per
+session, features for every decision in one extract_windows() call (same
+as live to ~1e-15 relative), one model.predict() over all of them; the
+rest gate applies, early exit and drift updates do not.
+
+Per trial:
+  latency      — grip onset → first commit of the trial's class (s)
+  false switch — commit to a class that is wrong at that moment
+                 (lead-in: rest; init/release: rest or grip; steady: grip)
+  accuracy     — fraction of steady-phase decisions committed to the grip
+                 (raw: per-window model output, before vote/dwell)
+
+Outputs saved to <results_dir>/replay_report.json (every trial + summary).
+
+Usage:
+  python replay_inference.py                      # results_all_phases/, all trials
+  python replay_inference.py results_all_phases --held-out   # test-split trials only
+  python replay_inference.py --held-out --rest-gate --early-exit=0.02
+  python replay_inference.py results_steady --batch
+'''
+
+import os
+import sys
+import json
+import time
+import numpy as np
+
+from decision_filter import DWELL_TIME, SMOOTH_N, STRIDE, DecisionFilter
+from emg_calibration import CALIB_SEC, StreamingCalibration, load_profile, profile_key
+from emg_features import (FEATURE_DIM, SAMPLE_RATE, WINDOW_SIZE, StreamingFeatures,
+                          calibration_scale, extract_windows)
+from flat_forest import early_exit_arg, load_for_inference
+from rest_gate import gate_enabled, load_rest_gate
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+DATA_DIR      = 'data_collection'
+CLASSES       = ['cylindrical', 'lateral', 'palm', 'rest']
+PHASE_SAMPLES = {'init': 400, 'steady': 800, 'release': 400}
+# STRIDE, SMOOTH_N and DWELL_TIME from decision_filter.py, CALIB_SEC from emg_calibration.py
+
+# ── Trials ────────────────────────────────────────────────────────────────────
+
+def load_trials(data_dir=DATA_DIR):
+    '''{sub_class: [ {phase: (n, 8) float32} per trial ]} from data_collection/.'''
+    trials = {}
+    for fname in sorted(os.listdir(data_dir)):
+        if not fname.endswith('_steady.npy'):
+            continue
+        sub_cls = fname[:-len('_steady.npy')]
+        phases  = {p: np.load(os.path.join(data_dir, f'{sub_cls}_{p}.npy'))
+                   for p in PHASE_SAMPLES}
+        n = min(len(phases[p]) // PHASE_SAMPLES[p] for p in PHASE_SAMPLES)
+        trials[sub_cls] = [
+            {p: d[i * PHASE_SAMPLES[p]:(i + 1) * PHASE_SAMPLES[p]] for p, d in phases.items()}
+            for i in range(n)
+        ]
+    return trials
+
+
+def held_out_trials(results_dir):
+    '''{sub_class: set of trial indices} in the training script's held-out test split.'''
+    with open(os.path.join(results_dir, 'results.json')) as f:
+        meta = json.load(f)
+    if 'phases_used' in meta:
+        import train_model_all_phases as trainer
+    else:
+        import train_model as trainer
+    X, y, groups, data_meta = trainer.load_data()
+    # Splitting the group column itself returns the held-out trial ids as "X_test"
+    _, _, _, test_ids, _ = trainer.split_data(groups[:, None], y, groups)
+    test_ids = set(test_ids.ravel().tolist())
+
+    held_out, base = {}, 0
+    for sub_cls, n in data_meta['trial_counts'].items():
+        held_out[sub_cls.replace(' ', '_')] = {i for i in range(n) if base + i in test_ids}
+        base += n
+    return held_out
+
+
+def build_sessions(trials, selected=None):
+    '''One replay session per trial: calibration, lead-in and grip segments.'''
+    rest     = trials['rest']
+    n_calib  = int(CALIB_SEC * SAMPLE_RATE)
+    sessions = []
+    for sub_cls, sub_trials in trials.items():
+        label = CLASSES.index(sub_cls.split('_')[0])
+        for i, trial in enumerate(sub_trials):
+            if selected is not None and i not in selected.get(sub_cls, ()):
+                continue
+            # Rest trials borrow the next rest trial so a session never replays itself
+            calib = rest[(i + 1) % len(rest) if sub_cls == 'rest' else i % len(rest)]
+            sessions.append({
+                'name':   f'{sub_cls}[{i}]',
+                'label':  label,
+                'calib':  calib['init'][:n_calib],
+                'signal': np.concatenate([calib['steady'], trial['init'],
+                                          trial['steady'], trial['release']]),
+                'bounds': np.cumsum([len(calib['steady']), len(trial['init']),
+                                     len(trial['steady'])]),   # onset, steady start, release start
+            })
+    return sessions
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+
+def decision_ends(n_samples, stride=STRIDE):
+    '''Sample index at which each live decision fires (see run_inference.main).'''
+    first = max(WINDOW_SIZE, stride) - 1
+    return np.arange(first, n_samples, stride)
+
+
+def features_batch(signal, scale, stride=STRIDE):
+    rect  = np.abs(signal.astype(np.float64)) / scale.astype(np.float64)
+    start = max(WINDOW_SIZE, stride) - WINDOW_SIZE
+    return extract_windows(rect[start:], WINDOW_SIZE, stride).astype(np.float32)
+
+
+def replay_live(session, model, gate=None, early_exit=None, profile=None, stride=STRIDE,
+                smooth_n=SMOOTH_N, dwell_time=DWELL_TIME):
+    '''
+    run_inference.main's per-sample loop over one session (calibration
+    segment, then signal) and its score. Returns (score, calibration
+    events, forest trees evaluated).
+    '''
+    calib    = StreamingCalibration(profile=profile)
+    stream   = StreamingFeatures()
+    decision = DecisionFilter(CLASSES, smooth_n, dwell_time, now=0.0)
+    features = np.empty((1, FEATURE_DIM), dtype=np.float32)
+    row      = features[0]
+    sample   = np.empty(session['signal'].shape[1], dtype=np.float32)
+    rest_idx = CLASSES.index('rest')
+    offset   = len(session['calib'])
+    ends, preds, committed, events = [], [], [], []
+    running, since, trees = False, 0, 0
+    before = decision.committed     # at the signal's start
+
+    for k, raw in enumerate(np.concatenate([session['calib'], session['signal']])):
+        np.copyto(sample, raw)
+        calib.push(sample)
+        if not calib.ready:
+            continue
+        if not running:
+            running = True
+            stream.set_scale(calib.scale)
+        stream.push(stream.normalise(sample))
+        since += 1
+        if not stream.ready or since < stride:
+            continue
+
+        since = 0
+        stream.features(out=row)
+        if gate is not None and gate.is_rest(row):
+            pred = rest_idx
+        elif early_exit is None:
+            pred = int(model.predict_one(features)[0])
+        else:
+            pred, _, n_trees = model.predict_one_early(features, early_exit)
+            pred   = int(pred)
+            trees += n_trees
+        now = (k + 1) / SAMPLE_RATE
+        c   = decision.update(pred, now)
+        if k < offset:
+            before = c
+        else:
+            ends.append(k - offset)
+            preds.append(pred)
+            committed.append(c)
+
+        event = calib.decide(pred == rest_idx and c == 'rest', now)
+        if event is not None:
+            events.append(event['event'])
+            if event['event'] == 'drift':
+                stream.set_scale(calib.scale)
+            elif event['event'] == 'recalibrate':
+                running = False
+                stream.reset()
+                since = 0
+
+    return score(session, np.array(ends), np.array(preds), committed, before), events, trees
+
+
+def replay(session, preds, stride=STRIDE, smooth_n=SMOOTH_N, dwell_time=DWELL_TIME):
+    '''Run vote + dwell on one session's (batch) predictions and score it.'''
+    ends      = decision_ends(len(session['signal']), stride)
+    decision  = DecisionFilter(CLASSES, smooth_n, dwell_time, now=0.0)
+    before    = decision.committed
+    committed = [decision.update(int(p), t) for p, t in zip(preds, (ends + 1) / SAMPLE_RATE)]
+    return score(session, ends, np.asarray(preds), committed, before)
+
+
+def score(session, ends, preds, committed, before):
+    '''
+    Latency, false switches and accuracy of the classes committed at signal
+    samples `ends` (`before`: the committed class when the signal starts).
+    '''
+    label  = CLASSES[session['label']]
+    onset  = session['bounds'][0]
+    now    = (ends + 1) / SAMPLE_RATE
+    phase  = np.searchsorted(session['bounds'], ends, side='right')   # 0 lead-in … 3 release
+    ok     = [{'rest'}, {'rest', label}, {label}, {'rest', label}]
+
+    latency = None
+    false_switches = 0
+    prev = before
+    for t, c, ph in zip(now, committed, phase):
+        if c != prev and c not in ok[ph]:
+            false_switches += 1
+        if latency is None and ph in (1, 2) and c == label and label != 'rest':
+            latency = t - onset / SAMPLE_RATE
+        prev = c
+
+    steady = phase == 2
+    return {
+        'trial':          session['name'],
+        'class':          label,
+        'latency_s':      None if latency is None else round(float(latency), 3),
+        'false_switches': false_switches,
+        'accuracy':       float(np.mean([c == label for c, s in zip(committed, steady) if s])),
+        'raw_accuracy':   float(np.mean(preds[steady] == session['label'])),
+        'duration_s':     len(session['signal']) / SAMPLE_RATE,
+    }
+
+
+# ── Summary ───────────────────────────────────────────────────────────────────
+
+def summarise(rows):
+    out = {}
+    for cls in CLASSES + ['all']:
+        sel = [r for r in rows if cls in ('all', r['class'])]
+        if not sel:
+            continue
+        lat = [r['latency_s'] for r in sel if r['latency_s'] is not None]
+        minutes = sum(r['duration_s'] for r in sel) / 60
+        out[cls] = {
+            'trials':             len(sel),
+            'latency_p50_s':      float(np.median(lat)) if lat else None,
+            'latency_p90_s':      float(np.percentile(lat, 90)) if lat else None,
+            'never_committed':    sum(r['latency_s'] is None for r in sel if r['class'] != 'rest'),
+            'false_switches_per_min': sum(r['false_switches'] for r in sel) / minutes,
+            'trials_with_false_switch': sum(r['false_switches'] > 0 for r in sel),
+            'accuracy':           float(np.mean([r['accuracy'] for r in sel])),
+            'raw_accuracy':       float(np.mean([r['raw_accuracy'] for r in sel])),
+        }
+    return out
+
+
+def _fmt(v, width):
+    return f'{v:>{width}.2f}' if v is not None else f'{"—":>{width}}'
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    argv        = sys.argv[1:]
+    args        = [a for i, a in enumerate(argv) if not a.startswith('--')
+                   and (i == 0 or argv[i - 1] not in ('--user', '--armband'))]
+    results_dir = args[0] if args else 'results_all_phases'
+    batch       = '--batch' in argv
+    early_exit  = early_exit_arg(argv)
+    if batch and early_exit is not None:
+        sys.exit('--early-exit needs the per-decision path (drop --batch)')
+
+    print('── Loading ───────────────────────────────────────────')
+    model    = load_for_inference(results_dir)
+    gate     = load_rest_gate(results_dir) if gate_enabled(argv) else None
+    profile  = None
+    if '--profile' in argv:
+        key     = profile_key(argv=argv)
+        profile = load_profile(key)
+        print(f'  Profile {key}: {"none stored — fresh calibration" if profile is None else profile.round(1)}')
+    trials   = load_trials()
+    selected = held_out_trials(results_dir) if '--held-out' in argv else None
+    sessions = build_sessions(trials, selected)
+    recorded = sum(len(s['signal']) for s in sessions) / SAMPLE_RATE
+    print(f'  {len(sessions)} trials ({"held-out" if selected is not None else "all"}), '
+          f'{recorded / 60:.1f} min of EMG')
+    print(f'  stride {STRIDE}  |  vote {SMOOTH_N}  |  dwell {DWELL_TIME}s  |  '
+          f'gate {"on" if gate is not None else "off"}  |  '
+          f'early exit {"off" if early_exit is None else early_exit}  |  '
+          f'{"batch, static scale" if batch else "per sample, streaming calibration"}')
+    print()
+
+    print('── Replaying ─────────────────────────────────────────')
+    events = []
+    t0 = time.perf_counter()
+    if batch:
+        feats  = [features_batch(s['signal'], calibration_scale(s['calib'])) for s in sessions]
+        X      = np.concatenate(feats)
+        t1 = time.perf_counter()
+        labels, _ = model.predict(X)
+        if gate is not None:
+            labels = np.where(gate.hits_batch(X), CLASSES.index('rest'), labels)
+        t2 = time.perf_counter()
+        splits = np.cumsum([len(f) for f in feats])[:-1]
+        rows   = [replay(s, p) for s, p in zip(sessions, np.split(labels, splits))]
+        t3 = time.perf_counter()
+        n_decisions = len(labels)
+        print(f'  features {t1 - t0:6.2f}s  |  model {t2 - t1:6.2f}s  |  vote/dwell {t3 - t2:6.2f}s')
+    else:
+        rows, trees = [], 0
+        for s in sessions:
+            row, ev, n_trees = replay_live(s, model, gate, early_exit, profile)
+            rows.append(row)
+            events += ev
+            trees  += n_trees
+        t3 = time.perf_counter()
+        n_decisions = sum(len(decision_ends(len(s['signal']))) for s in sessions)
+        print(f'  {t3 - t0:6.2f}s  |  calibration events: '
+              + (', '.join(f'{e} ×{events.count(e)}' for e in sorted(set(events))) or 'none'))
+        if early_exit is not None and trees:
+            print(f'  early exit: {trees / max(n_decisions, 1):.1f} of {model.n_trees} trees per decision (gated ones: 0)')
+    print(f'  {recorded / (t3 - t0):.0f}× real time (~{n_decisions} decisions)')
+    print()
+
+    summary = summarise(rows)
+    print(f'  {"class":<12} {"trials":>6} {"lat p50":>8} {"lat p90":>8} {"never":>6} '
+          f'{"FS/min":>7} {"acc":>6} {"raw":>6}')
+    for cls, s in summary.items():
+        print(f'  {cls:<12} {s["trials"]:>6} {_fmt(s["latency_p50_s"], 8)} '
+              f'{_fmt(s["latency_p90_s"], 8)} {s["never_committed"]:>6} '
+              f'{s["false_switches_per_min"]:>7.2f} {s["accuracy"]:>6.1%} {s["raw_accuracy"]:>6.1%}')
+
+    worst = sorted(rows, key=lambda r: (-r['false_switches'], r['accuracy']))[:5]
+    print('\n  Most false switches:')
+    for r in worst:
+        print(f'    {r["trial"]:<28} {r["false_switches"]} switches   '
+              f'latency {_fmt(r["latency_s"], 5)}s   acc {r["accuracy"]:.1%}')
+    print()
+
+    print('── Saving ────────────────────────────────────────────')
+    report = {
+        'model_dir':  results_dir,
+        'held_out':   selected is not None,
+        'mode':       'batch' if batch else 'streaming',
+        'rest_gate':  gate is not None,
+        'early_exit': early_exit,
+        'profile':    profile is not None,
+        'calibration_events': {e: events.count(e) for e in sorted(set(events))},
+        'stride':     STRIDE,
+        'smooth_n':   SMOOTH_N,
+        'dwell_time': DWELL_TIME,
+        'summary':    summary,
+        'trials':     rows,
+    }
+    json_path = os.path.join(results_dir, 'replay_report.json')
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'  Saved {json_path}')
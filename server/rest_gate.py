@@ -0,0 +1,274 @@
+'''
+Rest Gate — cheap cascade stage ahead of the forest
+
+Most decisions during a wearer's day are rest. The gate looks at two
+features the window already has — normalised MAV and RMS per channel —
+and declares "clearly rest" only when every channel is below its learned
+threshold on both; the forest is skipped for that decision and rest is
+fed to the vote/dwell filter. Anything else (any channel above a
+threshold) falls through to the full model, so the gate can only ever
+answer rest, and only when the signal is quiet everywhere.
+
+Thresholds are learned on live-equivalent features (replay_inference's
+calibration + normalisation) of the training-split trials:
+  - candidate thresholds: per-channel quantile q of MAV / RMS over rest windows
+    (rest trials and every session's rest lead-in)
+  - q is the largest value whose leak — steady-phase grip windows the gate
+    would call rest — stays within MAX_LEAK in every one of N_FOLDS
+    trial-aware GroupKFold folds (thresholds from the other folds' rest
+    windows, as prune_model.py scores its candidates)
+
+The held-out trials are then replayed through vote + dwell with and
+without the gate, reporting gate hit rate, forest time saved per decision
+(measured predict_one vs gate time) and the change in accuracy, false
+switches and onset latency. If the held-out leak exceeds MAX_LEAK the
+script exits with an error and leaves rest_gate.json alone.
+
+Outputs saved next to the model in <results_dir>/:
+  rest_gate.json — thresholds (run_inference --rest-gate loads them) + report
+
+Usage:
+  python rest_gate.py                        # results_all_phases/
+  python rest_gate.py results_all_phases 0.001   # stricter leak budget
+'''
+
+import json
+import os
+import sys
+import time
+import numpy as np
+
+from emg_features import FEATURE_DIM, N_CHANNELS
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+GATE_NAME  = 'rest_gate.json'
+MAX_LEAK   = 0.002    # max share of steady grip windows the gate may call rest
+QUANTILES  = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.97, 0.98, 0.99, 0.995, 0.999)
+N_FOLDS    = 5        # trial-aware CV folds over the training split for the leak
+N_TIMING   = 2000     # held-out windows timed for the CPU estimate
+
+# ── Gate ──────────────────────────────────────────────────────────────────────
+
+class RestGate:
+    '''
+    gate.is_rest(x) — x: (FEATURE_DIM,) float32 feature vector, allocation-free
+    gate.hits_batch(X) — (n,) bool for a feature matrix
+    '''
+
+    def __init__(self, mav, rms, n_channels=N_CHANNELS, n_features=FEATURE_DIM):
+        self.mav = np.asarray(mav, dtype=np.float32)
+        self.rms = np.asarray(rms, dtype=np.float32)
+        # Thresholds laid out like the feature vector; untested features pass (+inf)
+        self._thr = np.full(n_features, np.inf, dtype=np.float32)
+        self._thr[:n_channels] = self.mav
+        self._thr[n_channels:2 * n_channels] = self.rms
+        # Allocation-free "any feature above its threshold": bool mask → float
+        # row → dot with ones into a (1, 1) result read through a 0-d view
+        # (ufunc reductions, count_nonzero and scalar indexing all allocate)
+        self._mask    = np.empty(n_features, dtype=bool)
+        self._over    = np.zeros((1, n_features), dtype=np.float32)
+        self._over_1d = self._over[0]
+        self._ones    = np.ones((n_features, 1), dtype=np.float32)
+        self._n_over  = np.zeros((1, 1), dtype=np.float32)
+        self._any     = self._n_over.reshape(())
+        # [decisions, hits], bumped in place by one ufunc per call
+        self._counts = np.zeros(2)
+        self._miss   = np.array([1.0, 0.0])
+        self._hit    = np.array([1.0, 1.0])
+
+    def is_rest(self, x):
+        np.greater(x, self._thr, out=self._mask)
+        np.copyto(self._over_1d, self._mask)
+        np.dot(self._over, self._ones, out=self._n_over)
+        if not self._any:
+            np.add(self._counts, self._hit, out=self._counts)
+            return True
+        np.add(self._counts, self._miss, out=self._counts)
+        return False
+
+    def hits_batch(self, X):
+        return np.all(X <= self._thr, axis=1)
+
+    def stats(self):
+        calls, hits = (int(v) for v in self._counts)
+        return {'decisions': calls, 'hits': hits,
+                'hit_rate': round(hits / calls, 4) if calls else None}
+
+    def save(self, path, **extra):
+        with open(path, 'w') as f:
+            json.dump({'mav': self.mav.tolist(), 'rms': self.rms.tolist(), **extra}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            d = json.load(f)
+        return cls(d['mav'], d['rms'])
+
+
+def gate_enabled(argv=None):
+    '''--rest-gate or EMG_REST_GATE=1 (run_inference, replay_inference).'''
+    argv = sys.argv[1:] if argv is None else argv
+    return '--rest-gate' in argv or os.getenv('EMG_REST_GATE') == '1'
+
+
+def gate_path(results_dir):
+    return os.path.join(results_dir, GATE_NAME)
+
+
+def load_rest_gate(results_dir, verbose=True):
+    '''RestGate from <results_dir>/rest_gate.json, or None if not fitted yet.'''
+    path = gate_path(results_dir)
+    if not os.path.exists(path):
+        if verbose:
+            print(f'  {path} not found — rest gate off (run python rest_gate.py)')
+        return None
+    gate = RestGate.load(path)
+    if verbose:
+        print(f'  {path}: MAV ≤ {gate.mav.round(2)}, RMS ≤ {gate.rms.round(2)}')
+    return gate
+
+
+# ── Fitting ───────────────────────────────────────────────────────────────────
+
+def fit(feats, rest_mask, grip_mask, groups, max_leak=MAX_LEAK, n_folds=N_FOLDS):
+    '''
+    Largest rest-window quantile whose thresholds, taken from the other
+    folds' rest windows, leak at most max_leak of the grip windows in every
+    fold (trial-aware GroupKFold; the worst fold, not the pooled leak, since
+    leaks cluster in a few trials). Returns (gate at that quantile over all
+    rest windows, quantile, CV stats per quantile).
+    '''
+    from sklearn.model_selection import GroupKFold     # fitting only: run_inference imports this module
+    folds = list(GroupKFold(n_splits=n_folds).split(feats, groups=groups))
+    table, best = [], None
+    for q in QUANTILES:
+        hit = np.empty(len(feats), dtype=bool)
+        worst = 0.0
+        for tr_idx, te_idx in folds:
+            hit[te_idx] = _quantile_gate(feats[tr_idx][rest_mask[tr_idx]], q).hits_batch(feats[te_idx])
+            worst = max(worst, float(hit[te_idx][grip_mask[te_idx]].mean()))
+        row = {'quantile': q, 'rest_hit_rate': float(hit[rest_mask].mean()),
+               'leak': float(hit[grip_mask].mean()), 'worst_fold_leak': worst}
+        table.append(row)
+        if row['worst_fold_leak'] <= max_leak:
+            best = q
+    if best is None:
+        raise RuntimeError(f'no quantile keeps every fold\'s leak within {max_leak}')
+    return _quantile_gate(feats[rest_mask], best), best, table
+
+
+def _quantile_gate(rest, q):
+    C = N_CHANNELS
+    return RestGate(np.quantile(rest[:, :C], q, axis=0), np.quantile(rest[:, C:2 * C], q, axis=0))
+
+
+def _windows(sessions, stride):
+    '''Per-decision rest / steady-grip masks for build_sessions() sessions.'''
+    from replay_inference import CLASSES, decision_ends
+    rest_idx = CLASSES.index('rest')
+    rest, grip = [], []
+    for s in sessions:
+        phase = np.searchsorted(s['bounds'], decision_ends(len(s['signal']), stride), side='right')
+        if s['label'] == rest_idx:
+            rest.append(np.ones(len(phase), dtype=bool))
+            grip.append(np.zeros(len(phase), dtype=bool))
+        else:
+            rest.append(phase == 0)
+            grip.append(phase == 2)
+    return np.concatenate(rest), np.concatenate(grip)
+
+
+def _time_per_call(fn, X):
+    for x in X[:50]:
+        fn(x)
+    t0 = time.perf_counter()
+    for x in X:
+        fn(x)
+    return (time.perf_counter() - t0) / len(X) * 1000
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+
+if __name__ == '__main__':
+    from flat_forest import load_for_inference
+    from replay_inference import (CLASSES, STRIDE, build_sessions, features_batch,
+                                  held_out_trials, load_trials, replay, summarise)
+    from emg_features import calibration_scale
+
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results_all_phases'
+    max_leak    = float(sys.argv[2]) if len(sys.argv) > 2 else MAX_LEAK
+    rest_idx    = CLASSES.index('rest')
+
+    print('── Loading ───────────────────────────────────────────')
+    model    = load_for_inference(results_dir)
+    trials   = load_trials()
+    held_out = held_out_trials(results_dir)
+    train    = {k: set(range(len(v))) - held_out.get(k, set()) for k, v in trials.items()}
+    sessions = {'train': build_sessions(trials, train), 'test': build_sessions(trials, held_out)}
+    feats    = {k: [features_batch(s['signal'], calibration_scale(s['calib'])) for s in v]
+                for k, v in sessions.items()}
+    print(f'  {len(sessions["train"])} train / {len(sessions["test"])} held-out trials')
+    print()
+
+    print(f'── Fitting (train split, leak ≤ {max_leak:.2%} in each of {N_FOLDS} folds) ─────')
+    X_tr = np.concatenate(feats['train'])
+    rest_tr, grip_tr = _windows(sessions['train'], STRIDE)
+    groups = np.repeat(np.arange(len(feats['train'])), [len(f) for f in feats['train']])
+    gate, q, table = fit(X_tr, rest_tr, grip_tr, groups, max_leak)
+    print(f'  {"quantile":>8} {"rest hit":>9} {"leak":>8} {"worst":>8}')
+    for row in table:
+        mark = '  ←' if row['quantile'] == q else ''
+        print(f'  {row["quantile"]:>8} {row["rest_hit_rate"]:>9.1%} {row["leak"]:>8.3%} '
+              f'{row["worst_fold_leak"]:>8.3%}{mark}')
+    print(f'  MAV ≤ {gate.mav.round(2)}')
+    print(f'  RMS ≤ {gate.rms.round(2)}')
+    print()
+
+    print('── Held-out replay (vote + dwell) ────────────────────')
+    X_te   = np.concatenate(feats['test'])
+    splits = np.cumsum([len(f) for f in feats['test']])[:-1]
+    labels, _ = model.predict(X_te)
+    hit    = gate.hits_batch(X_te)
+    gated  = np.where(hit, rest_idx, labels)
+    rest_te, grip_te = _windows(sessions['test'], STRIDE)
+    base   = summarise([replay(s, p) for s, p in zip(sessions['test'], np.split(labels, splits))])['all']
+    cascade = summarise([replay(s, p) for s, p in zip(sessions['test'], np.split(gated, splits))])['all']
+
+    sample   = X_te[np.random.default_rng(0).choice(len(X_te), min(N_TIMING, len(X_te)), replace=False)]
+    model_ms = _time_per_call(model.predict_one, sample)
+    gate_ms  = _time_per_call(gate.is_rest, sample)
+    hit_rate = float(hit.mean())
+    cascade_ms = gate_ms + (1 - hit_rate) * model_ms
+
+    print(f'  gate hit rate   {hit_rate:6.1%} of decisions  |  {hit[rest_te].mean():6.1%} of rest windows'
+          f'  |  leak {hit[grip_te].mean():.3%} of steady grip windows')
+    print(f'  per decision    forest {model_ms:.3f} ms  →  gate {gate_ms:.4f} ms + forest on misses '
+          f'= {cascade_ms:.3f} ms  ({1 - cascade_ms / model_ms:.0%} CPU saved)')
+    print(f'  changed labels  {np.mean(gated != labels):.2%} of decisions '
+          f'(forest said non-rest where the gate said rest)')
+    print()
+    print(f'  {"":<10} {"acc":>7} {"raw":>7} {"FS/min":>7} {"lat p50":>8} {"lat p90":>8}')
+    for name, s in (('forest', base), ('cascade', cascade)):
+        print(f'  {name:<10} {s["accuracy"]:>7.2%} {s["raw_accuracy"]:>7.2%} '
+              f'{s["false_switches_per_min"]:>7.2f} {s["latency_p50_s"]:>8.2f} {s["latency_p90_s"]:>8.2f}')
+    print()
+
+    print('── Saving ────────────────────────────────────────────')
+    out  = gate_path(results_dir)
+    leak = float(hit[grip_te].mean())
+    if leak > max_leak:
+        print(f'  [!] held-out leak {leak:.3%} exceeds {max_leak:.2%} — {out} not written')
+        sys.exit(1)
+    gate.save(out, quantile=q, max_leak=max_leak, report={
+        'train':            table,
+        'hit_rate':         hit_rate,
+        'rest_hit_rate':    float(hit[rest_te].mean()),
+        'leak':             leak,
+        'model_ms':         model_ms,
+        'gate_ms':          gate_ms,
+        'cpu_saved':        1 - cascade_ms / model_ms,
+        'held_out_forest':  base,
+        'held_out_cascade': cascade,
+    })
+    print(f'  Saved {out}')
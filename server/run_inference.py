@@ -1,30 +1,74 @@
 '''
 Real-time Random Forest Inference
 
-Loads results/model.joblib and runs live grip classification using the Myo armband.
-Feature extraction matches process_data.py exactly:
+Loads results/model.joblib (or its fast-start bundle model_bundle/, or its
+flat export model_flat.npz) and runs live grip classification using the
+Myo armband. The pruned forest (model_pruned.npz) is served only with
+--pruned or EMG_PRUNED=1; the source and tree count are printed at load.
+Feature extraction is shared with process_data.py (emg_features.py):
   - 200ms window (40 samples at 200Hz), 50% stride (20 samples)
+  - Window features are updated incrementally per sample (StreamingFeatures),
+    so STRIDE can be lowered to 1–5 samples for faster decisions
   - Full-wave rectification + MAV, RMS, VAR, WL, SSC, WAMP × 8 channels = 48 features
 
-Startup calibration:
-  - Records 3s of relaxed signal, computes per-channel std
+Calibration (emg_calibration.py):
+  - Per-channel std of the first CALIB_SEC of relaxed signal, accumulated per
+    sample (Welford) inside the main loop — nothing blocks while it fills
   - Raw EMG is divided by this scale before feature extraction
   - Makes amplitude-based features session-invariant
+  - The scale is saved per user/armband (--user / $EMG_USER, --armband /
+    $EMG_ARMBAND) in calibration_profiles.json; with a stored profile grips
+    work from the first window, and the profile is checked against the first
+    PROFILE_CHECK_SEC of (relaxed) signal — only drift beyond PROFILE_MAX_DRIFT
+    triggers a fresh CALIB_SEC calibration
+  - Afterwards, samples under rest decisions keep refining the estimate; the
+    scale follows electrode/skin drift by at most DRIFT_MAX_STEP per
+    DRIFT_INTERVAL, and each change is published to system/metrics/calibration
 
 Display updates every 200ms. Smoothing: majority vote over last SMOOTH_N predictions.
 Dwell-time filter: committed class only changes after candidate holds for DWELL_TIME seconds.
 
-Run: python run_inference.py
+Latency: every decision is timed per stage (queue wait, normalisation, features,
+model, smoothing/dwell, MQTT publish, total since the sample arrived). Rolling
+p50/p95/p99 per stage are published to system/metrics/inference every
+METRICS_INTERVAL seconds and shown on the dashboard.
+
+Tracing (tracing.py, TRACE=1 or --trace): each grip change starts a trace at
+the decision where the new class first won the vote, so the dwell counts;
+sensor/myo/state then carries the trace context to myo_controller and on to
+the motor driver, and this node's spans (vote+dwell, then the stages of the
+committing decision) go to system/trace/spans.
+
+Model hot reload (model_reload.py): a retrained model in MODEL_PATH's
+directory, or 'reload' on system/model/command, is loaded and pre-warmed in
+the background and swapped in between strides — no restart, no
+recalibration, no lost samples. 'rollback' restores the previous model from
+memory. Load and first-prediction times go to system/model/status.
+
+Rest gate (rest_gate.py, --rest-gate or EMG_REST_GATE=1): per-channel MAV/RMS
+thresholds learned from the training trials answer "clearly rest" without
+running the forest; every other window falls through to the full model.
+Hit counts go out with the latency metrics.
+
+Early exit (--early-exit[=delta], default delta 0.01): trees are voted in
+doubling batches and the decision stops once the leader is decided or
+confident at 1 - delta (FlatForest.predict_one_early). Mean trees per
+decision goes out with the latency metrics. Pays off on large forests
+(model_flat.npz / model.joblib); a pruned 10-tree forest (--pruned) is one batch anyway.
+
+Acquisition runs in a background thread by default; --process (or EMG_PROCESS=1)
+moves it to its own process, passing frames through a shared-memory ring with
+sequence numbers (lost samples show up in the 'dropped' metric).
+
+Run: python run_inference.py [--source replay:data_collection/palm_steady.npy | synthetic] [--process]
+                            [--user <name>] [--armband <id>] [--rest-gate] [--early-exit[=delta]] [--pruned]
 '''
 
+import sys
 import threading
-import queue
 import time
-import struct
 import warnings
 import numpy as np
-import joblib
-from collections import deque
 import paho.mqtt.client as mqtt
 import json
 import os
@@ -32,175 +76,270 @@ import os
 MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
 MQTT_PORT   = int(os.getenv("MQTT_PORT", 1883))
 TOPIC_MYO_STATE = "sensor/myo/state"
+TOPIC_METRICS   = "system/metrics/inference"
+TOPIC_CALIB     = "system/metrics/calibration"
+TOPIC_MODEL_CMD = "system/model/command"
 
+_reloader = None   # ModelReloader, set in main()
+
+
+def on_message(client, userdata, msg):
+    if msg.topic == TOPIC_MODEL_CMD and _reloader is not None:
+        _reloader.on_command(msg.payload.decode())
+
+
+def on_connect(client, userdata, flags, reason_code, properties):
+    client.subscribe(TOPIC_MODEL_CMD)
+
+
+# Connected in main(): the acquisition process is spawned and re-imports
+# this module, which must not open a second connection (or start threads)
 mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-try:
-    mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    mqtt_client.loop_start()
-except Exception as e:
-    print(f"Warning: MQTT not connected in run_inference.py: {e}")
+mqtt_client.on_message = on_message
+mqtt_client.on_connect = on_connect
+
+
+def connect_mqtt():
+    try:
+        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        mqtt_client.loop_start()
+    except Exception as e:
+        print(f"Warning: MQTT not connected in run_inference.py: {e}")
 
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
-from pyomyo import Myo, emg_mode
+from decision_filter import DWELL_TIME, SMOOTH_N, STRIDE, DecisionFilter
+from emg_calibration import (CALIB_SEC, PROFILE_CHECK_SEC, StreamingCalibration, load_profile,
+                             profile_key, save_profile)
+from emg_features import FEATURE_DIM, N_CHANNELS, StreamingFeatures
+from emg_ring import SampleRing, SharedSampleRing
+from emg_source import run_source, source_spec, start_acquisition_process
+from flat_forest import early_exit_arg, load_for_inference
+from latency_stats import StageStats
+from model_reload import ModelReloader
+from readiness import notify_ready
+from rest_gate import gate_enabled, load_rest_gate
+from tracing import TRACE_ENABLED, Tracer, new_trace, state_payload, wall
 
 # ── Configuration ─────────────────────────────────────────────────────────────
 
 MODEL_PATH   = 'results_all_phases/model.joblib'   # or 'results_steady/model.joblib'
+EMG_SOURCE   = source_spec()   # --source / $EMG_SOURCE: myo, replay:<file.npy>, synthetic[:opts]
+ACQUIRE_PROCESS = '--process' in sys.argv or os.getenv('EMG_PROCESS') == '1'   # reader in its own process
 CLASSES      = ['cylindrical', 'lateral', 'palm', 'rest']
-WINDOW_SIZE  = 40        # 200ms at 200Hz
-STRIDE       = 20        # 50% overlap → predict every 100ms
-WAMP_THRESH  = 10.0
-SMOOTH_N         = 5    # majority-vote over last N predictions
-DWELL_TIME       = 0.3  # seconds candidate must hold before becoming committed class
-CALIB_SEC        = 2    # seconds of rest for amplitude calibration
+# STRIDE, SMOOTH_N and DWELL_TIME are set in decision_filter.py (shared with replay_inference.py)
+PROFILE_KEY  = profile_key(EMG_SOURCE)   # '<user>@<armband>' in the calibration profile store
+# CALIB_SEC, the drift limits and the profile check are set in emg_calibration.py
+WATCH_MODEL  = True     # reload when MODEL_PATH's directory gets a new model
+REST_GATE    = gate_enabled()     # --rest-gate / EMG_REST_GATE=1: skip forest on clear rest
+EARLY_EXIT   = early_exit_arg()   # --early-exit[=delta]; None: every tree, every decision
 DISPLAY_INTERVAL = 0.2  # seconds between display updates
+METRICS_INTERVAL = 2.0  # seconds between latency metrics publishes
 
-# ── Myo background thread ─────────────────────────────────────────────────────
-
-_emg_queue  = queue.Queue()
-_stop_event = threading.Event()
-
+# Per-decision stages timed in main(), in pipeline order
+STAGES = ['queue', 'normalise', 'features', 'model', 'smoothing', 'publish', 'total']
 
-def _myo_worker():
-    m = Myo(mode=emg_mode.FILTERED)
-    m.connect()
-    m.add_emg_handler(
-        lambda emg, moving: _emg_queue.put(np.array(emg, dtype=np.float32))
-    )
-    m.set_leds([0, 128, 255], [0, 128, 255])
-    m.vibrate(1)
+tracer = Tracer('run_inference', publish=mqtt_client.publish)
 
-    while not _stop_event.is_set():
-        try:
-            m.run()
-        except struct.error:
-            pass
+# ── Myo acquisition (background thread or process) ────────────────────────────
 
-    m.set_leds([0, 0, 0], [0, 0, 0])
-    m.disconnect()
+LEDS = [0, 128, 255]
 
+_emg_ring = None   # SampleRing, or SharedSampleRing with ACQUIRE_PROCESS; created in main()
 
-# ── Calibration ───────────────────────────────────────────────────────────────
 
-def calibrate():
+def _start_acquisition():
     '''
-    Collect CALIB_SEC seconds of relaxed EMG and return per-channel std.
-    Used to normalise raw signal so amplitude-based features are session-invariant.
+    Start the Myo reader; returns (worker, stop event). With ACQUIRE_PROCESS it
+    runs in its own process and frames arrive through shared memory, so slow
+    model calls here cannot hold up BLE handling via the GIL.
     '''
-    n = int(CALIB_SEC * 200)
-    print(f'  Relax your hand — calibrating for {CALIB_SEC}s...', flush=True)
+    if ACQUIRE_PROCESS:
+        return start_acquisition_process(EMG_SOURCE, _emg_ring, leds=LEDS)
+    stop   = threading.Event()
+    thread = threading.Thread(target=run_source, daemon=True,
+                              args=(EMG_SOURCE, _emg_ring.put, stop, LEDS))
+    thread.start()
+    return thread, stop
 
-    # drain any stale samples
-    while not _emg_queue.empty():
-        _emg_queue.get_nowait()
 
-    samples = []
-    while len(samples) < n:
-        try:
-            samples.append(np.abs(_emg_queue.get(timeout=0.5)))
-        except queue.Empty:
-            print('  Warning: no EMG during calibration — check connection.')
+# ── Model ─────────────────────────────────────────────────────────────────────
 
-    calib = np.array(samples)          # (n, 8)
-    scale = calib.std(axis=0)
-    scale[scale < 1.0] = 1.0           # floor to avoid division by near-zero noise
-    print(f'  Scale (per-channel std): {scale.round(1)}')
-    return scale
-
-
-# ── Feature extraction (must match process_data.py) ───────────────────────────
-
-def extract_features(window):
+def load_model():
     '''
-    window: (WINDOW_SIZE, 8) normalised rectified float32
-    returns: (48,) feature vector
+    Flat-array forest (label + probabilities in one pass) from MODEL_PATH's
+    directory — memory-mapped bundle or exported forest if up to date
+    (the pruned one with --pruned / EMG_PRUNED=1), see flat_forest.py.
     '''
-    diff = np.diff(window, axis=0)
-    mav  = window.mean(axis=0)
-    rms  = np.sqrt((window ** 2).mean(axis=0))
-    var  = window.var(axis=0)
-    wl   = np.abs(diff).sum(axis=0)
-    ssc  = (np.diff(np.sign(diff), axis=0) != 0).sum(axis=0).astype(np.float32)
-    wamp = (np.abs(diff) > WAMP_THRESH).sum(axis=0).astype(np.float32)
-    return np.concatenate([mav, rms, var, wl, ssc, wamp])
+    return load_for_inference(os.path.dirname(MODEL_PATH), classes=CLASSES)
 
 
 # ── Main ──────────────────────────────────────────────────────────────────────
 
 def main():
+    global _reloader, _emg_ring
+    connect_mqtt()
+    _emg_ring = SharedSampleRing() if ACQUIRE_PROCESS else SampleRing()
     print('Loading model...')
-    model = joblib.load(MODEL_PATH)
-
-    myo_thread = threading.Thread(target=_myo_worker, daemon=True)
-    myo_thread.start()
-    print('Connecting to Myo (vibration confirms)...')
+    model = load_model()
+    _reloader = ModelReloader(os.path.dirname(MODEL_PATH), model, CLASSES, FEATURE_DIM,
+                              publish=mqtt_client.publish)
+    if WATCH_MODEL:
+        _reloader.start_watching()
+    gate = load_rest_gate(os.path.dirname(MODEL_PATH)) if REST_GATE else None
+
+    myo_worker, stop_acquisition = _start_acquisition()
+    print(f'Connecting to Myo (vibration confirms)... [{"process" if ACQUIRE_PROCESS else "thread"}]')
     time.sleep(1.5)
 
     print('\n── Calibration ───────────────────────────────────────')
-    scale = calibrate()
-
-    print('\nRunning — press Ctrl+C to stop.\n')
-    print(f'  {"CLASS":<12}  {"CONF":>5}   {"cyl":>5} {"lat":>5} {"palm":>5} {"rest":>5}   {"infer":>7}')
-    print('  ' + '─' * 58)
-
-    buf                = deque(maxlen=WINDOW_SIZE)
+    profile = load_profile(PROFILE_KEY)
+    if profile is None:
+        print(f'  No profile for {PROFILE_KEY} — relax your hand, calibrating for {CALIB_SEC}s...',
+              flush=True)
+    else:
+        print(f'  Profile {PROFILE_KEY} loaded — relax your hand, checking it for '
+              f'{PROFILE_CHECK_SEC}s (grips already active)', flush=True)
+    _emg_ring.clear()                  # drop stale samples
+
+    # Preallocated hot-loop storage: nothing below allocates per sample
+    # until the model call (see bench_alloc.py)
+    calib              = StreamingCalibration(profile=profile)
+    stream             = StreamingFeatures()
+    sample             = np.empty(N_CHANNELS, dtype=np.float32)
+    features           = np.empty((1, FEATURE_DIM), dtype=np.float32)
+    feature_row        = features[0]
     samples_since_pred = 0
-    recent_preds       = deque(maxlen=SMOOTH_N)
     last_display       = 0.0
     last_proba         = np.zeros(len(CLASSES))
+    rest_idx           = CLASSES.index('rest')
+    rest_proba         = np.eye(len(CLASSES))[rest_idx]   # reported when the gate answers
+    trees_used         = 0.0     # early exit: trees evaluated / forest decisions (floats: no int allocs)
+    forest_calls       = 0.0
+    running            = False     # set once the initial calibration is in
 
-    # Dwell-time state
-    committed_class    = CLASSES[0]   # currently active output class
-    candidate_class    = CLASSES[0]   # class being evaluated
-    candidate_since    = time.monotonic()
+    # Majority vote + dwell-time state
+    decision           = DecisionFilter(CLASSES, SMOOTH_N, DWELL_TIME, now=time.monotonic())
 
     last_published_class = None
 
+    # Latency per stage of the decision-triggering sample, in ms
+    stats        = StageStats(STAGES)
+    last_metrics = time.monotonic()
+
     try:
         while True:
-            try:
-                sample = _emg_queue.get(timeout=0.5)
-            except queue.Empty:
+            if not _emg_ring.get_into(sample, timeout=0.5):
                 print('\n  Warning: no EMG data — check Myo connection.')
                 continue
 
-            buf.append(np.abs(sample) / scale)   # rectify + normalise
+            t_got  = time.perf_counter()
+            calib.push(sample)
+            if not calib.ready:
+                continue
+            if not running:
+                running = True
+                stream.set_scale(calib.scale)
+                print(f'  Scale (per-channel std): {calib.scale.round(1)}')
+                if not calib.checking:     # freshly measured, not the stored profile
+                    save_profile(PROFILE_KEY, calib.scale)
+                print('\nRunning — press Ctrl+C to stop.\n')
+                notify_ready('run_inference', mqtt_client)      # decisions from here on (pipe: first time only)
+                print(f'  {"CLASS":<12}  {"CONF":>5}   {"cyl":>5} {"lat":>5} {"palm":>5} {"rest":>5}   {"infer":>7}')
+                print('  ' + '─' * 58)
+
+            rect   = stream.normalise(sample)   # rectify + normalise in place
+            t_norm = time.perf_counter()
+            stream.push(rect)
             samples_since_pred += 1
 
-            if len(buf) < WINDOW_SIZE or samples_since_pred < STRIDE:
+            if not stream.ready or samples_since_pred < STRIDE:
                 continue
 
             samples_since_pred = 0
-            features = extract_features(np.array(buf)).reshape(1, -1)
-
-            t0    = time.monotonic()
-            pred  = int(model.predict(features)[0])
-            proba = model.predict_proba(features)[0]
-            infer_ms = (time.monotonic() - t0) * 1000
-
-            recent_preds.append(pred)
-            smoothed       = int(np.bincount(recent_preds, minlength=len(CLASSES)).argmax())
-            smoothed_label = CLASSES[smoothed]
-            last_proba     = proba
-
-            now = time.monotonic()
-            if smoothed_label != candidate_class:
-                candidate_class = smoothed_label
-                candidate_since = now
-            elif now - candidate_since >= DWELL_TIME:
-                committed_class = candidate_class
+            staged = _reloader.take()          # pre-warmed replacement, swapped between strides
+            if staged is not None:
+                model = staged
+                print(f'\n  Model swapped: {model.source} ({model.n_trees} trees, '
+                      f'swap #{_reloader.swaps})')
+            stream.features(out=feature_row)
+            t_feat = time.perf_counter()
+
+            if gate is not None and gate.is_rest(feature_row):
+                pred, proba = rest_idx, rest_proba
+                t_model     = time.perf_counter()
+                infer_ms    = (t_model - t_feat) * 1000
+            else:
+                if EARLY_EXIT is None:
+                    pred, proba = model.predict_one(features)
+                else:
+                    pred, proba, n_trees = model.predict_one_early(features, EARLY_EXIT)
+                    trees_used   += n_trees
+                    forest_calls += 1.0
+                pred        = int(pred)
+                t_model     = time.perf_counter()
+                infer_ms    = (t_model - t_feat) * 1000
+                _reloader.live_prediction(infer_ms)
+
+            now             = time.monotonic()
+            committed_class = decision.update(pred, now)
+            last_proba      = proba
+
+            # Rest-only profile check / drift tracking: an event is rare
+            # (once after startup, then ≤ 1 per DRIFT_INTERVAL)
+            event = calib.decide(pred == rest_idx and committed_class == 'rest', now)
+            if event is not None:
+                mqtt_client.publish(TOPIC_CALIB, json.dumps(event))
+                if event['event'] == 'drift':
+                    stream.set_scale(calib.scale)
+                elif event['event'] == 'recalibrate':
+                    # Stored profile is off: fresh calibration from the next sample
+                    running = False
+                    stream.reset()
+                    samples_since_pred = 0
+                    print(f'\n  Profile drifted (max {max(map(abs, event["change"])):.0%}) — '
+                          f'relax your hand, calibrating for {CALIB_SEC}s...', flush=True)
+                    continue
+
+            t_smooth = time.perf_counter()
 
             if committed_class != last_published_class:
-                mqtt_client.publish(TOPIC_MYO_STATE, committed_class)
+                trace = new_trace(wall(decision.candidate_since, time.monotonic)) \
+                    if TRACE_ENABLED and last_published_class is not None else None
+                mqtt_client.publish(TOPIC_MYO_STATE, state_payload(committed_class, trace))
                 last_published_class = committed_class
+                t_pub = time.perf_counter()
+                stats.record('publish', (t_pub - t_smooth) * 1000)
+                if trace is not None:
+                    tracer.record(trace, 'vote+dwell', trace['t0'], wall(_emg_ring.last_stamp))
+                    tracer.record_chain(trace, STAGES[:-1],
+                                        (_emg_ring.last_stamp, t_got, t_norm, t_feat, t_model, t_smooth, t_pub))
+                    tracer.flush()
+
+            stats.record('queue',     (t_got - _emg_ring.last_stamp) * 1000)
+            stats.record('normalise', (t_norm - t_got) * 1000)
+            stats.record('features',  (t_feat - t_norm) * 1000)
+            stats.record('model',     infer_ms)
+            stats.record('smoothing', (t_smooth - t_model) * 1000)
+            stats.record('total',     (time.perf_counter() - _emg_ring.last_stamp) * 1000)
+
+            if now - last_metrics >= METRICS_INTERVAL:
+                last_metrics = now
+                mqtt_client.publish(TOPIC_METRICS, json.dumps({
+                    'stride':  STRIDE,
+                    'dropped': _emg_ring.dropped,
+                    'mode':    'process' if ACQUIRE_PROCESS else 'thread',
+                    'stages':  stats.summary(),
+                    'rest_gate': gate.stats() if gate is not None else None,
+                    'trees_per_decision': round(trees_used / forest_calls, 1) if forest_calls else None,
+                }))
 
             if now - last_display >= DISPLAY_INTERVAL:
                 last_display = now
                 p = last_proba
-                pending = f'→{candidate_class}' if candidate_class != committed_class else ''
+                pending = f'→{decision.candidate}' if decision.pending else ''
                 print(
-                    f'\r  {committed_class:<12}  {p[smoothed]:>4.0%}'
+                    f'\r  {committed_class:<12}  {p[decision.smoothed]:>4.0%}'
                     f'   {p[0]:>5.2f} {p[1]:>5.2f} {p[2]:>5.2f} {p[3]:>5.2f}'
                     f'   {infer_ms:>5.1f}ms  {pending:<16}',
                     end='', flush=True
@@ -209,11 +348,16 @@ def main():
     except KeyboardInterrupt:
         pass
     finally:
-        _stop_event.set()
+        if calib.ready and not calib.checking:
+            save_profile(PROFILE_KEY, calib.scale)    # keep drift-tracked scale for next start
+        stop_acquisition.set()
+        _reloader.stop()
         mqtt_client.loop_stop()
         mqtt_client.disconnect()
         print('\nDisconnecting...')
-        myo_thread.join(timeout=3)
+        myo_worker.join(timeout=3)
+        if ACQUIRE_PROCESS:
+            _emg_ring.unlink()
         print('Done.')
 
 
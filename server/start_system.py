@@ -1,56 +1,266 @@
+'''
+Finger Plus Plus Supervisor
+
+Starts the server nodes, watches them and brings them back:
+
+  - parallel, dependency-ordered start: every node whose dependencies are
+    ready is launched at once (NODES below); run_inference waits for the
+    myo controller and the dashboard so its first grip is not lost
+  - readiness, not launch: a node counts as up when it reports ready
+    (readiness.py) — on the pipe passed in $NODE_READY_FD, or on
+    system/nodes/ready over MQTT. A node silent for READY_TIMEOUT is
+    reported and its dependents start anyway
+  - restart with backoff: a node that exits is restarted after
+    BACKOFF_BASE · 2^n s (n consecutive failures, capped at BACKOFF_MAX;
+    n resets once a node stayed up STABLE_AFTER s). Every exit and
+    restart goes to system/logs, so a dead node shows on the dashboard
+  - time to fully ready: launch → every node ready, per node and for the
+    system, printed and published (retained) on system/metrics/startup
+  - shutdown: Ctrl+C (or SIGTERM / SIGHUP to the supervisor) sends SIGINT
+    to all nodes together and gives them SHUTDOWN_TIMEOUT s in total before
+    terminating what is left
+
+Run: python start_system.py [--single-process] [--motor-driver]
+     --single-process  control_runtime.py instead of the four control nodes
+     --motor-driver    also run motor_driver_json.py (U2D2 on this host)
+'''
+
+import json
+import os
+import queue
+import selectors
+import signal
 import subprocess
-import time
 import sys
+import time
 
-def main():
-    processes = []
-    print("Starting Finger Plus Plus...")
+import paho.mqtt.client as mqtt
+from dotenv import load_dotenv
 
-    try:
-        # Start Motor Driver
-        # print("Starting Motor Driver...")
-        # p_motor = subprocess.Popen([sys.executable, "motor_driver_json.py"])
-        # processes.append(p_motor)
-        # time.sleep(2)
-
-        # Start FSR Controller (comm_bridge)
-        print("Starting ESP32 Sensor Bridge...")
-        p_fsr = subprocess.Popen([sys.executable, "comm_bridge.py"])
-        processes.append(p_fsr)
-
-        # Start Backend
-        print("Starting Server...")
-        p_ui = subprocess.Popen([sys.executable, "finger_data.py"]) 
-        processes.append(p_ui)
-
-        # Start Classification Model
-        print("Starting Classification Model...")
-        p_inference = subprocess.Popen([sys.executable, "run_inference.py"])
-        processes.append(p_inference)
-
-        # Start Myo Controller
-        print("Starting Myo Controller...")
-        p_myo = subprocess.Popen([sys.executable, "myo_controller.py"])
-        processes.append(p_myo)
-
-        print("\nSYSTEM RUNNING")
-        print("Ctrl+C to stop everything.\n")
-        
-        while True:
-            time.sleep(1)
+from readiness import READY_FD_ENV, TOPIC_READY
+
+load_dotenv()
+
+MQTT_BROKER   = os.getenv("MQTT_BROKER", "localhost")
+MQTT_PORT     = int(os.getenv("MQTT_PORT", 1883))
+TOPIC_LOGS    = "system/logs"
+TOPIC_STARTUP = "system/metrics/startup"
+
+READY_TIMEOUT    = 30.0    # seconds a node may take to report ready (Myo pairing, calibration)
+BACKOFF_BASE     = 0.5     # seconds before the first restart, doubled per consecutive failure
+BACKOFF_MAX      = 30.0
+STABLE_AFTER     = 30.0    # seconds up after which a crash counts as a first failure again
+SHUTDOWN_TIMEOUT = 3.0     # seconds for all nodes together
+POLL             = 0.05
+
+# name -> (script and arguments, nodes that must be ready first)
+NODES = {
+    "motor_driver":   (["motor_driver_json.py"], []),
+    "comm_bridge":    (["comm_bridge.py"], ["motor_driver"]),
+    "finger_data":    (["finger_data.py"], []),
+    "myo_controller": (["myo_controller.py"], ["motor_driver"]),
+    "run_inference":  (["run_inference.py"], ["myo_controller", "finger_data"]),
+}
+SINGLE_PROCESS_NODES = {
+    "motor_driver":    (["motor_driver_json.py"], []),
+    "control_runtime": (["control_runtime.py"], ["motor_driver"]),
+}
+
+
+# ── Nodes ─────────────────────────────────────────────────────────────────────
+
+class Node:
+
+    def __init__(self, name, argv, depends):
+        self.name         = name
+        self.argv         = argv
+        self.depends      = depends
+        self.proc         = None
+        self.pipe         = None       # read end of the readiness pipe
+        self.first_launch = None
+        self.launched     = None       # monotonic time of the current launch
+        self.ready_at     = None       # ... and of its readiness report
+        self.ready_in     = None       # seconds from system launch to first ready
+        self.timed_out    = False      # current launch missed READY_TIMEOUT
+        self.failures     = 0          # consecutive, for the backoff
+        self.restarts     = 0
+        self.restart_at   = None
+
+    def satisfied(self, now):
+        # dependents may start: ready once, or READY_TIMEOUT since first launch (crash loops included)
+        return self.ready_in is not None or (self.first_launch is not None and
+                                             now - self.first_launch > READY_TIMEOUT)
+
+
+def selected_nodes(argv):
+    table = SINGLE_PROCESS_NODES if "--single-process" in argv else NODES
+    if "--motor-driver" not in argv:
+        table = {name: spec for name, spec in table.items() if name != "motor_driver"}
+    return {name: Node(name, script, [d for d in depends if d in table])
+            for name, (script, depends) in table.items()}
+
+
+# ── Supervisor ────────────────────────────────────────────────────────────────
+
+class Supervisor:
 
-    except KeyboardInterrupt:
-        print("\n\nCtrl+C detected. Shutting down...")
+    def __init__(self, nodes, client=None):
+        self.nodes    = nodes
+        self.client   = client
+        self.selector = selectors.DefaultSelector()
+        self.mqtt_ready = queue.Queue()     # node names from system/nodes/ready (paho thread)
+        self.t0       = time.monotonic()
+        self.ready_in = None                # seconds from launch to every node ready
 
-        for p in processes:
+    def log(self, text):
+        print(f"[Supervisor] {text}")
+        if self.client is not None:
+            self.client.publish(TOPIC_LOGS, f"[Supervisor] {text}")
+
+    def on_mqtt_message(self, client, userdata, msg):
+        self.mqtt_ready.put(msg.payload.decode())
+
+    def start(self, node):
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, **{READY_FD_ENV: str(write_fd)})
+        # own session: Ctrl+C reaches the supervisor only, which forwards it once
+        node.proc = subprocess.Popen([sys.executable] + node.argv, env=env, pass_fds=(write_fd,),
+                                     start_new_session=True)
+        os.close(write_fd)
+        node.pipe = read_fd
+        self.selector.register(read_fd, selectors.EVENT_READ, node)
+        node.launched, node.ready_at, node.timed_out, node.restart_at = time.monotonic(), None, False, None
+        if node.first_launch is None:
+            node.first_launch = node.launched
+        print(f"Starting {node.name} ({' '.join(node.argv)})...")
+
+    def _close_pipe(self, node):
+        if node.pipe is not None:
+            self.selector.unregister(node.pipe)
+            os.close(node.pipe)
+            node.pipe = None
+
+    def mark_ready(self, node, via):
+        if node.proc is None or node.ready_at is not None:
+            return
+        now = time.monotonic()
+        node.ready_at = now
+        first = node.ready_in is None
+        if first:
+            node.ready_in = now - self.t0
+        print(f"  {node.name} ready in {now - node.launched:.2f}s ({via})")
+        if not first:
+            self.log(f"{node.name} back up after restart {node.restarts}")
+
+    def poll(self):
+        for key, _ in self.selector.select(timeout=POLL):
+            node = key.data
+            if os.read(node.pipe, 256):
+                self.mark_ready(node, "pipe")
+            self._close_pipe(node)          # one report per launch; EOF if it died first
+        while not self.mqtt_ready.empty():
+            node = self.nodes.get(self.mqtt_ready.get())
+            if node is not None:
+                self.mark_ready(node, "mqtt")
+
+        now = time.monotonic()
+        for node in self.nodes.values():
+            if node.proc is not None:
+                code = node.proc.poll()
+                if code is not None:
+                    self._died(node, code, now)
+                elif node.ready_at is None and not node.timed_out and now - node.launched > READY_TIMEOUT:
+                    node.timed_out = True
+                    self.log(f"{node.name} not ready after {READY_TIMEOUT:.0f}s — starting its dependents anyway")
+            elif node.restart_at is not None:
+                if now >= node.restart_at:
+                    node.restarts += 1
+                    self.start(node)
+            elif node.launched is None and all(self.nodes[d].satisfied(now) for d in node.depends):
+                self.start(node)
+
+        if self.ready_in is None and all(n.ready_at is not None for n in self.nodes.values()):
+            self.ready_in = now - self.t0
+            self._report_startup()
+
+    def _died(self, node, code, now):
+        self._close_pipe(node)
+        if node.ready_at is not None and now - node.launched >= STABLE_AFTER:
+            node.failures = 0
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** node.failures)
+        node.failures += 1
+        node.proc, node.ready_at, node.restart_at = None, None, now + delay
+        self.log(f"{node.name} exited (code {code}) — restarting in {delay:.1f}s")
+
+    def _report_startup(self):
+        print(f"\nSYSTEM READY in {self.ready_in:.2f}s")
+        for node in sorted(self.nodes.values(), key=lambda n: n.ready_in):
+            print(f"  {node.name:<16} ready at {node.ready_in:>6.2f}s")
+        print("Ctrl+C to stop everything.\n")
+        if self.client is not None:
+            self.client.publish(TOPIC_STARTUP, json.dumps({
+                "ready_s": round(self.ready_in, 3),
+                "nodes": {n.name: round(n.ready_in, 3) for n in self.nodes.values()},
+                "restarts": {n.name: n.restarts for n in self.nodes.values()},
+            }), retain=True)
+
+    def shutdown(self):
+        running = [n for n in self.nodes.values() if n.proc is not None]
+        for node in running:
+            os.killpg(node.proc.pid, signal.SIGINT)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for node in running:
             try:
-                # Give each process up to 3 seconds to shut down
-                p.wait(timeout=3.0) 
+                node.proc.wait(timeout=max(deadline - time.monotonic(), 0))
             except subprocess.TimeoutExpired:
-                p.terminate()
-                p.wait()
-                
+                os.killpg(node.proc.pid, signal.SIGTERM)
+                try:
+                    node.proc.wait(timeout=1.0)
+                except subprocess.TimeoutExpired:
+                    os.killpg(node.proc.pid, signal.SIGKILL)
+                    node.proc.wait()
+            self._close_pipe(node)
+
+
+STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+
+
+def _stop_signal(signum, frame):
+    raise KeyboardInterrupt(signal.Signals(signum).name)
+
+
+def main():
+    # Nodes run in their own sessions, so a SIGTERM / SIGHUP (service stop,
+    # closed terminal) must reach them through shutdown() like Ctrl+C does,
+    # or they outlive the supervisor — the motor driver holding the U2D2
+    signal.signal(signal.SIGTERM, _stop_signal)
+    signal.signal(signal.SIGHUP, _stop_signal)
+    nodes = selected_nodes(sys.argv[1:])
+    print("Starting Finger Plus Plus...")
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    supervisor = Supervisor(nodes, client)
+    client.on_message = supervisor.on_mqtt_message
+    client.on_connect = lambda c, userdata, flags, reason_code, properties: c.subscribe(TOPIC_READY)
+    try:
+        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        client.loop_start()
+    except Exception as e:
+        print(f"Warning: MQTT not connected in start_system.py (pipe readiness only): {e}")
+        supervisor.client = None
+
+    try:
+        while True:
+            supervisor.poll()
+    except KeyboardInterrupt as e:
+        for sig in STOP_SIGNALS:
+            signal.signal(sig, signal.SIG_IGN)      # a second signal must not cut shutdown short
+        print(f"\n\n{e.args[0] if e.args else 'Ctrl+C'} detected. Shutting down...")
+        supervisor.shutdown()
+        if supervisor.client is not None:
+            client.loop_stop()
+            client.disconnect()
         print("System shutdown complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -8,27 +8,46 @@ Usage:
   python test_model.py                        # defaults to results_all_phases/
   python test_model.py results_steady         # test the steady-only model
   python test_model.py results_all_phases     # test the all-phases model
+  python test_model.py results_all_phases --early-exit   # + early-exit voting check
+
+--early-exit replays the test set through FlatForest.predict_one_early
+(flat_forest.py) at each EARLY_DELTAS confidence level and reports
+agreement with the full forest's labels, mean trees evaluated per window
+and per-window latency against the full predict_one. Only the delta > 0
+modes pay off: exact mode cannot stop before a majority of the trees has
+voted, and its extra walk costs about what the skipped trees save.
+
+Predictions come from the flat export (model_flat.npz, identical labels and
+probabilities, checked when flat_forest.py writes it) when it is up to
+date, so the pickled forest is only unpickled when there is no export;
+sklearn.metrics and matplotlib are imported where they are used.
 '''
 
 import os
 import sys
 import json
+import time
 import warnings
 import numpy as np
-import matplotlib.pyplot as plt
 
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
-import joblib
-from sklearn.metrics import (balanced_accuracy_score, classification_report,
-                             confusion_matrix, ConfusionMatrixDisplay)
+from flat_forest import FlatForest, flat_path
 
 GROUPS = ['cylindrical', 'lateral', 'palm', 'rest']
+EARLY_DELTAS = (0.0, 0.001, 0.01, 0.05)   # 0 = exact: stop only when the label is decided
 
 # ── Load ──────────────────────────────────────────────────────────────────────
 
 def load(results_dir):
-    model  = joblib.load(os.path.join(results_dir, 'model.joblib'))
+    model_path = os.path.join(results_dir, 'model.joblib')
+    # The export alone (no model.joblib deployed) is used as is
+    if os.path.exists(flat_path(results_dir)) and (not os.path.exists(model_path) or
+            os.path.getmtime(flat_path(results_dir)) >= os.path.getmtime(model_path)):
+        model = FlatForest.load(flat_path(results_dir))
+    else:
+        import joblib
+        model = FlatForest.from_sklearn(joblib.load(model_path))
     X_test = np.load(os.path.join(results_dir, 'X_test.npy'))
     y_test = np.load(os.path.join(results_dir, 'y_test.npy'))
 
@@ -42,14 +61,37 @@ def load(results_dir):
 # ── Evaluate ──────────────────────────────────────────────────────────────────
 
 def evaluate(model, X_test, y_test):
-    y_pred  = model.predict(X_test)
-    proba   = model.predict_proba(X_test)
+    from sklearn.metrics import balanced_accuracy_score, classification_report, confusion_matrix
+    y_pred, proba = model.predict(X_test)
     bal_acc = balanced_accuracy_score(y_test, y_pred)
     report  = classification_report(y_test, y_pred, target_names=GROUPS, output_dict=True)
     cm      = confusion_matrix(y_test, y_pred, normalize='true')
     return y_pred, proba, bal_acc, report, cm
 
 
+def evaluate_early_exit(flat, X_test, y_test, y_pred, deltas=EARLY_DELTAS):
+    '''Per delta: agreement with y_pred, mean trees, balanced accuracy, ms per window.'''
+    from sklearn.metrics import balanced_accuracy_score
+    X = X_test.astype(np.float32)
+
+    t0 = time.perf_counter()
+    for x in X:
+        flat.predict_one(x)
+    rows = [{'delta': None, 'agree': 1.0, 'trees': float(flat.n_trees),
+             'bal_acc': balanced_accuracy_score(y_test, y_pred),
+             'ms': (time.perf_counter() - t0) / len(X) * 1000}]
+    for delta in deltas:
+        labels, trees = np.empty_like(y_pred), np.empty(len(X))
+        t0 = time.perf_counter()
+        for i, x in enumerate(X):
+            labels[i], _, trees[i] = flat.predict_one_early(x, delta)
+        ms = (time.perf_counter() - t0) / len(X) * 1000
+        rows.append({'delta': delta, 'agree': float(np.mean(labels == y_pred)),
+                     'trees': float(trees.mean()), 'bal_acc': balanced_accuracy_score(y_test, labels),
+                     'ms': ms})
+    return rows
+
+
 # ── Display ───────────────────────────────────────────────────────────────────
 
 def print_report(bal_acc, report, meta):
@@ -76,6 +118,8 @@ def print_report(bal_acc, report, meta):
 
 
 def plot_confusion_matrix(cm, title, path):
+    import matplotlib.pyplot as plt
+    from sklearn.metrics import ConfusionMatrixDisplay
     fig, ax = plt.subplots(figsize=(7, 6))
     ConfusionMatrixDisplay(cm, display_labels=GROUPS).plot(
         ax=ax, colorbar=True, cmap='Oranges', values_format='.2f')
@@ -88,6 +132,7 @@ def plot_confusion_matrix(cm, title, path):
 
 def plot_confidence_histogram(proba, y_test, y_pred, path):
     '''Histogram of max-class confidence, split by correct vs incorrect.'''
+    import matplotlib.pyplot as plt
     max_conf   = proba.max(axis=1)
     correct    = y_pred == y_test
 
@@ -108,14 +153,20 @@ def plot_confidence_histogram(proba, y_test, y_pred, path):
 # ── Main ──────────────────────────────────────────────────────────────────────
 
 if __name__ == '__main__':
-    results_dir = sys.argv[1] if len(sys.argv) > 1 else 'results_all_phases'
+    args        = [a for a in sys.argv[1:] if not a.startswith('--')]
+    results_dir = args[0] if args else 'results_all_phases'
 
     if not os.path.isdir(results_dir):
         print(f'Error: directory not found: {results_dir}')
         print('Usage: python test_model.py [results_steady | results_all_phases]')
         sys.exit(1)
 
-    for required in ('model.joblib', 'X_test.npy', 'y_test.npy', 'results.json'):
+    if not os.path.exists(os.path.join(results_dir, 'model.joblib')) and \
+            not os.path.exists(flat_path(results_dir)):
+        print(f'Error: neither model.joblib nor {os.path.basename(flat_path(results_dir))} found in {results_dir}')
+        print('Re-run the training script to regenerate the model.')
+        sys.exit(1)
+    for required in ('X_test.npy', 'y_test.npy', 'results.json'):
         if not os.path.exists(os.path.join(results_dir, required)):
             print(f'Error: {required} not found in {results_dir}')
             print('Re-run the training script to regenerate the test set.')
@@ -147,4 +198,14 @@ if __name__ == '__main__':
         os.path.join(results_dir, 'confidence_histogram_test.png')
     )
 
+    if '--early-exit' in sys.argv:
+        print('\n── Early-exit voting ─────────────────────────────────')
+        print(f'  {"delta":>8}  {"agree":>8}  {"trees":>7}  {"bal. acc":>8}  {"ms/window":>9}  {"speed-up":>8}')
+        rows = evaluate_early_exit(model, X_test, y_test, y_pred)
+        for r in rows:
+            name = 'full' if r['delta'] is None else ('exact' if r['delta'] == 0 else r['delta'])
+            print(f'  {name:>8}  {r["agree"]:>8.2%}  {r["trees"]:>7.1f}  {r["bal_acc"]:>8.3f}  {r["ms"]:>9.3f}'
+                  f'  {rows[0]["ms"] / r["ms"]:>7.2f}x')
+        print('  exact waits for a majority of trees, so only delta > 0 pays off (run_inference --early-exit=0.01)')
+
     print('\nDone.')
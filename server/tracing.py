@@ -0,0 +1,255 @@
+'''
+End-to-end Latency Tracing
+
+Follows one event from where it enters the system to the finger moving:
+
+  Myo  run_inference (or inference_server) → sensor/myo/state → myo_controller
+       → motor/command → motor_driver_json (slot, sync write, motion)
+       → motor/telemetry
+  FSR  fsr/finger → comm_bridge → motor/command → motor_driver_json → motor/telemetry
+
+The node where the event enters starts a trace: a context
+{"id": <8 hex>, "t0": <origin, epoch s>} that rides along in every payload
+of the chain — {"state": ..., "trace": ...} on sensor/myo/state, a "trace"
+key on motor/command and on the motor/telemetry sample that shows the
+goal reached. Origins: for a grip, the decision where the new class first
+won the vote (the dwell before committing is part of the latency); for
+FSR, comm_bridge receiving the ESP32 reading (its clock is not synced).
+
+Every node records spans (node, name, start, end, epoch seconds) against
+the context and publishes them as a JSON list on system/trace/spans. Nodes
+on different hosts need synced clocks. `python tracing.py` collects spans
+and prints a per-hop breakdown — each node's spans plus the transit into
+each node (its first span's start minus the latest end before it) — and
+writes a Chrome trace-event file (chrome://tracing, ui.perfetto.dev).
+
+Tracing is off unless TRACE=1 (or --trace) is set on the origin nodes; with
+it off, payloads are exactly as before. Consumers accept both forms
+(unpack_state for sensor/myo/state; the JSON topics just gain a key).
+
+  tracer = Tracer('myo_controller')
+  state, trace = unpack_state(msg.payload.decode())
+  tracer.record(trace, 'map', t_recv, time.time()); tracer.flush(client.publish)
+
+Run: python tracing.py [--seconds N] [--out trace.json]   (collector)
+'''
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from latency_stats import LatencyHistogram
+
+TOPIC_SPANS   = 'system/trace/spans'
+TRACE_ENABLED = os.getenv('TRACE') == '1' or '--trace' in sys.argv
+KEEP_SPANS    = 20000     # spans kept in memory by an unpublished Tracer / a collector
+
+
+# ── Context ───────────────────────────────────────────────────────────────────
+
+def new_trace(origin=None):
+    '''A fresh trace context starting at `origin` (epoch s, default now).'''
+    return {'id': os.urandom(4).hex(), 't0': time.time() if origin is None else origin}
+
+
+def wall(t, clock=time.perf_counter):
+    '''Epoch seconds of a timestamp taken with `clock` (perf_counter / monotonic) in this process.'''
+    return time.time() - (clock() - t)
+
+
+def state_payload(state, trace):
+    '''sensor/myo/state payload: the bare class name, or JSON carrying the trace.'''
+    return state if trace is None else json.dumps({'state': state, 'trace': trace})
+
+
+def with_trace(payload, trace):
+    '''A JSON payload dict with the trace context added (unchanged when not tracing).'''
+    if trace is not None:
+        payload['trace'] = trace
+    return payload
+
+
+def unpack_state(payload):
+    '''(state, trace or None) from a sensor/myo/state payload of either form.'''
+    if payload.startswith('{'):
+        data = json.loads(payload)
+        return data['state'], data.get('trace')
+    return payload, None
+
+
+# ── Recording ─────────────────────────────────────────────────────────────────
+
+class Tracer:
+    '''
+    Spans recorded by one node. record() buffers; flush() publishes the
+    buffer as one message (call it once per handled event). Without
+    `publish` spans go to self.spans (in-process collection).
+    '''
+
+    def __init__(self, node, publish=None, keep=KEEP_SPANS):
+        self.node    = node
+        self.publish = publish
+        self.spans   = deque(maxlen=keep)
+        self._pending = []
+        self._lock   = threading.Lock()
+
+    def record(self, trace, name, start, end, **args):
+        if trace is None:
+            return
+        span = {'trace': trace['id'], 't0': trace['t0'], 'node': self.node, 'name': name,
+                'start': start, 'end': end}
+        span.update(args)
+        with self._lock:
+            self._pending.append(span)
+
+    def record_chain(self, trace, names, stamps, clock=time.perf_counter, **args):
+        '''Consecutive spans names[i] = stamps[i] → stamps[i + 1], stamps taken with `clock`.'''
+        if trace is None:
+            return
+        offset = time.time() - clock()
+        for name, start, end in zip(names, stamps, stamps[1:]):
+            self.record(trace, name, start + offset, end + offset, **args)
+
+    def flush(self, publish=None):
+        '''Publish buffered spans (through `publish` if given, e.g. the handler's client.publish).'''
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        publish = publish or self.publish
+        if publish is None:
+            self.spans.extend(pending)
+        else:
+            publish(TOPIC_SPANS, json.dumps(pending))
+
+
+# ── Collection ────────────────────────────────────────────────────────────────
+
+class TraceCollector:
+
+    def __init__(self, keep=KEEP_SPANS):
+        self.spans = deque(maxlen=keep)
+
+    def add(self, spans):
+        self.spans.extend(spans)
+
+    def on_message(self, client, userdata, msg):
+        self.add(json.loads(msg.payload.decode()))
+
+    def traces(self):
+        '''{trace id: spans sorted by start}.'''
+        out = defaultdict(list)
+        for span in self.spans:
+            out[span['trace']].append(span)
+        for spans in out.values():
+            spans.sort(key=lambda s: s['start'])
+        return dict(out)
+
+    def hops(self, spans):
+        '''[(hop, start offset s, ms)] of one trace: transit into each node, then every span.'''
+        t0, rows, seen = spans[0]['t0'], [], set()
+        for span in spans:
+            node = span['node']
+            if node not in seen:
+                seen.add(node)
+                before = [s['end'] for s in spans if s['node'] != node and s['end'] <= span['start']]
+                if before:
+                    rows.append((f'→ {node}', span['start'] - t0, (span['start'] - max(before)) * 1000))
+            rows.append((f'{node}: {span["name"]}', span['start'] - t0, (span['end'] - span['start']) * 1000))
+        rows.append(('total (origin → last span)', np.inf, (max(s['end'] for s in spans) - t0) * 1000))
+        return rows
+
+    def breakdown(self, select=None):
+        '''
+        [(hop, summary ms)] over all traces (or those whose first node is
+        `select`), hops in pipeline order (median start offset).
+        '''
+        hist, offsets = defaultdict(lambda: LatencyHistogram(window=len(self.spans) or 1)), defaultdict(list)
+        for spans in self.traces().values():
+            if select is not None and spans[0]['node'] != select:
+                continue
+            for hop, offset, ms in self.hops(spans):
+                hist[hop].record(ms)
+                offsets[hop].append(offset)
+        order = sorted(hist, key=lambda hop: np.median(offsets[hop]))
+        return [(hop, hist[hop].summary()) for hop in order]
+
+    def chrome_trace(self):
+        '''Chrome trace-event JSON: one process per node, one thread row per trace.'''
+        traces = self.traces()
+        if not traces:
+            return {'traceEvents': []}
+        base  = min(spans[0]['t0'] for spans in traces.values())
+        nodes = {}
+        events = []
+        for row, (trace_id, spans) in enumerate(sorted(traces.items(), key=lambda kv: kv[1][0]['t0']), 1):
+            for span in spans:
+                pid = nodes.setdefault(span['node'], len(nodes) + 1)
+                args = {k: v for k, v in span.items() if k not in ('node', 'name', 'start', 'end')}
+                event = {'name': span['name'], 'cat': span['node'], 'pid': pid, 'tid': row,
+                         'ts': (span['start'] - base) * 1e6, 'args': args}
+                if span['end'] > span['start']:
+                    event.update(ph='X', dur=(span['end'] - span['start']) * 1e6)
+                else:
+                    event.update(ph='i', s='t')
+                events.append(event)
+        for node, pid in nodes.items():
+            events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': node}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def print_breakdown(collector, select=None, title='Per-hop latency'):
+    rows = collector.breakdown(select)
+    n = sum(1 for spans in collector.traces().values() if select is None or spans[0]['node'] == select)
+    print(f'── {title} ({n} traces, ms) ──────────────────────────')
+    print(f'  {"hop":<36} {"n":>5} {"p50":>8} {"p95":>8} {"max":>8}')
+    for hop, s in rows:
+        print(f'  {hop:<36} {s["n"]:>5} {s.get("p50", 0):>8.2f} {s.get("p95", 0):>8.2f} {s.get("max", 0):>8.2f}')
+
+
+# ── Main (collector) ──────────────────────────────────────────────────────────
+
+def main():
+    import paho.mqtt.client as mqtt
+
+    seconds = next((float(b) for a, b in zip(sys.argv, sys.argv[1:]) if a == '--seconds'), None)
+    out     = next((b for a, b in zip(sys.argv, sys.argv[1:]) if a == '--out'), 'trace.json')
+    broker  = os.getenv('MQTT_BROKER', 'localhost')
+    port    = int(os.getenv('MQTT_PORT', 1883))
+
+    collector = TraceCollector()
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_message = collector.on_message
+    client.connect(broker, port, 60)
+    client.subscribe(TOPIC_SPANS)
+    client.loop_start()
+    print(f'Collecting spans on {TOPIC_SPANS} (start the nodes with TRACE=1). Ctrl+C to stop.')
+    try:
+        end = time.monotonic() + seconds if seconds else None
+        while end is None or time.monotonic() < end:
+            time.sleep(0.5)
+            print(f'\r  {len(collector.spans)} spans, {len(collector.traces())} traces', end='', flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+    print('\n')
+    for origin in sorted({spans[0]['node'] for spans in collector.traces().values()}):
+        print_breakdown(collector, origin, f'From {origin}')
+        print()
+    collector.write_chrome_trace(out)
+    print(f'Chrome trace → {out}')
+
+
+if __name__ == '__main__':
+    main()
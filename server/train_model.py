@@ -300,7 +300,7 @@ if __name__ == '__main__':
     print('── Train / test split (15% trials held out) ──────────')
     X_tr, y_tr, groups_tr, X_te, y_te = split_data(X, y, groups)
     print(f'  Train : {len(X_tr):>6} windows  ({len(np.unique(groups_tr))} trials)')
-    print(f'  Test  : {len(X_te):>6} windows  ({len(np.unique(groups[np.isin(groups, np.setdiff1d(groups, groups_tr))])]} trials)')
+    print(f'  Test  : {len(X_te):>6} windows  ({len(np.unique(groups[np.isin(groups, np.setdiff1d(groups, groups_tr))]))} trials)')
     print()
 
     print('── Grid search (trial-aware 5-fold CV on train set) ──')